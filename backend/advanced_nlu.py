@@ -1,5 +1,14 @@
 import re
 import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from intent_matcher import IntentMatcher
+from text_analysis import TextAnalysis, detect_script, lowered_text
+from translation_cache import DEFAULT_PATH as TRANSLATION_CACHE_PATH, TranslationCache
 try:
     from typing import Dict, List
 except ImportError:
@@ -7,8 +16,205 @@ except ImportError:
     Dict = dict
     List = list
 
+MARIAN_MODELS = {
+    ("en", "hi"): "Helsinki-NLP/opus-mt-en-hi",
+    ("hi", "en"): "Helsinki-NLP/opus-mt-hi-en",
+}
+
+QUANTIZED_CACHE_DIR = os.path.join(os.path.dirname(__file__), 'model_cache')
+
+
+def quantize_model(model_id, model_class, cache_dir=QUANTIZED_CACHE_DIR):
+    """Dynamic int8 copy of a transformer model, reusing a cached copy if present.
+
+    Only the nn.Linear layers are quantized (weights int8, activations
+    quantized on the fly), which is where these models spend their CPU time.
+    The cache keeps just the quantized state_dict, read back with
+    weights_only=True, so nothing in model_cache/ is unpickled as code.
+    """
+    import torch
+    from transformers import AutoConfig
+
+    def quantize(model):
+        return torch.quantization.quantize_dynamic(model.eval(), {torch.nn.Linear}, dtype=torch.qint8)
+
+    path = None
+    if cache_dir:
+        path = os.path.join(cache_dir, model_id.replace("/", "__") + ".int8.state.pt")
+        if os.path.exists(path):
+            try:
+                # Same architecture from the config, quantized, then the cached weights
+                config = AutoConfig.from_pretrained(model_id)
+                if hasattr(model_class, "from_config"):  # Auto* classes
+                    model = model_class.from_config(config)
+                else:
+                    model = model_class(config)
+                model = quantize(model)
+                model.load_state_dict(torch.load(path, weights_only=True))
+                return model
+            except Exception as e:
+                logging.warning(f"Ignoring quantized cache {path}: {e}")
+
+    model = quantize(model_class.from_pretrained(model_id))
+    if path:
+        os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        torch.save(model.state_dict(), tmp_path)
+        os.chmod(tmp_path, 0o600)
+        os.replace(tmp_path, path)
+    return model
+
+
+LITERAL_ALTERNATION = re.compile(r"^\\b\(([^()\\\[\]{}.*+?^$]+)\)\\b$")
+
+WORD_START = re.compile(r"\b\w")
+
+
+def _is_word_char(char):
+    return char.isalnum() or char == "_"
+
+
+class EntityMatcher:
+    """All entity patterns compiled into one keyword trie.
+
+    Every pattern in ``entity_patterns`` is a word-bounded alternation of
+    literal phrases, so the phrases go into a single trie and the message is
+    walked once from each word start. Per pattern the result is the same as
+    ``re.finditer``: at each position the first alternative (in pattern order)
+    that ends on a word boundary wins, and matches don't overlap. Patterns that
+    aren't plain alternations fall back to a compiled regex.
+    """
+
+    def __init__(self, entity_patterns):
+        self.entity_types = list(entity_patterns)
+        self.patterns = []  # (entity_type, compiled regex or None)
+        self.trie = {}
+        for entity_type, patterns in entity_patterns.items():
+            for pattern in patterns:
+                pattern_idx = len(self.patterns)
+                literal = LITERAL_ALTERNATION.match(pattern)
+                if literal is None:
+                    self.patterns.append((entity_type, re.compile(pattern, re.IGNORECASE)))
+                    continue
+                self.patterns.append((entity_type, None))
+                for alt_idx, phrase in enumerate(literal.group(1).split("|")):
+                    node = self.trie
+                    for char in phrase.lower():
+                        node = node.setdefault(char, {})
+                    node.setdefault(None, []).append((pattern_idx, alt_idx))
+
+    def _trie_hits(self, text):
+        """(pattern_idx, alt_idx, start, end) for every word-bounded phrase hit"""
+        hits = []
+        length = len(text)
+        trie = self.trie
+        for word in WORD_START.finditer(text):
+            start = word.start()
+            node = trie.get(text[start])
+            end = start + 1
+            while node is not None:
+                if None in node and (end == length or not _is_word_char(text[end])):
+                    for pattern_idx, alt_idx in node[None]:
+                        hits.append((pattern_idx, alt_idx, start, end))
+                if end == length:
+                    break
+                node = node.get(text[end])
+                end += 1
+        return hits
+
+    def extract(self, text, confidence=0.9):
+        """Entities of ``text`` (already lowercased), grouped by type"""
+        # Best alternative per (pattern, start): lowest alt_idx wins
+        best = {}
+        for pattern_idx, alt_idx, start, end in self._trie_hits(text):
+            key = (pattern_idx, start)
+            if key not in best or alt_idx < best[key][0]:
+                best[key] = (alt_idx, end)
+        spans = [[] for _ in self.patterns]
+        for (pattern_idx, start), (alt_idx, end) in sorted(best.items()):
+            found = spans[pattern_idx]
+            # Like finditer, a pattern resumes scanning after its last match
+            if not found or start >= found[-1][1]:
+                found.append((start, end))
+
+        entities = {entity_type: [] for entity_type in self.entity_types}
+        seen = {entity_type: set() for entity_type in self.entity_types}
+        for pattern_idx, (entity_type, regex) in enumerate(self.patterns):
+            if regex is not None:
+                found = [match.span() for match in regex.finditer(text)]
+            else:
+                found = spans[pattern_idx]
+            for start, end in found:
+                value = text[start:end]
+                if value in seen[entity_type]:
+                    continue
+                seen[entity_type].add(value)
+                entities[entity_type].append({
+                    "value": value,
+                    "start": start,
+                    "end": end,
+                    "confidence": confidence
+                })
+        return entities
+
+
+class TranslationBatcher:
+    """Collects translate calls from many threads into micro-batches.
+
+    Callers block in ``submit``; a single worker thread takes the first queued
+    text, keeps collecting for up to ``max_wait_ms`` or until ``max_batch_size``
+    texts are waiting, runs ``translate_batch`` once on the whole batch and
+    hands each caller its own result.
+    """
+
+    def __init__(self, translate_batch, max_batch_size=16, max_wait_ms=10, name="translation"):
+        self.translate_batch = translate_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self.batches = 0
+        self.items = 0
+        self._thread = threading.Thread(target=self._run, name=f"batcher-{name}", daemon=True)
+        self._thread.start()
+
+    def submit(self, text, timeout=30):
+        """Translate one text as part of the next batch"""
+        future = Future()
+        self._queue.put((text, future))
+        return future.result(timeout=timeout)
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            texts = [text for text, _ in batch]
+            try:
+                results = self.translate_batch(texts)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            self.batches += 1
+            self.items += len(batch)
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
+
 class SimpleNLU:
-    def __init__(self):
+    def __init__(self, intent_model_path=None, intent_model_threshold=0.5,
+                 load_models=True, background=True,
+                 translation_batch_size=16, translation_batch_wait_ms=10,
+                 translation_cache_path=TRANSLATION_CACHE_PATH,
+                 quantize=False, quantized_cache_dir=QUANTIZED_CACHE_DIR):
         print("Advanced NLU initialized with Indic-BERT and entity extraction")
 
         # Basic intent keywords for classification
@@ -54,116 +260,215 @@ class SimpleNLU:
             ]
         }
 
-        # Initialize Indic-BERT for Hindi processing (optional - skip if not available)
-        self.indic_bert_available = False
-        try:
-            from transformers import AutoTokenizer, AutoModelForMaskedLM
-            self.indic_tokenizer = AutoTokenizer.from_pretrained("ai4bharat/indic-bert")
-            self.indic_model = AutoModelForMaskedLM.from_pretrained("ai4bharat/indic-bert")
-            self.indic_bert_available = True
-            print("Indic-BERT loaded successfully")
-        except Exception as e:
-            print(f"Indic-BERT not available (optional): {e}")
-            self.indic_tokenizer = None
-            self.indic_model = None
+        self.intent_matcher = IntentMatcher(self.intent_keywords)
+        self.entity_matcher = EntityMatcher(self.entity_patterns)
 
-        # Initialize MarianMT for translation (optional - skip if not available)
+        # Trained char n-gram intent model (optional - see intent_model.py)
+        self.intent_model = None
+        self.intent_model_threshold = intent_model_threshold
+        if intent_model_path:
+            try:
+                from intent_model import IntentModel
+                self.intent_model = IntentModel.load(intent_model_path)
+                print(f"Intent model loaded from {intent_model_path}")
+            except Exception as e:
+                print(f"Intent model not available (optional): {e}")
+
+        # Heavy transformer models are optional. They load on a background
+        # thread so requests are served on the keyword/regex path right away
+        # and pick the models up once they are ready.
+        self.indic_bert_available = False
+        self.indic_tokenizer = None
+        self.indic_model = None
         self.marian_available = False
+        self.en_hi_tokenizer = None
+        self.en_hi_model = None
+        self.hi_en_tokenizer = None
+        self.hi_en_model = None
+
+        # Micro-batching of concurrent translate_text calls (batch size 1 disables it)
+        self.translation_batch_size = translation_batch_size
+        self.translation_batch_wait_ms = translation_batch_wait_ms
+        self.translation_batchers = {}
+
+        # Opt-in dynamic int8 quantization of the transformer models
+        self.quantize = quantize
+        self.quantized_cache_dir = quantized_cache_dir
+
+        # Memory + SQLite cache of translations ("" keeps it in memory only)
+        self.translation_cache = TranslationCache(translation_cache_path)
+
+        self.model_status = {
+            name: {"state": "pending" if load_models else "disabled", "seconds": None, "error": None}
+            for name in ("indic_bert", "marian")
+        }
+        self.loading_done = threading.Event()
+        if not load_models:
+            self.loading_done.set()
+        elif background:
+            threading.Thread(target=self._load_models, name="nlu-model-loader", daemon=True).start()
+        else:
+            self._load_models()
+
+    def _load_models(self):
+        self._load_model("indic_bert", self._load_indic_bert)
+        self._load_model("marian", self._load_marian)
+        self.loading_done.set()
+
+    def _load_model(self, name, loader):
+        status = self.model_status[name]
+        status["state"] = "loading"
+        start = time.perf_counter()
         try:
-            from transformers import MarianMTModel, MarianTokenizer
-            self.en_hi_tokenizer = MarianTokenizer.from_pretrained("Helsinki-NLP/opus-mt-en-hi")
-            self.en_hi_model = MarianMTModel.from_pretrained("Helsinki-NLP/opus-mt-en-hi")
-            self.hi_en_tokenizer = MarianTokenizer.from_pretrained("Helsinki-NLP/opus-mt-hi-en")
-            self.hi_en_model = MarianMTModel.from_pretrained("Helsinki-NLP/opus-mt-hi-en")
-            self.marian_available = True
-            print("MarianMT translation models loaded successfully")
+            loader()
+            status["state"] = "ready"
         except Exception as e:
-            print(f"MarianMT not available (optional): {e}")
-            self.en_hi_tokenizer = None
-            self.en_hi_model = None
-            self.hi_en_tokenizer = None
-            self.hi_en_model = None
+            status["state"] = "failed"
+            status["error"] = str(e)
+            print(f"{name} not available (optional): {e}")
+        status["seconds"] = round(time.perf_counter() - start, 2)
 
-    def extract_entities(self, message):
-        """Extract entities from message using regex patterns"""
-        entities = {"symptom": [], "body_part": [], "ailment": []}
-        message_lower = message.lower()
+    def _load_weights(self, model_class, model_id):
+        if self.quantize:
+            return quantize_model(model_id, model_class, self.quantized_cache_dir)
+        return model_class.from_pretrained(model_id)
 
-        for entity_type, patterns in self.entity_patterns.items():
-            for pattern in patterns:
-                matches = re.finditer(pattern, message_lower, re.IGNORECASE)
-                for match in matches:
-                    entity_value = match.group()
-                    if entity_value not in [e["value"] for e in entities[entity_type]]:
-                        entities[entity_type].append({
-                            "value": entity_value,
-                            "start": match.start(),
-                            "end": match.end(),
-                            "confidence": 0.9
-                        })
+    def _load_indic_bert(self):
+        # Initialize Indic-BERT for Hindi processing
+        from transformers import AutoTokenizer, AutoModelForMaskedLM
+        self.indic_tokenizer = AutoTokenizer.from_pretrained("ai4bharat/indic-bert")
+        self.indic_model = self._load_weights(AutoModelForMaskedLM, "ai4bharat/indic-bert")
+        # Flip the flag last so readers never see a half-loaded model
+        self.indic_bert_available = True
+        print("Indic-BERT loaded successfully")
 
-        return entities
+    def _load_marian(self):
+        # Initialize MarianMT for translation
+        from transformers import MarianMTModel, MarianTokenizer
+        self.en_hi_tokenizer = MarianTokenizer.from_pretrained(MARIAN_MODELS[("en", "hi")])
+        self.en_hi_model = self._load_weights(MarianMTModel, MARIAN_MODELS[("en", "hi")])
+        self.hi_en_tokenizer = MarianTokenizer.from_pretrained(MARIAN_MODELS[("hi", "en")])
+        self.hi_en_model = self._load_weights(MarianMTModel, MARIAN_MODELS[("hi", "en")])
+        if self.translation_batch_size > 1:
+            self.translation_batchers = {
+                pair: TranslationBatcher(
+                    lambda texts, pair=pair: self.translate_batch(texts, *pair),
+                    max_batch_size=self.translation_batch_size,
+                    max_wait_ms=self.translation_batch_wait_ms,
+                    name="-".join(pair)
+                )
+                for pair in MARIAN_MODELS
+            }
+        self.marian_available = True
+        print("MarianMT translation models loaded successfully")
+
+    def translation_stats(self):
+        return self.translation_cache.stats()
+
+    def readiness(self):
+        """Model load progress and timings for the health endpoint"""
+        return {
+            "loading_done": self.loading_done.is_set(),
+            "quantized": self.quantize,
+            "indic_bert_available": self.indic_bert_available,
+            "marian_available": self.marian_available,
+            "models": {name: dict(status) for name, status in self.model_status.items()},
+            "translation_batching": {
+                "-".join(pair): {"batches": batcher.batches, "items": batcher.items}
+                for pair, batcher in self.translation_batchers.items()
+            }
+        }
+
+    def extract_entities(self, message):
+        """Extract entities from message using the compiled entity patterns"""
+        return self.entity_matcher.extract(lowered_text(message))
 
     def detect_language(self, message):
         """Simple language detection"""
-        hindi_chars = set('अआइईउऊएऐओऔकखगघङचछजझञटठडढणतथदधनपफबभमयरलवशषसहक्षत्रज्ञ')
-        english_chars = set('abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ')
+        if isinstance(message, TextAnalysis):
+            return message.language
+        return detect_script(message)
 
-        hindi_count = sum(1 for char in message if char in hindi_chars)
-        english_count = sum(1 for char in message if char in english_chars)
+    def analyze(self, message):
+        """Normalize, tokenize, detect script and extract entities in one go"""
+        analysis = TextAnalysis(message)
+        analysis.entities = self.extract_entities(analysis)
+        return analysis
 
-        if hindi_count > english_count:
-            return "hi"
-        else:
-            return "en"
+    def analyze_and_parse(self, message):
+        """(analysis, parse result) of a message, for callers that need both"""
+        analysis = self.analyze(message)
+        return analysis, self.parse(analysis)
+
+    def _translation_pair(self, source_lang, target_lang):
+        if source_lang == "en" and target_lang == "hi":
+            return self.en_hi_tokenizer, self.en_hi_model
+        if source_lang == "hi" and target_lang == "en":
+            return self.hi_en_tokenizer, self.hi_en_model
+        return None, None
+
+    def translate_batch(self, texts, source_lang, target_lang):
+        """Translate several texts with one padded MarianMT generate call"""
+        tokenizer, model = self._translation_pair(source_lang, target_lang)
+        if not self.marian_available or model is None:
+            return list(texts)
+        inputs = tokenizer(list(texts), return_tensors="pt", padding=True, truncation=True)
+        translated = model.generate(**inputs)
+        return tokenizer.batch_decode(translated, skip_special_tokens=True)
+
+    def translation_model_id(self, source_lang, target_lang):
+        model_id = MARIAN_MODELS.get((source_lang, target_lang))
+        # int8 output differs slightly from fp32, so cache it separately
+        if model_id and self.quantize:
+            model_id += "#int8"
+        return model_id
 
     def translate_text(self, text, source_lang, target_lang):
-        """Translate text using MarianMT"""
+        """Translate text using MarianMT, through the translation cache"""
+        model_id = self.translation_model_id(source_lang, target_lang)
+        if model_id is None:
+            return text
+
+        # Cached translations are served even while the models are loading
+        cached = self.translation_cache.get(text, source_lang, target_lang, model_id)
+        if cached is not None:
+            return cached
         if not self.marian_available:
             return text
 
         try:
-            if source_lang == "en" and target_lang == "hi":
-                tokenizer = self.en_hi_tokenizer
-                model = self.en_hi_model
-            elif source_lang == "hi" and target_lang == "en":
-                tokenizer = self.hi_en_tokenizer
-                model = self.hi_en_model
+            batcher = self.translation_batchers.get((source_lang, target_lang))
+            if batcher is not None:
+                translated = batcher.submit(text)
             else:
-                return text
-
-            inputs = tokenizer(text, return_tensors="pt", padding=True, truncation=True)
-            translated = model.generate(**inputs)
-            translated_text = tokenizer.decode(translated[0], skip_special_tokens=True)
-            return translated_text
+                translated = self.translate_batch([text], source_lang, target_lang)[0]
         except Exception as e:
             logging.error(f"Translation error: {e}")
             return text
+        # Best effort: a failing disk level only logs
+        self.translation_cache.put(text, source_lang, target_lang, model_id, translated)
+        return translated
 
     def parse(self, message):
-        # Detect language
-        detected_lang = self.detect_language(message)
-
-        # Extract entities
-        entities = self.extract_entities(message)
-
-        # Intent classification using keyword matching
-        message_lower = message.lower()
-        for intent, keywords in self.intent_keywords.items():
-            for keyword in keywords:
-                if keyword in message_lower:
-                    return {
-                        "intent": intent,
-                        "entities": entities,
-                        "confidence": 0.8,
-                        "method": "keyword",
-                        "language": detected_lang
-                    }
+        # Accept a precomputed TextAnalysis so callers can share it
+        analysis = message if isinstance(message, TextAnalysis) else self.analyze(message)
+        detected_lang = analysis.language
+        entities = analysis.entities
 
+        # Intent classification: every keyword hit scored in one pass
+        ranking = self.intent_matcher.rank(analysis.lowered)
+        method = "keyword"
+        # The trained model, when loaded, may replace an intent it was trained on
+        if self.intent_model is not None:
+            model_ranking = self.intent_model.override(ranking, analysis.lowered, self.intent_model_threshold)
+            if model_ranking is not None:
+                ranking, method = model_ranking, "model"
+        intent, confidence = ranking[0]
         return {
-            "intent": "fallback",
+            "intent": intent,
             "entities": entities,
-            "confidence": 0.5,
-            "method": "fallback",
+            "confidence": confidence,
+            "intents": [{"intent": name, "confidence": score} for name, score in ranking],
+            "method": "fallback" if intent == "fallback" else method,
             "language": detected_lang
-        }
\ No newline at end of file
+        }
@@ -1,19 +1,35 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, g
 from flask_cors import CORS
 import json
 import datetime
+import functools
 import jwt
 import hashlib
 import os
+import signal
 import sqlite3
+import sys
+import atexit
+import threading
+import time
 
 from advanced_nlu import SimpleNLU
+from nlu_worker import RemoteNLU
+from message_writer import MessageWriter
+from top_queries import QueryTracker
+from kb_index import LiveKB
+import startup_artifact
+from cache import TTLCache
+from text_analysis import normalize_text, lowered_text
+from migrations import migrate
 from db_setup import (
-    get_user_by_email, insert_user, get_or_create_conversation, insert_message,
-    update_message_feedback, get_feedback_stats, get_common_queries,
-    get_kb_entries, add_kb_entry, update_kb_entry, delete_kb_entry,
-    count_total_users, count_total_conversations, count_total_messages, get_positive_feedback_ratio,
-    get_query_trends, get_health_topics_stats, get_recent_feedback, get_feedback_trends
+    db_pool, get_connection, get_user_by_email, insert_user, get_or_create_conversation,
+    update_message_feedback, get_feedback_stats,
+    get_kb_entries, get_kb_entry, add_kb_entry, update_kb_entry, delete_kb_entry,
+    get_kb_version, list_kb_entries, KB_FIELDS,
+    get_metrics, count_total_users, count_total_conversations, count_total_messages, get_positive_feedback_ratio,
+    get_query_trends, get_health_topics_stats, get_recent_feedback, get_feedback_trends,
+    get_trends, TREND_GRANULARITIES
 )
 
 app = Flask(__name__)
@@ -22,34 +38,205 @@ CORS(app)
 # Secret key for JWT
 app.config['SECRET_KEY'] = 'your-secret-key-here'
 
+# KB lookup mode: "keyword" (first keyword hit) or "ranked" (BM25 top-k)
+app.config['KB_RETRIEVAL'] = os.environ.get('KB_RETRIEVAL', 'keyword')
+app.config['KB_TOP_K'] = int(os.environ.get('KB_TOP_K', 3))
+app.config['KB_MIN_SCORE'] = float(os.environ.get('KB_MIN_SCORE', 2.0))
+
+# Computed chat replies, keyed on (normalized message, language, KB version)
+app.config['RESPONSE_CACHE_SIZE'] = int(os.environ.get('RESPONSE_CACHE_SIZE', 1024))
+app.config['RESPONSE_CACHE_TTL'] = float(os.environ.get('RESPONSE_CACHE_TTL', 300))
+
+# Optional trained intent model artifact (built by intent_model.py)
+app.config['INTENT_MODEL'] = os.environ.get('INTENT_MODEL', '')
+
+# Set to 0 to skip Indic-BERT/MarianMT entirely (keyword/regex NLU only)
+app.config['NLU_LOAD_MODELS'] = os.environ.get('NLU_LOAD_MODELS', '1') != '0'
+
+# MarianMT micro-batching: max texts per generate call and max wait to fill it
+app.config['TRANSLATION_BATCH_SIZE'] = int(os.environ.get('TRANSLATION_BATCH_SIZE', 16))
+app.config['TRANSLATION_BATCH_WAIT_MS'] = float(os.environ.get('TRANSLATION_BATCH_WAIT_MS', 10))
+
+# Set to 1 to run the transformer models with dynamic int8 quantization
+app.config['NLU_QUANTIZE'] = os.environ.get('NLU_QUANTIZE', '0') == '1'
+
+# Unix socket(s) of a shared NLU worker (nlu_worker.py); empty = in-process NLU
+app.config['NLU_WORKER_SOCKET'] = os.environ.get('NLU_WORKER_SOCKET', '')
+# Seconds to wait for the worker's reply before answering in-process
+app.config['NLU_WORKER_TIMEOUT'] = float(os.environ.get('NLU_WORKER_TIMEOUT', 10))
+
+# SQLite file backing the translation cache (shared by all workers)
+app.config['TRANSLATION_CACHE_DB'] = os.environ.get(
+    'TRANSLATION_CACHE_DB', os.path.join(os.path.dirname(__file__), 'translation_cache.db'))
+
+# Chat messages are inserted in group commits: max rows per commit, extra wait
+# to fill one, and whether /chat waits for its commit (1) or returns first (0)
+app.config['MESSAGE_BATCH_SIZE'] = int(os.environ.get('MESSAGE_BATCH_SIZE', 64))
+app.config['MESSAGE_BATCH_WAIT_MS'] = float(os.environ.get('MESSAGE_BATCH_WAIT_MS', 0))
+app.config['MESSAGE_WRITE_WAIT'] = os.environ.get('MESSAGE_WRITE_WAIT', '1') != '0'
+
+# Verified tokens and user rows kept in memory for protected routes
+app.config['AUTH_CACHE_SIZE'] = int(os.environ.get('AUTH_CACHE_SIZE', 4096))
+app.config['AUTH_CACHE_TTL'] = float(os.environ.get('AUTH_CACHE_TTL', 300))
+
+# Longest date range /admin/trends will answer
+app.config['TRENDS_MAX_DAYS'] = int(os.environ.get('TRENDS_MAX_DAYS', 3660))
+
+# Top queries: reported counts are at most epsilon x queries seen too high
+app.config['TOP_QUERIES_EPSILON'] = float(os.environ.get('TOP_QUERIES_EPSILON', 0.001))
+app.config['TOP_QUERIES_USER_EPSILON'] = float(os.environ.get('TOP_QUERIES_USER_EPSILON', 0.02))
+app.config['TOP_QUERIES_CHECKPOINT_SECONDS'] = float(os.environ.get('TOP_QUERIES_CHECKPOINT_SECONDS', 30))
+
+# Default and largest page of GET /admin/kb
+app.config['KB_PAGE_SIZE'] = int(os.environ.get('KB_PAGE_SIZE', 100))
+app.config['KB_PAGE_MAX'] = int(os.environ.get('KB_PAGE_MAX', 500))
+
+# Longest a worker keeps answering from a KB that another worker has edited
+app.config['KB_SYNC_SECONDS'] = float(os.environ.get('KB_SYNC_SECONDS', 2))
+
+# Precompiled KB index artifact shared by all workers (empty = build in-process)
+app.config['STARTUP_ARTIFACT'] = os.environ.get('STARTUP_ARTIFACT', startup_artifact.ARTIFACT_PATH)
+
+# Bring chat_history.db up to the current schema (no-op when it already is)
+migrate()
+
+# The DB KB and kb.json identify the startup artifact
+try:
+    kb_rows = get_kb_entries()
+except sqlite3.OperationalError:
+    kb_rows = []
+kb_ranked = app.config['KB_RETRIEVAL'] == 'ranked'
+
 # Load knowledge base
 with open('kb.json', 'r', encoding='utf-8') as f:
     knowledge_base = json.load(f)
 
-nlu = SimpleNLU()
+# Workers map the KB indexes from the precompiled artifact if it was built
+# from this exact kb.json, DB KB and index code; otherwise the indexes are
+# built here and a fresh artifact is written for the next worker
+artifact_writer = None
+if app.config['STARTUP_ARTIFACT']:
+    artifact_writer = startup_artifact.ArtifactWriter(
+        app.config['STARTUP_ARTIFACT'], startup_artifact.source_digest('kb.json'), kb_ranked)
+
+def mapped_kb_indexes(rows):
+    """``prebuilt`` for LiveKB: indexes mapped from an artifact built from these rows, or None"""
+    if artifact_writer is None:
+        return None
+    artifact = startup_artifact.load(artifact_writer.path, artifact_writer.fingerprint(rows))
+    return artifact.indexes if artifact else None
+
+# In-memory KB index built from the health_knowledge_base table and kept in
+# sync with /admin/kb edits; kb.json fills in fields the table doesn't store
+live_kb = LiveKB(kb_rows, reference=knowledge_base, ranked=kb_ranked,
+                 prebuilt=mapped_kb_indexes(kb_rows))
+
+# Admin edits through any worker bump kb_version (migration 8). Chat requests
+# check it at most every KB_SYNC_SECONDS and reload the table in the
+# background when it moved, answering from the current snapshot meanwhile.
+kb_sync = {"version": get_kb_version(), "checked_at": time.monotonic()}
+kb_sync_lock = threading.Lock()
+
+def reload_kb():
+    try:
+        rows = get_kb_entries()
+        live_kb.reload(rows, mapped_kb_indexes(rows))
+    except Exception as e:
+        print(f"KB reload failed: {e}")
+        kb_sync["version"] = None  # retry at the next check
+    finally:
+        kb_sync_lock.release()
+
+def current_kb():
+    """live_kb.snapshot, first starting a reload if the KB table changed"""
+    if time.monotonic() - kb_sync["checked_at"] < app.config['KB_SYNC_SECONDS']:
+        return live_kb.snapshot
+    if not kb_sync_lock.acquire(blocking=False):
+        return live_kb.snapshot  # a reload is already running
+    kb_sync["checked_at"] = time.monotonic()
+    try:
+        # Read before the rows, so an edit racing the reload is seen next time
+        version = get_kb_version()
+    except sqlite3.Error as e:
+        print(f"KB version check failed: {e}")
+        version = kb_sync["version"]
+    if version != kb_sync["version"]:
+        kb_sync["version"] = version
+        threading.Thread(target=reload_kb, name="kb-reload", daemon=True).start()
+    else:
+        kb_sync_lock.release()
+    return live_kb.snapshot
+
+message_writer = MessageWriter(app.config['MESSAGE_BATCH_SIZE'], app.config['MESSAGE_BATCH_WAIT_MS'])
+# Write out queued messages on shutdown. atexit covers a normal exit, Ctrl-C
+# and gunicorn's graceful stop; a bare SIGTERM is turned into an exit first
+# unless a server has installed its own handler.
+atexit.register(message_writer.close)
+if signal.getsignal(signal.SIGTERM) is signal.SIG_DFL:
+    try:
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    except ValueError:
+        pass  # not imported from the main thread
+
+# Global and per-user top queries, counted as chats come in instead of
+# grouping over messages; pending counts are checkpointed on shutdown too
+top_queries = QueryTracker(app.config['TOP_QUERIES_EPSILON'], app.config['TOP_QUERIES_USER_EPSILON'],
+                           app.config['TOP_QUERIES_CHECKPOINT_SECONDS'])
+atexit.register(top_queries.close)
+
+response_cache = TTLCache(app.config['RESPONSE_CACHE_SIZE'], app.config['RESPONSE_CACHE_TTL'])
+# Replies for an older KB can never be hit again, so free them right away
+live_kb.subscribe(lambda snapshot: response_cache.clear())
+
+TOKEN_LIFETIME = datetime.timedelta(days=7)
+
+# token -> (identity dict, time cached), email -> users row
+token_cache = TTLCache(app.config['AUTH_CACHE_SIZE'], app.config['AUTH_CACHE_TTL'])
+user_cache = TTLCache(app.config['AUTH_CACHE_SIZE'], app.config['AUTH_CACHE_TTL'])
+# email -> time of the last change to that user in this worker. A change only
+# matters to tokens issued before it, so it is kept for one token lifetime;
+# when one is pushed out early, "floor" makes every older claim suspect instead.
+user_changed_at = TTLCache(app.config['AUTH_CACHE_SIZE'], TOKEN_LIFETIME.total_seconds())
+user_change_floor = {"at": 0.0}
+
+def create_local_nlu(load_models):
+    return SimpleNLU(intent_model_path=app.config['INTENT_MODEL'] or None,
+                     load_models=load_models,
+                     translation_batch_size=app.config['TRANSLATION_BATCH_SIZE'],
+                     translation_batch_wait_ms=app.config['TRANSLATION_BATCH_WAIT_MS'],
+                     translation_cache_path=app.config['TRANSLATION_CACHE_DB'],
+                     quantize=app.config['NLU_QUANTIZE'])
+
+if app.config['NLU_WORKER_SOCKET']:
+    # Shared NLU worker process owns the models; if it is down, answer on the
+    # lightweight in-process keyword/regex path instead
+    nlu = RemoteNLU(app.config['NLU_WORKER_SOCKET'].split(','),
+                    fallback_factory=lambda: create_local_nlu(load_models=False),
+                    timeout=app.config['NLU_WORKER_TIMEOUT'])
+else:
+    nlu = create_local_nlu(load_models=app.config['NLU_LOAD_MODELS'])
+
+if artifact_writer is not None:
+    artifact_writer.write(live_kb.snapshot, live_kb.rows())
+    # Admin edits change the DB KB; the other workers map the new file when
+    # they reload, and so does the next worker to start
+    live_kb.subscribe(lambda snapshot: artifact_writer.write_async(snapshot, live_kb.rows()))
 
 # ---------------- Helper: KB response based on message ----------------
-def get_kb_reply(item, message, language="en"):
-    msg_lower = message.lower()
+def get_reply_field(message):
+    msg_lower = lowered_text(message)
 
     symptoms_keywords = ["symptom", "sign", "लक्षण", "संकेत"]
     selfcare_keywords = ["self-care", "care", "treatment", "देखभाल", "उपचार"]
     doctor_keywords = ["doctor", "seek doctor", "visit", "डॉक्टर", "संपर्क"]
 
     if any(word in msg_lower for word in symptoms_keywords):
-        field = f"symptoms_{language}"
-        reply = ", ".join(item.get(field, []))
+        return "symptoms"
     elif any(word in msg_lower for word in selfcare_keywords):
-        field = f"self_care_{language}"
-        reply = ", ".join(item.get(field, []))
+        return "self_care"
     elif any(word in msg_lower for word in doctor_keywords):
-        field = f"when_to_seek_doctor_{language}"
-        reply = ", ".join(item.get(field, []))
-    else:
-        field = f"answer_{language}"
-        reply = item.get(field, "")
-
-    return reply
+        return "when_to_seek_doctor"
+    return "answer"
 
 # ---------------- Fallback response ----------------
 def generate_response(intent, entities, language):
@@ -71,18 +258,123 @@ def generate_response(intent, entities, language):
         return responses[intent].get(language, responses[intent]["en"])
     return responses["fallback"][language]
 
+# ---------------- Reply pipeline ----------------
+def build_reply(message, language, kb):
+    """(reply text, detected intent) for a normalized message"""
+    # Analyze once; parsing, KB lookup and field selection all share it.
+    # One call, so a remote NLU worker costs a single round trip.
+    analysis, parsed = nlu.analyze_and_parse(message)
+    intent = parsed.get("intent", "fallback")
+    entities = parsed.get("entities", {})
+
+    # --- KB lookup ---
+    found = kb.lookup_position(analysis, language, top_k=app.config['KB_TOP_K'],
+                               min_score=app.config['KB_MIN_SCORE'])
+
+    # --- Generate reply (KB replies are precomputed per field and language) ---
+    if found is not None:
+        reply = kb.reply(found, get_reply_field(analysis), language)
+    else:
+        reply = generate_response(intent, entities, language)
+
+    # Add disclaimer
+    disclaimer = (
+        "\n\n⚠️ Please note: This is not medical advice. Consult a healthcare professional for personalized guidance."
+        if language == "en"
+        else "\n\n⚠️ कृपया ध्यान दें: यह चिकित्सा सलाह नहीं है। व्यक्तिगत मार्गदर्शन के लिए स्वास्थ्य देखभाल पेशेवर से परामर्श करें।"
+    )
+    return reply + disclaimer, intent
+
 # ---------------- JWT helpers ----------------
-def generate_token(email):
-    payload = {'email': email, 'exp': datetime.datetime.utcnow() + datetime.timedelta(days=7)}
+def generate_token(email, user_id=None, role=None):
+    now = datetime.datetime.utcnow()
+    payload = {'email': email, 'iat': now, 'exp': now + TOKEN_LIFETIME}
+    if user_id is not None:
+        # Identity claims, so protected routes don't have to look the user up
+        payload['user_id'] = user_id
+        payload['role'] = role
     return jwt.encode(payload, app.config['SECRET_KEY'], algorithm='HS256')
 
-def verify_token(token):
+def get_cached_user(email):
+    user = user_cache.get(email)
+    if user is None:
+        user = get_user_by_email(email)
+        if user:
+            user_cache.set(email, user)
+    return user
+
+def invalidate_user(email):
+    """Drop cached identity for a user whose row was created or changed"""
+    now = time.time()
+    evictions = user_changed_at.evictions
+    user_changed_at.set(email, now)
+    if user_changed_at.evictions != evictions or user_changed_at.maxsize <= 0:
+        # Some change is no longer on record; distrust every older claim
+        user_change_floor["at"] = now
+    user_cache.pop(email)
+    # That user's cached tokens are dropped lazily by get_identity
+
+def last_user_change(email):
+    """Time of the last change to the user this worker knows of, or 0"""
+    return max(user_changed_at.get(email, 0), user_change_floor["at"])
+
+def get_identity(token):
+    """{'email', 'user_id', 'role', 'exp'} for a valid token, else None"""
+    cached = token_cache.get(token)
+    if cached is not None:
+        identity, cached_at = cached
+        # Cached entries can outlive the token's own expiry
+        if identity['exp'] <= time.time():
+            token_cache.pop(token)
+            return None
+        if cached_at > last_user_change(identity['email']):
+            return identity
+        token_cache.pop(token)
+
     try:
         payload = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
-        return payload['email']
-    except:
+        email = payload['email']
+    except Exception:
         return None
 
+    # Claims issued before a change to the user are stale; so are tokens from
+    # before user_id/role were added to them. Those resolve through the users row.
+    # A change landing after this point makes the cached identity stale too.
+    checked_at = time.time()
+    if 'user_id' in payload and payload.get('iat', 0) > last_user_change(email):
+        user_id, role = payload['user_id'], payload.get('role')
+    else:
+        user = get_cached_user(email)
+        user_id, role = (user[0], user[6]) if user else (None, None)
+
+    identity = {'email': email, 'user_id': user_id, 'role': role, 'exp': payload['exp']}
+    token_cache.set(token, (identity, checked_at))
+    return identity
+
+def verify_token(token):
+    identity = get_identity(token)
+    return identity['email'] if identity else None
+
+def require_auth(admin=False):
+    """Route decorator: checks the Bearer token and puts the caller's identity in g.user"""
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            auth = request.headers.get("Authorization")
+            if not auth or not auth.startswith("Bearer "):
+                return jsonify({"error": "Token required"}), 401
+            identity = get_identity(auth.split(" ")[1])
+            if not identity:
+                return jsonify({"error": "Invalid/Expired token"}), 401
+            if identity['user_id'] is None:
+                return jsonify({"error": "Invalid user"}), 403
+            if admin and identity['role'] != 'admin':
+                return jsonify({"error": "Admin access required"}), 403
+            g.user = identity
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
 # ---------------- Password hashing ----------------
 def hash_password(password):
     return hashlib.sha256(password.encode()).hexdigest()
@@ -91,6 +383,11 @@ def correct_password(stored_password, input_password):
     hashed_input = hashlib.sha256(input_password.encode()).hexdigest()
     return stored_password == input_password or stored_password == hashed_input
 
+# ---------------- HEALTH ROUTE ----------------
+@app.route('/health', methods=['GET'])
+def health():
+    return jsonify({"status": "ok", "nlu": nlu.readiness()}), 200
+
 # ---------------- AUTH ROUTES ----------------
 @app.route('/auth/login', methods=['POST'])
 def login():
@@ -101,11 +398,16 @@ def login():
 
     user = get_user_by_email(email)
     if user and correct_password(user[3], password):
-        return jsonify({"token": generate_token(email)})
+        return jsonify({"token": generate_token(email, user[0], user[6])})
 
-    # Auto-create user as admin (all users get full access)
-    insert_user(email.split("@")[0], email, hash_password(password), role='admin')
-    return jsonify({"token": generate_token(email)})
+    if not user:
+        # Auto-create user as admin (all users get full access)
+        insert_user(email.split("@")[0], email, hash_password(password), role='admin')
+        invalidate_user(email)
+        user = get_user_by_email(email)
+    if not user:
+        return jsonify({"token": generate_token(email)})
+    return jsonify({"token": generate_token(email, user[0], user[6])})
 
 @app.route('/auth/validate', methods=['GET'])
 def validate():
@@ -119,16 +421,8 @@ def validate():
 
 # ---------------- CHAT ROUTE ----------------
 @app.route('/chat', methods=['POST'])
+@require_auth()
 def chat():
-    # Validate token
-    auth = request.headers.get("Authorization")
-    if not auth or not auth.startswith("Bearer "):
-        return jsonify({"error": "Token required"}), 401
-    token = auth.split(" ")[1]
-    email = verify_token(token)
-    if not email:
-        return jsonify({"error": "Invalid/Expired token"}), 401
-
     data = request.get_json()
     message = data.get("message", "").strip()
     language = data.get("language", "en")
@@ -136,57 +430,32 @@ def chat():
     if not message:
         return jsonify({"reply": "Please enter a message"}), 400
 
-    # DB conversation logging
-    user = get_user_by_email(email)
-    convo_id = get_or_create_conversation(user[0])
-    insert_message(convo_id, "user", message)
-
-    # Parse intent/entities
-    parsed = nlu.parse(message)
-    intent = parsed.get("intent", "fallback")
-    entities = parsed.get("entities", {})
-
-    # --- KB lookup ---
-    msg_lower = message.lower()
-    found = None
-    for item in knowledge_base:
-        keywords_en = item.get("symptoms_en", []) + [item.get("condition","").lower()]
-        keywords_hi = item.get("symptoms_hi", []) + [item.get("condition_hi","").lower()]
-        if language == "hi" and any(word in msg_lower for word in keywords_hi):
-            found = item
-            break
-        elif language == "en" and any(word in msg_lower for word in keywords_en):
-            found = item
-            break
-
-    # --- Generate reply ---
-    if found:
-        reply = get_kb_reply(found, message, language)
-    else:
-        reply = generate_response(intent, entities, language)
-
-    # Add disclaimer
-    disclaimer = (
-        "\n\n⚠️ Please note: This is not medical advice. Consult a healthcare professional for personalized guidance."
-        if language == "en"
-        else "\n\n⚠️ कृपया ध्यान दें: यह चिकित्सा सलाह नहीं है। व्यक्तिगत मार्गदर्शन के लिए स्वास्थ्य देखभाल पेशेवर से परामर्श करें।"
-    )
-    reply += disclaimer
-
-    message_id = insert_message(convo_id, "assistant", reply)
+    kb = current_kb()
+    cache_key = (normalize_text(message), language, kb.version)
+    cached = response_cache.get(cache_key)
+    if cached is None:
+        cached = build_reply(cache_key[0], language, kb)
+        response_cache.set(cache_key, cached)
+    reply, intent = cached
+
+    # DB conversation logging; language and intent feed the daily_metrics rollup
+    convo_id = get_or_create_conversation(g.user['user_id'])
+    user_message_id, user_saved = message_writer.submit(convo_id, "user", message,
+                                                        language=language, intent=intent)
+    message_id, reply_saved = message_writer.submit(convo_id, "assistant", reply,
+                                                    reply_to_message_id=user_message_id,
+                                                    language=language, intent=intent)
+    if app.config['MESSAGE_WRITE_WAIT']:
+        # Both rows usually land in the same commit as other requests' rows
+        user_saved.result(timeout=10)
+        reply_saved.result(timeout=10)
+    top_queries.add(g.user['user_id'], message)
     return jsonify({"reply": reply, "message_id": message_id}), 200
 
 # ---------------- FEEDBACK ROUTES ----------------
 @app.route('/feedback', methods=['POST'])
+@require_auth()
 def submit_feedback():
-    auth = request.headers.get("Authorization")
-    if not auth or not auth.startswith("Bearer "):
-        return jsonify({"error": "Token required"}), 401
-    token = auth.split(" ")[1]
-    email = verify_token(token)
-    if not email:
-        return jsonify({"error": "Invalid/Expired token"}), 401
-
     data = request.get_json()
     message_id = data.get("message_id")
     feedback_type = data.get("feedback_type")  # 'positive' or 'negative'
@@ -195,31 +464,24 @@ def submit_feedback():
     if not message_id or not feedback_type:
         return jsonify({"error": "message_id and feedback_type required"}), 400
 
+    # The rated reply may still be waiting in this worker's write queue
+    message_writer.wait_for(message_id)
     update_message_feedback(message_id, feedback_type, feedback_comment)
     return jsonify({"message": "Feedback submitted successfully"}), 200
 
 # ---------------- ADMIN ROUTES ----------------
 @app.route('/admin/stats', methods=['GET'])
+@require_auth()
 def get_admin_stats():
-    auth = request.headers.get("Authorization")
-    if not auth or not auth.startswith("Bearer "):
-        return jsonify({"error": "Token required"}), 401
-    token = auth.split(" ")[1]
-    email = verify_token(token)
-    if not email:
-        return jsonify({"error": "Invalid/Expired token"}), 401
-
-    user = get_user_by_email(email)
-    if not user:
-        return jsonify({"error": "Invalid user"}), 403
-
     try:
-        total_users = count_total_users()
-        total_conversations = count_total_conversations()
-        total_messages = count_total_messages()
-        positive_feedback = get_positive_feedback_ratio()
-        feedback_stats = get_feedback_stats()
-        common_queries = get_common_queries()
+        # Counters come from one read of the metrics table
+        metrics = get_metrics()
+        total_users = count_total_users(metrics)
+        total_conversations = count_total_conversations(metrics)
+        total_messages = count_total_messages(metrics)
+        positive_feedback = get_positive_feedback_ratio(metrics)
+        feedback_stats = get_feedback_stats(metrics)
+        common_queries = top_queries.top(10)
 
         # Get additional analytics data
         query_trends = get_query_trends()
@@ -244,37 +506,73 @@ def get_admin_stats():
         print(f"Error fetching admin stats: {e}")
         return jsonify({"status": "error", "message": str(e)})
 
+@app.route('/admin/trends', methods=['GET'])
+@require_auth()
+def get_admin_trends():
+    # ?start=YYYY-MM-DD&end=YYYY-MM-DD&granularity=day|week|month&language=&intent=
+    # Defaults to the 30 days up to today (UTC), by day
+    try:
+        end = datetime.date.fromisoformat(request.args.get("end") or datetime.datetime.utcnow().date().isoformat())
+        start = datetime.date.fromisoformat(request.args.get("start") or (end - datetime.timedelta(days=29)).isoformat())
+    except ValueError:
+        return jsonify({"error": "start and end must be YYYY-MM-DD dates"}), 400
+    granularity = request.args.get("granularity", "day")
+    if granularity not in TREND_GRANULARITIES:
+        return jsonify({"error": f"granularity must be one of {', '.join(TREND_GRANULARITIES)}"}), 400
+    if start > end:
+        return jsonify({"error": "start must not be after end"}), 400
+    if (end - start).days >= app.config['TRENDS_MAX_DAYS']:
+        return jsonify({"error": f"range is limited to {app.config['TRENDS_MAX_DAYS']} days"}), 400
+
+    trends = get_trends(start, end, granularity,
+                        language=request.args.get("language"), intent=request.args.get("intent"))
+    return jsonify({"start": start.isoformat(), "end": end.isoformat(),
+                    "granularity": granularity, "trends": trends}), 200
+
 @app.route('/admin/kb', methods=['GET'])
+@require_auth()
 def get_kb():
-    auth = request.headers.get("Authorization")
-    if not auth or not auth.startswith("Bearer "):
-        return jsonify({"error": "Token required"}), 401
-    token = auth.split(" ")[1]
-    email = verify_token(token)
-    if not email:
-        return jsonify({"error": "Invalid/Expired token"}), 401
-
-    user = get_user_by_email(email)
-    if not user:
-        return jsonify({"error": "Invalid user"}), 403
-
-    entries = get_kb_entries()
-    return jsonify({"entries": entries}), 200
+    # ?after=<id>&limit=&fields=id,title,...&category=&q=
+    try:
+        after = int(request.args.get('after', 0))
+        limit = int(request.args.get('limit', app.config['KB_PAGE_SIZE']))
+    except ValueError:
+        return jsonify({"error": "after and limit must be integers"}), 400
+    if not 1 <= limit <= app.config['KB_PAGE_MAX']:
+        return jsonify({"error": f"limit must be between 1 and {app.config['KB_PAGE_MAX']}"}), 400
+    fields = request.args.get('fields')
+    fields = tuple(fields.split(',')) if fields else KB_FIELDS
+    unknown = [field for field in fields if field not in KB_FIELDS]
+    if unknown:
+        return jsonify({"error": f"unknown fields: {', '.join(unknown)}"}), 400
+    if 'id' not in fields:
+        fields = ('id',) + fields  # the cursor is an id
+    category = request.args.get('category') or None
+    keyword = request.args.get('q') or None
+
+    # The ETag names the KB version and the page asked for, so a tag from
+    # one page or filter never validates another. Read the version before the
+    # rows: an edit in between then costs the next poll a refetch instead of
+    # tagging new rows with an old ETag.
+    query = json.dumps([after, limit, fields, category, keyword], ensure_ascii=False)
+    etag = f"kb-{get_kb_version()}-{hashlib.sha256(query.encode('utf-8')).hexdigest()[:16]}"
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+        response.set_etag(etag)
+        return response
+
+    # One extra row tells whether there is a next page
+    entries = list_kb_entries(after, limit + 1, fields, category=category, keyword=keyword)
+    next_cursor = entries[limit - 1][fields.index('id')] if len(entries) > limit else None
+    response = jsonify({"entries": entries[:limit], "fields": fields, "next_cursor": next_cursor})
+    response.set_etag(etag)
+    # Browsers revalidate with If-None-Match on every poll
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response, 200
 
 @app.route('/admin/kb', methods=['POST'])
+@require_auth()
 def add_kb():
-    auth = request.headers.get("Authorization")
-    if not auth or not auth.startswith("Bearer "):
-        return jsonify({"error": "Token required"}), 401
-    token = auth.split(" ")[1]
-    email = verify_token(token)
-    if not email:
-        return jsonify({"error": "Invalid/Expired token"}), 401
-
-    user = get_user_by_email(email)
-    if not user:
-        return jsonify({"error": "Invalid user"}), 403
-
     data = request.get_json()
     category = data.get("category")
     title = data.get("title")
@@ -286,22 +584,12 @@ def add_kb():
         return jsonify({"error": "All fields required"}), 400
 
     entry_id = add_kb_entry(category, title, content_english, content_hindi, keywords)
+    live_kb.upsert(get_kb_entry(entry_id))
     return jsonify({"message": "KB entry added", "id": entry_id}), 201
 
 @app.route('/admin/kb/<int:entry_id>', methods=['PUT'])
+@require_auth()
 def update_kb(entry_id):
-    auth = request.headers.get("Authorization")
-    if not auth or not auth.startswith("Bearer "):
-        return jsonify({"error": "Token required"}), 401
-    token = auth.split(" ")[1]
-    email = verify_token(token)
-    if not email:
-        return jsonify({"error": "Invalid/Expired token"}), 401
-
-    user = get_user_by_email(email)
-    if not user:
-        return jsonify({"error": "Invalid user"}), 403
-
     data = request.get_json()
     category = data.get("category")
     title = data.get("title")
@@ -313,49 +601,42 @@ def update_kb(entry_id):
         return jsonify({"error": "All fields required"}), 400
 
     update_kb_entry(entry_id, category, title, content_english, content_hindi, keywords)
+    live_kb.upsert(get_kb_entry(entry_id))
     return jsonify({"message": "KB entry updated"}), 200
 
 @app.route('/admin/kb/<int:entry_id>', methods=['DELETE'])
+@require_auth(admin=True)
 def delete_kb(entry_id):
-    auth = request.headers.get("Authorization")
-    if not auth or not auth.startswith("Bearer "):
-        return jsonify({"error": "Token required"}), 401
-    token = auth.split(" ")[1]
-    email = verify_token(token)
-    if not email:
-        return jsonify({"error": "Invalid/Expired token"}), 401
-
-    user = get_user_by_email(email)
-    if not user or user[6] != 'admin':
-        return jsonify({"error": "Admin access required"}), 403
-
     delete_kb_entry(entry_id)
+    live_kb.remove(entry_id)
     return jsonify({"message": "KB entry deleted"}), 200
 
+@app.route('/admin/cache', methods=['GET'])
+@require_auth()
+def get_cache_stats():
+    return jsonify({
+        "response_cache": response_cache.stats(),
+        "translation_cache": nlu.translation_stats(),
+        "kb_version": live_kb.snapshot.version,
+        "token_cache": token_cache.stats(),
+        "user_cache": user_cache.stats(),
+        "database": db_pool.stats(),
+        "message_writer": message_writer.stats(),
+        "top_queries": top_queries.stats()
+    }), 200
+
 # ---------------- PROFILE ROUTES ----------------
 @app.route('/profile', methods=['PUT'])
 def update_profile():
     return jsonify({"message": "Profile updated"})
 
 @app.route('/user/stats', methods=['GET'])
+@require_auth()
 def get_user_stats():
-    auth = request.headers.get("Authorization")
-    if not auth or not auth.startswith("Bearer "):
-        return jsonify({"error": "Token required"}), 401
-    token = auth.split(" ")[1]
-    email = verify_token(token)
-    if not email:
-        return jsonify({"error": "Invalid/Expired token"}), 401
-
-    user = get_user_by_email(email)
-    if not user:
-        return jsonify({"error": "User not found"}), 401
-
-    user_id = user[0]
+    user_id = g.user['user_id']
 
     # Get user's personal stats
-    db_path = os.path.join(os.path.dirname(__file__), 'chat_history.db')
-    conn = sqlite3.connect(db_path)
+    conn = get_connection()
     cursor = conn.cursor()
 
     # Get user's conversations count
@@ -370,50 +651,34 @@ def get_user_stats():
     ''', (user_id,))
     messages_count = cursor.fetchone()[0]
 
-    # Get user's feedback stats
+    # Get user's feedback stats; CROSS JOIN keeps the planner on this user's
+    # conversations instead of walking every rated message
     cursor.execute('''
         SELECT feedback_type, COUNT(*) as count
-        FROM messages m
-        JOIN conversations c ON m.conversation_id = c.id
+        FROM conversations c
+        CROSS JOIN messages m ON m.conversation_id = c.id
         WHERE c.userid = ? AND m.sender = 'assistant' AND m.feedback_type IS NOT NULL
         GROUP BY feedback_type
     ''', (user_id,))
     feedback_stats = dict(cursor.fetchall())
 
-    # Get user's common queries
-    cursor.execute('''
-        SELECT text_content, COUNT(*) as count
-        FROM messages m
-        JOIN conversations c ON m.conversation_id = c.id
-        WHERE c.userid = ? AND m.sender = 'user'
-        GROUP BY text_content
-        ORDER BY count DESC
-        LIMIT 5
-    ''', (user_id,))
-    common_queries = cursor.fetchall()
-
     conn.close()
 
+    # Get user's common queries
+    common_queries = top_queries.top(5, user_id)
+
     return jsonify({
         "conversations_count": conversations_count,
         "messages_count": messages_count,
         "feedback_stats": feedback_stats,
         "common_queries": common_queries,
-        "is_admin": user[6] == 'admin' if len(user) > 6 else False
+        "is_admin": g.user['role'] == 'admin'
     }), 200
 
 @app.route('/profile', methods=['GET'])
+@require_auth()
 def get_profile():
-    auth = request.headers.get("Authorization")
-    if not auth or not auth.startswith("Bearer "):
-        return jsonify({"error": "Token missing"}), 401
-
-    token = auth.split(" ")[1]
-    email = verify_token(token)
-    if not email:
-        return jsonify({"error": "Invalid token"}), 401
-
-    user = get_user_by_email(email)
+    user = get_cached_user(g.user['email'])
     if not user:
         return jsonify({"error": "User not found"}), 404
 
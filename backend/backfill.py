@@ -0,0 +1,139 @@
+import sys
+import time
+
+from db_setup import get_connection, retry_on_busy, classify_topic
+
+# Fills in columns that are computed on insert for rows written before the
+# column existed. Work goes in short chunks, each its own write transaction,
+# so the app keeps serving (and writing) while a backfill runs. The rows still
+# to do are the checkpoint: a stopped or crashed run picks up where it left
+# off when started again, and finished rows are never touched twice.
+#
+#   python backfill.py topics [chunk_size] [pause_seconds]
+#   python backfill.py replies [chunk_size] [pause_seconds]
+
+# Migrations classify existing rows inline up to this many; larger histories
+# are left to the backfill job so startup isn't held up
+INLINE_LIMIT = 10000
+
+
+def classify_topics_chunk(conn, after_id, chunk_size):
+    """Classify the next unclassified user messages after ``after_id``; returns (last_id, count)"""
+    # Seeks idx_messages_sender_topic (sender, topic, id) straight to the NULLs
+    rows = conn.execute('''
+        SELECT id, text_content FROM messages
+        WHERE sender = 'user' AND topic IS NULL AND id > ?
+        ORDER BY id LIMIT ?
+    ''', (after_id, chunk_size)).fetchall()
+    if not rows:
+        return after_id, 0
+    conn.executemany('UPDATE messages SET topic = ? WHERE id = ? AND topic IS NULL',
+                     [(classify_topic(text), message_id) for message_id, text in rows])
+    return rows[-1][0], len(rows)
+
+
+# The user message an assistant message answers: the latest one before it in
+# the same conversation. Walks idx_messages_conversation backwards from the
+# reply's timestamp, so it costs the same in a long conversation as a short one.
+REPLY_TO = '''
+    SELECT u.id FROM messages u
+    WHERE u.conversation_id = messages.conversation_id AND u.sender = 'user'
+      AND u.timestamp <= messages.timestamp AND u.id < messages.id
+    ORDER BY u.timestamp DESC, u.id DESC LIMIT 1
+'''
+
+
+def link_replies_chunk(conn, after_id, chunk_size):
+    """Set reply_to_message_id on the next unlinked assistant messages after ``after_id``"""
+    # Assistant messages with no earlier user message stay NULL, so this walks
+    # the primary key rather than relying on the NULLs running out
+    # (unary + keeps the planner on the id range instead of a sender index)
+    rows = conn.execute('''
+        SELECT id FROM messages
+        WHERE id > ? AND +sender = 'assistant' AND reply_to_message_id IS NULL
+        ORDER BY id LIMIT ?
+    ''', (after_id, chunk_size)).fetchall()
+    if not rows:
+        return after_id, 0
+    conn.execute(f'''
+        UPDATE messages SET reply_to_message_id = ({REPLY_TO})
+        WHERE id > ? AND id <= ? AND +sender = 'assistant' AND reply_to_message_id IS NULL
+    ''', (after_id, rows[-1][0]))
+    return rows[-1][0], len(rows)
+
+
+def pending_topics(conn):
+    return conn.execute("SELECT COUNT(*) FROM messages WHERE sender = 'user' AND topic IS NULL").fetchone()[0]
+
+
+def classify_topics_inline(conn):
+    """Migration step: classify existing user messages now if there are few of them"""
+    pending = pending_topics(conn)
+    if pending > INLINE_LIMIT:
+        print(f"{pending} messages have no topic yet; run: python backfill.py topics")
+        return
+    last_id, count = 0, 1
+    while count:
+        last_id, count = classify_topics_chunk(conn, last_id, INLINE_LIMIT)
+
+
+def link_replies_inline(conn):
+    """Migration step: link existing replies now if there are few messages"""
+    total = conn.execute('SELECT COUNT(*) FROM messages').fetchone()[0]
+    if total > INLINE_LIMIT:
+        print(f"{total} messages to link to the questions they answer; run: python backfill.py replies")
+        return
+    last_id, count = 0, 1
+    while count:
+        last_id, count = link_replies_chunk(conn, last_id, INLINE_LIMIT)
+
+
+@retry_on_busy
+def _step(chunk, after_id, chunk_size):
+    conn = get_connection()
+    try:
+        last_id, count = chunk(conn, after_id, chunk_size)
+        conn.commit()
+    finally:
+        conn.close()
+    return last_id, count
+
+
+def _run(name, chunk, chunk_size, pause, progress):
+    done, last_id, started = 0, 0, time.perf_counter()
+    while True:
+        last_id, count = _step(chunk, last_id, chunk_size)
+        if not count:
+            break
+        done += count
+        if progress:
+            rate = done / (time.perf_counter() - started)
+            progress(f"{name}: {done} rows (through id {last_id}, {rate:.0f} rows/s)")
+        if pause:
+            time.sleep(pause)  # let request writes in between chunks
+    return done
+
+
+def backfill_topics(chunk_size=5000, pause=0.0, progress=print):
+    """Classify every user message that has no topic yet; returns how many were done"""
+    return _run('topics', classify_topics_chunk, chunk_size, pause, progress)
+
+
+def backfill_replies(chunk_size=5000, pause=0.0, progress=print):
+    """Link assistant messages to the user message they answer; returns how many were looked at"""
+    return _run('replies', link_replies_chunk, chunk_size, pause, progress)
+
+
+if __name__ == '__main__':
+    job = sys.argv[1] if len(sys.argv) > 1 else ''
+    if job == 'topics':
+        chunk_size = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+        pause = float(sys.argv[3]) if len(sys.argv) > 3 else 0.0
+        print(f"Backfilled {backfill_topics(chunk_size, pause)} message topics")
+    elif job == 'replies':
+        chunk_size = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+        pause = float(sys.argv[3]) if len(sys.argv) > 3 else 0.0
+        print(f"Looked up questions for {backfill_replies(chunk_size, pause)} assistant messages")
+    else:
+        print("Usage: python backfill.py topics|replies [chunk_size] [pause_seconds]")
+        sys.exit(2)
@@ -0,0 +1,89 @@
+import sys
+
+from bench_util import run_probe
+
+# /admin/stats counters: the old COUNT/GROUP BY queries over messages versus
+# one read of the trigger-maintained metrics table, plus what the triggers
+# add to message inserts, on a throwaway copy of chat_history.db grown to N
+# messages.
+# Usage: python bench_admin_stats.py [messages]   (run from backend/)
+
+PROBE = r'''
+import random, sys, time
+import db_setup, metrics
+from migrations import migrate
+
+total = int(sys.argv[1])
+migrate()
+conn = db_setup.get_connection()
+conn.execute("DELETE FROM messages")
+conn.commit()
+conn.close()
+
+def fill(count, start_id):
+    rows = [(start_id + i, 1 + i // 20, 'user' if i % 2 == 0 else 'assistant', f'query {i % 500}',
+             '2026-01-01 10:00:00', None, None, None) for i in range(count)]
+    started = time.perf_counter()
+    for chunk in range(0, count, 5000):
+        db_setup.insert_messages(rows[chunk:chunk + 5000])
+    return time.perf_counter() - started
+
+with_triggers = fill(total, 1)
+conn = db_setup.get_connection()
+conn.execute("UPDATE messages SET feedback_type = CASE WHEN id % 3 = 0 THEN 'positive' ELSE 'negative' END "
+             "WHERE sender = 'assistant' AND id % 4 = 1")
+conn.commit()
+names = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'metrics_%'")]
+for name in names:
+    conn.execute(f"DROP TRIGGER {name}")
+conn.commit()
+conn.close()
+without_triggers = fill(total, total + 1)
+conn = db_setup.get_connection()
+conn.execute("DELETE FROM messages WHERE id > ?", (total,))
+for trigger in metrics.TRIGGERS:
+    conn.execute(trigger)
+conn.commit()
+conn.close()
+metrics.reconcile()
+
+LEGACY = [
+    "SELECT COUNT(*) FROM users",
+    "SELECT COUNT(DISTINCT conversation_id) FROM messages",
+    "SELECT COUNT(*) FROM messages",
+    "SELECT COUNT(*) FROM messages WHERE feedback_type = 'positive'",
+    "SELECT COUNT(*) FROM messages WHERE feedback_type IS NOT NULL",
+    "SELECT feedback_type, COUNT(*) FROM messages WHERE sender = 'assistant' AND feedback_type IS NOT NULL GROUP BY feedback_type",
+]
+
+def legacy():
+    conn = db_setup.get_connection()
+    results = [conn.execute(sql).fetchall() for sql in LEGACY]
+    conn.close()
+    return results
+
+def counters():
+    snapshot = db_setup.get_metrics()
+    return (db_setup.count_total_users(snapshot), db_setup.count_total_conversations(snapshot),
+            db_setup.count_total_messages(snapshot), db_setup.get_positive_feedback_ratio(snapshot),
+            db_setup.get_feedback_stats(snapshot))
+
+for name, fn in [('legacy', legacy), ('counters', counters)]:
+    fn()
+    runs = 20
+    started = time.perf_counter()
+    for _ in range(runs):
+        fn()
+    print(f"RESULT {name} {(time.perf_counter() - started) / runs * 1000:.3f}")
+print(f"RESULT insert {total / with_triggers:.0f} {total / without_triggers:.0f}")
+'''
+
+
+if __name__ == "__main__":
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    results = {fields[0]: fields[1:] for fields in run_probe(PROBE, total)}
+    print(f"{total} messages")
+    print(f"admin stats counters, old queries   {float(results['legacy'][0]):>10.3f} ms")
+    print(f"admin stats counters, metrics table {float(results['counters'][0]):>10.3f} ms")
+    print(f"inserts/s with triggers             {int(results['insert'][0]):>10}")
+    print(f"inserts/s without triggers          {int(results['insert'][1]):>10}")
@@ -0,0 +1,49 @@
+import os
+import sys
+
+from bench_util import run_probe
+
+# Per-request identity cost on protected routes: the old HS256 decode plus a
+# users lookup, a decode with user_id/role claims, and a cached token, on a
+# throwaway copy of chat_history.db.
+# Usage: python bench_auth.py [iterations]   (run from backend/)
+
+PROBE = r'''
+import sys, time, warnings
+import jwt
+warnings.simplefilter('ignore')
+import app
+
+iterations = int(sys.argv[1])
+client = app.app.test_client()
+token = client.post('/auth/login', json={'email': 'bench@wellbot.test', 'password': 'pw'}).get_json()['token']
+secret = app.app.config['SECRET_KEY']
+
+def legacy():
+    email = jwt.decode(token, secret, algorithms=['HS256'])['email']
+    return app.get_user_by_email(email)[0]
+
+def claims():
+    app.token_cache.clear()
+    return app.get_identity(token)['user_id']
+
+def cached():
+    return app.get_identity(token)['user_id']
+
+for name, fn in [('legacy', legacy), ('claims', claims), ('cached', cached)]:
+    fn()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    print(f"RESULT {name} {(time.perf_counter() - start) / iterations * 1e6:.1f}")
+'''
+
+
+if __name__ == "__main__":
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    env = dict(os.environ, NLU_LOAD_MODELS='0', STARTUP_ARTIFACT='')
+
+    labels = {'legacy': 'decode + users lookup', 'claims': 'decode, identity claims', 'cached': 'cached token'}
+    print(f"{'':<26}{'us/request':>12}")
+    for name, micros in run_probe(PROBE, iterations, env=env):
+        print(f"{labels[name]:<26}{float(micros):>12.1f}")
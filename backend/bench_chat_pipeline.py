@@ -0,0 +1,108 @@
+import re
+import sys
+import time
+
+import app as wellbot
+
+# Per-request CPU of the /chat reply pipeline: the original multi-scan code
+# path versus the shared single-pass TextAnalysis path used by build_reply.
+# Usage: python bench_chat_pipeline.py [iterations]   (run from backend/)
+
+MESSAGES = [
+    ("I have a fever and a headache since yesterday", "en"),
+    ("What are the symptoms of a sore throat?", "en"),
+    ("Give me a wellness tip", "en"),
+    ("I feel stressed and I can't sleep at night", "en"),
+    ("Hello there", "en"),
+    ("मुझे बुखार और सिरदर्द है", "hi"),
+    ("मुझे तनाव है, क्या करूं?", "hi"),
+]
+
+
+def legacy_detect_language(message):
+    hindi_chars = set('अआइईउऊएऐओऔकखगघङचछजझञटठडढणतथदधनपफबभमयरलवशषसहक्षत्रज्ञ')
+    english_chars = set('abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ')
+    hindi_count = sum(1 for char in message if char in hindi_chars)
+    english_count = sum(1 for char in message if char in english_chars)
+    return "hi" if hindi_count > english_count else "en"
+
+
+def legacy_extract_entities(nlu, message):
+    entities = {"symptom": [], "body_part": [], "ailment": []}
+    message_lower = message.lower()
+    for entity_type, patterns in nlu.entity_patterns.items():
+        for pattern in patterns:
+            for match in re.finditer(pattern, message_lower, re.IGNORECASE):
+                entity_value = match.group()
+                if entity_value not in [e["value"] for e in entities[entity_type]]:
+                    entities[entity_type].append({
+                        "value": entity_value, "start": match.start(),
+                        "end": match.end(), "confidence": 0.9,
+                    })
+    return entities
+
+
+def legacy_parse(nlu, message):
+    detected_lang = legacy_detect_language(message)
+    entities = legacy_extract_entities(nlu, message)
+    message_lower = message.lower()
+    for intent, keywords in nlu.intent_keywords.items():
+        for keyword in keywords:
+            if keyword in message_lower:
+                return {"intent": intent, "entities": entities, "language": detected_lang}
+    return {"intent": "fallback", "entities": entities, "language": detected_lang}
+
+
+def legacy_kb_reply(item, message, language="en"):
+    msg_lower = message.lower()
+
+    symptoms_keywords = ["symptom", "sign", "लक्षण", "संकेत"]
+    selfcare_keywords = ["self-care", "care", "treatment", "देखभाल", "उपचार"]
+    doctor_keywords = ["doctor", "seek doctor", "visit", "डॉक्टर", "संपर्क"]
+
+    if any(word in msg_lower for word in symptoms_keywords):
+        return ", ".join(item.get(f"symptoms_{language}", []))
+    elif any(word in msg_lower for word in selfcare_keywords):
+        return ", ".join(item.get(f"self_care_{language}", []))
+    elif any(word in msg_lower for word in doctor_keywords):
+        return ", ".join(item.get(f"when_to_seek_doctor_{language}", []))
+    return item.get(f"answer_{language}", "")
+
+
+def legacy_reply(message, language, knowledge_base):
+    parsed = legacy_parse(wellbot.nlu, message)
+    msg_lower = message.lower()
+    found = None
+    for item in knowledge_base:
+        keywords_en = item.get("symptoms_en", []) + [item.get("condition", "").lower()]
+        keywords_hi = item.get("symptoms_hi", []) + [item.get("condition_hi", "").lower()]
+        if language == "hi" and any(word in msg_lower for word in keywords_hi):
+            found = item
+            break
+        elif language == "en" and any(word in msg_lower for word in keywords_en):
+            found = item
+            break
+    if found:
+        return legacy_kb_reply(found, message, language)
+    return wellbot.generate_response(parsed["intent"], parsed["entities"], language)
+
+
+def cpu_per_request(fn, iterations):
+    start = time.process_time()
+    for _ in range(iterations):
+        for message, language in MESSAGES:
+            fn(message, language)
+    return (time.process_time() - start) * 1e6 / (iterations * len(MESSAGES))
+
+
+if __name__ == "__main__":
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    kb = wellbot.live_kb.snapshot
+
+    before = cpu_per_request(lambda m, l: legacy_reply(m, l, kb.entries), iterations)
+    after = cpu_per_request(lambda m, l: wellbot.build_reply(m, l, kb), iterations)
+
+    print(f"{len(kb.entries)} KB entries, {iterations * len(MESSAGES)} requests each")
+    print(f"before (multi-scan):     {before:8.1f} us CPU/request")
+    print(f"after (single analysis): {after:8.1f} us CPU/request")
+    print(f"speedup:                 {before / after:8.2f}x")
@@ -0,0 +1,90 @@
+import os
+import sqlite3
+import subprocess
+import sys
+
+from bench_util import probe_results, scratch_backend
+
+# Concurrent read/write load on a throwaway copy of chat_history.db: several
+# processes, each with several threads, running the /chat and /feedback write
+# paths next to the admin analytics reads. Counts "database is locked" errors
+# under the old rollback-journal setup and the WAL + busy-retry setup.
+# Usage: python bench_db_concurrency.py [processes] [threads] [iterations]   (run from backend/)
+
+PROBE = r'''
+import sqlite3, sys, threading, time
+import db_setup
+from migrations import migrate
+
+threads, iterations = int(sys.argv[1]), int(sys.argv[2])
+migrate()
+errors = []
+operations = [0]
+lock = threading.Lock()
+
+def worker(user_id):
+    for _ in range(iterations):
+        try:
+            conversation_id = db_setup.get_or_create_conversation(user_id)
+            db_setup.insert_message(conversation_id, 'user', 'I have a fever')
+            message_id = db_setup.insert_message(conversation_id, 'assistant', 'Rest and drink fluids')
+            db_setup.update_message_feedback(message_id, 'positive')
+            db_setup.get_feedback_stats()
+            db_setup.count_total_messages()
+            with lock:
+                operations[0] += 6
+        except sqlite3.OperationalError as e:
+            with lock:
+                errors.append(str(e))
+
+workers = [threading.Thread(target=worker, args=(1 + i % 3,)) for i in range(threads)]
+start = time.perf_counter()
+for thread in workers:
+    thread.start()
+for thread in workers:
+    thread.join()
+elapsed = time.perf_counter() - start
+print(f"RESULT {len(errors)} {operations[0]} {elapsed:.3f} {db_setup.write_stats['retries']}")
+'''
+
+# The old code: rollback journal, default 5 s timeout, no retries
+LEGACY = {'DB_JOURNAL_MODE': 'DELETE', 'DB_SYNCHRONOUS': 'FULL', 'DB_MMAP_SIZE': '0',
+          'DB_BUSY_TIMEOUT': '5.0', 'DB_WRITE_RETRIES': '0', 'DB_POOL_SIZE': '0'}
+TUNED = {'DB_JOURNAL_MODE': 'WAL', 'DB_SYNCHRONOUS': 'NORMAL'}
+
+
+def run(settings, processes, threads, iterations):
+    with scratch_backend() as workdir:
+        # Start both runs from the same journal mode
+        conn = sqlite3.connect(os.path.join(workdir, 'chat_history.db'))
+        conn.execute('PRAGMA journal_mode = DELETE')
+        conn.close()
+
+        env = dict(os.environ, **settings)
+        workers = [
+            subprocess.Popen([sys.executable, '-c', PROBE, str(threads), str(iterations)],
+                             cwd=workdir, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+            for _ in range(processes)
+        ]
+        totals = [0, 0, 0.0, 0]
+        for worker in workers:
+            output, errors_output = worker.communicate()
+            (result,) = probe_results(output, errors_output, worker.returncode)
+            errors, operations, elapsed, retries = result
+            totals[0] += int(errors)
+            totals[1] += int(operations)
+            totals[2] = max(totals[2], float(elapsed))
+            totals[3] += int(retries)
+        return totals
+
+
+if __name__ == "__main__":
+    processes = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+    iterations = int(sys.argv[3]) if len(sys.argv) > 3 else 20
+
+    print(f"{processes} processes x {threads} threads x {iterations} iterations")
+    print(f"{'':<34}{'lock errors':>12}{'ops/s':>10}{'retries':>9}")
+    for label, settings in [("rollback journal, no retry", LEGACY), ("WAL + busy retry", TUNED)]:
+        errors, operations, elapsed, retries = run(settings, processes, threads, iterations)
+        print(f"{label:<34}{errors:>12}{operations / elapsed:>10.0f}{retries:>9}")
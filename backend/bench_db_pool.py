@@ -0,0 +1,56 @@
+import os
+import sys
+
+from bench_util import run_probe
+
+# /chat requests/sec with pooled SQLite connections versus a new connection
+# per db_setup call (DB_POOL_SIZE=0), on a throwaway copy of chat_history.db.
+# Usage: python bench_db_pool.py [requests per thread] [threads]   (run from backend/)
+
+PROBE = r'''
+import sys, threading, time
+import app
+from db_setup import db_pool
+
+requests_per_thread, threads = int(sys.argv[1]), int(sys.argv[2])
+client = app.app.test_client()
+token = client.post('/auth/login', json={'email': 'bench@wellbot.test', 'password': 'pw'}).get_json()['token']
+headers = {'Authorization': 'Bearer ' + token}
+messages = ['I have a fever', 'symptoms of headache', 'hello', 'मुझे बुखार है']
+errors = []
+
+def worker():
+    client = app.app.test_client()
+    for i in range(requests_per_thread):
+        response = client.post('/chat', json={'message': messages[i % len(messages)], 'language': 'en'},
+                               headers=headers)
+        if response.status_code != 200:
+            errors.append(response.status_code)
+
+workers = [threading.Thread(target=worker) for _ in range(threads)]
+start = time.perf_counter()
+for thread in workers:
+    thread.start()
+for thread in workers:
+    thread.join()
+elapsed = time.perf_counter() - start
+print(f"RESULT {requests_per_thread * threads / elapsed:.1f} {len(errors)} {db_pool.opened}")
+'''
+
+
+def run(env, requests_per_thread, threads):
+    (result,) = run_probe(PROBE, requests_per_thread, threads, env=env)
+    return [float(value) for value in result]
+
+
+if __name__ == "__main__":
+    requests_per_thread = int(sys.argv[1]) if len(sys.argv) > 1 else 250
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    # Keep the NLU cheap so the run measures the database layer
+    env = dict(os.environ, NLU_LOAD_MODELS='0', STARTUP_ARTIFACT='', RESPONSE_CACHE_SIZE='1024')
+
+    print(f"/chat, {threads} threads x {requests_per_thread} requests")
+    print(f"{'':<26}{'req/s':>10}{'errors':>8}{'connections':>13}")
+    for label, pool_size in [("new connection per call", '0'), ("pooled connections", '8')]:
+        rate, errors, opened = run(dict(env, DB_POOL_SIZE=pool_size), requests_per_thread, threads)
+        print(f"{label:<26}{rate:>10.1f}{int(errors):>8}{int(opened):>13}")
@@ -0,0 +1,69 @@
+import random
+import re
+import sys
+import time
+
+from advanced_nlu import EntityMatcher, SimpleNLU
+
+# Throughput of entity extraction on long, entity-dense messages: the original
+# per-pattern re.finditer loop versus the single-pass EntityMatcher trie.
+# Usage: python bench_entity_extraction.py [words_per_message] [messages]
+
+FILLER = ["i", "have", "a", "and", "my", "since", "yesterday", "with", "bad", "also", "mein", "hai"]
+
+
+def legacy_extract(entity_patterns, message):
+    entities = {"symptom": [], "body_part": [], "ailment": []}
+    message_lower = message.lower()
+    for entity_type, patterns in entity_patterns.items():
+        for pattern in patterns:
+            for match in re.finditer(pattern, message_lower, re.IGNORECASE):
+                entity_value = match.group()
+                if entity_value not in [e["value"] for e in entities[entity_type]]:
+                    entities[entity_type].append({
+                        "value": entity_value, "start": match.start(),
+                        "end": match.end(), "confidence": 0.9,
+                    })
+    return entities
+
+
+def entity_phrases(entity_patterns):
+    phrases = []
+    for patterns in entity_patterns.values():
+        for pattern in patterns:
+            phrases.extend(pattern[3:-3].split("|"))
+    return phrases
+
+
+def make_messages(phrases, words, count, seed=0):
+    rng = random.Random(seed)
+    vocab = phrases + FILLER
+    return [" ".join(rng.choice(vocab) for _ in range(words)) for _ in range(count)]
+
+
+def throughput(fn, messages):
+    start = time.perf_counter()
+    for message in messages:
+        fn(message)
+    elapsed = time.perf_counter() - start
+    return len(messages) / elapsed, sum(len(m) for m in messages) / elapsed / 1e6
+
+
+if __name__ == "__main__":
+    words = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+
+    nlu = SimpleNLU()
+    matcher = EntityMatcher(nlu.entity_patterns)
+    messages = make_messages(entity_phrases(nlu.entity_patterns), words, count)
+
+    for message in messages[:20]:
+        assert matcher.extract(message.lower()) == legacy_extract(nlu.entity_patterns, message)
+
+    print(f"{count} messages x {words} words")
+    for name, fn in [
+        ("legacy finditer loop", lambda m: legacy_extract(nlu.entity_patterns, m)),
+        ("compiled trie", lambda m: matcher.extract(m.lower())),
+    ]:
+        per_sec, mb_per_sec = throughput(fn, messages)
+        print(f"{name:<22}{per_sec:>10.0f} msg/s{mb_per_sec:>10.2f} MB/s")
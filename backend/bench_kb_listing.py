@@ -0,0 +1,74 @@
+import os
+import sys
+
+from bench_util import run_probe
+
+# GET /admin/kb: the old whole-table dump versus a first page of the list view
+# (no content bodies), a full walk of the pages, and an unchanged poll
+# answered 304 from the version counter, on a throwaway copy of
+# chat_history.db whose KB is grown to N entries of ~2 KB content each.
+# Usage: python bench_kb_listing.py [entries]   (run from backend/)
+
+PROBE = r'''
+import sys, time, warnings
+warnings.simplefilter('ignore')
+import db_setup
+from migrations import migrate
+
+total = int(sys.argv[1])
+migrate()
+conn = db_setup.get_connection()
+conn.executemany('INSERT INTO health_knowledge_base (category, title, content_english, content_hindi, keywords) '
+                 'VALUES (?, ?, ?, ?, ?)',
+                 [(f'Category {i % 12}', f'Entry {i}', 'advice ' * 150, 'सलाह ' * 150, f'entry{i}, topic{i % 40}')
+                  for i in range(total)])
+conn.commit()
+conn.close()
+
+import app
+client = app.app.test_client()
+token = client.post('/auth/login', json={'email': 'bench@wellbot.test', 'password': 'pw'}).get_json()['token']
+headers = {'Authorization': f'Bearer {token}'}
+
+def legacy():
+    with app.app.test_request_context():
+        return len(app.jsonify({"entries": db_setup.get_kb_entries()}).get_data())
+
+def first_page():
+    return len(client.get('/admin/kb?fields=id,category,title,keywords', headers=headers).get_data())
+
+def all_pages():
+    size, cursor = 0, 0
+    while cursor is not None:
+        response = client.get(f'/admin/kb?after={cursor}&limit=500', headers=headers)
+        size += len(response.get_data())
+        cursor = response.get_json()['next_cursor']
+    return size
+
+etag = client.get('/admin/kb', headers=headers).headers['ETag']
+def unchanged():
+    response = client.get('/admin/kb', headers={**headers, 'If-None-Match': etag})
+    assert response.status_code == 304
+    return len(response.get_data())
+
+for name, fn in [('legacy', legacy), ('first_page', first_page), ('all_pages', all_pages), ('unchanged', unchanged)]:
+    size = fn()
+    runs = 20
+    started = time.perf_counter()
+    for _ in range(runs):
+        fn()
+    print(f"RESULT {name} {(time.perf_counter() - started) / runs * 1000:.3f} {size}")
+'''
+
+
+if __name__ == "__main__":
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    env = dict(os.environ, NLU_LOAD_MODELS='0', STARTUP_ARTIFACT='')
+
+    results = run_probe(PROBE, total, env=env)
+    labels = {'legacy': 'old full table dump', 'first_page': 'first page, list view',
+              'all_pages': 'every page, all fields', 'unchanged': 'unchanged poll (304)'}
+    print(f"{total} KB entries")
+    print(f"{'':<26}{'ms':>10}{'bytes':>12}")
+    for name, millis, size in results:
+        print(f"{labels[name]:<26}{float(millis):>10.2f}{int(size):>12}")
@@ -0,0 +1,89 @@
+import random
+import sys
+import time
+
+from kb_index import KBMatcher, KBRetriever
+
+# Benchmark KB lookup strategies on synthetic knowledge bases.
+# Usage: python bench_kb_retrieval.py [sizes...]   (default: 1000 10000 100000)
+
+WORDS = [
+    "fever", "cough", "cold", "headache", "pain", "nausea", "rash", "itching", "swelling",
+    "fatigue", "dizziness", "stress", "anxiety", "sleep", "diet", "stomach", "throat",
+    "chest", "back", "joint", "skin", "eye", "ear", "burn", "cut", "sprain", "allergy",
+    "mild", "severe", "chronic", "acute", "dry", "runny", "sore", "high", "low",
+]
+
+QUERIES = [
+    "I have a fever and a headache",
+    "what are the symptoms of a sore throat",
+    "how do I treat a minor burn",
+    "my back pain is severe",
+    "give me a wellness tip",
+    "I feel stressed and cannot sleep",
+]
+
+
+def synthetic_kb(size, seed=0):
+    rng = random.Random(seed)
+    entries = []
+    for i in range(size):
+        condition = " ".join(rng.sample(WORDS, 2)) + f" {i}"
+        symptoms = [" ".join(rng.sample(WORDS, 2)) for _ in range(4)]
+        entries.append({
+            "condition": condition,
+            "symptoms_en": symptoms,
+            "answer_en": " ".join(rng.choice(WORDS) for _ in range(20)),
+        })
+    return entries
+
+
+def linear_scan(knowledge_base, message, language="en"):
+    """The original per-item keyword loop from /chat"""
+    msg_lower = message.lower()
+    for item in knowledge_base:
+        keywords_en = item.get("symptoms_en", []) + [item.get("condition", "").lower()]
+        keywords_hi = item.get("symptoms_hi", []) + [item.get("condition_hi", "").lower()]
+        if language == "hi" and any(word in msg_lower for word in keywords_hi):
+            return item
+        elif language == "en" and any(word in msg_lower for word in keywords_en):
+            return item
+    return None
+
+
+def time_queries(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for query in QUERIES:
+            fn(query)
+    return (time.perf_counter() - start) * 1000 / (repeat * len(QUERIES))
+
+
+def run(size):
+    kb = synthetic_kb(size)
+    repeat = max(1, 2000 // size)
+
+    start = time.perf_counter()
+    matcher = KBMatcher(kb)
+    matcher_build = time.perf_counter() - start
+
+    start = time.perf_counter()
+    retriever = KBRetriever(kb)
+    retriever_build = time.perf_counter() - start
+
+    results = [
+        ("linear scan", 0.0, time_queries(lambda q: linear_scan(kb, q), repeat)),
+        ("keyword automaton", matcher_build, time_queries(lambda q: matcher.match(q), repeat * 10)),
+        ("bm25 top-3", retriever_build, time_queries(lambda q: retriever.search(q, top_k=3), repeat * 10)),
+    ]
+
+    print(f"\n{size} entries")
+    print(f"{'strategy':<20}{'build (s)':>12}{'per query (ms)':>18}")
+    for name, build, per_query in results:
+        print(f"{name:<20}{build:>12.3f}{per_query:>18.3f}")
+
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1000, 10000, 100000]
+    for size in sizes:
+        run(size)
@@ -0,0 +1,99 @@
+import json
+import multiprocessing
+import sys
+import time
+
+# fp32 vs dynamic int8 MarianMT: process RSS, load time, per-text latency and
+# a quality check of the int8 translations of the kb.json answers against the
+# fp32 output (exact-match rate and chrF). Each mode runs in its own process
+# so RSS numbers don't bleed into each other. Needs torch + the opus-mt models.
+# Usage: python bench_quantization.py [max_answers]
+
+
+def rss_mb():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def measure(quantize, texts):
+    from advanced_nlu import SimpleNLU
+
+    before = rss_mb()
+    start = time.perf_counter()
+    nlu = SimpleNLU(background=False, translation_batch_size=1, translation_cache_path="",
+                    quantize=quantize)
+    load_seconds = time.perf_counter() - start
+    if not nlu.marian_available:
+        return None
+
+    outputs = {}
+    start = time.perf_counter()
+    for source_lang, target_lang, items in texts:
+        outputs[source_lang] = nlu.translate_batch(items[:1], source_lang, target_lang)  # warm up
+        outputs[source_lang] = [nlu.translate_batch([text], source_lang, target_lang)[0] for text in items]
+    count = sum(len(items) for _, _, items in texts)
+    return {
+        "rss_mb": rss_mb() - before,
+        "load_s": load_seconds,
+        "latency_ms": (time.perf_counter() - start) * 1000 / count,
+        "outputs": outputs,
+    }
+
+
+def chrf(hypothesis, reference, max_n=6, beta=2.0):
+    """Character n-gram F-score (chrF) of one sentence, 0-100"""
+    precisions, recalls = [], []
+    for n in range(1, max_n + 1):
+        hyp = [hypothesis[i:i + n] for i in range(len(hypothesis) - n + 1)]
+        ref = [reference[i:i + n] for i in range(len(reference) - n + 1)]
+        if not hyp or not ref:
+            continue
+        remaining = list(ref)
+        matches = 0
+        for gram in hyp:
+            if gram in remaining:
+                remaining.remove(gram)
+                matches += 1
+        precisions.append(matches / len(hyp))
+        recalls.append(matches / len(ref))
+    if not precisions:
+        return 100.0 if hypothesis == reference else 0.0
+    p = sum(precisions) / len(precisions)
+    r = sum(recalls) / len(recalls)
+    if p == 0 and r == 0:
+        return 0.0
+    return 100 * (1 + beta ** 2) * p * r / (beta ** 2 * p + r)
+
+
+if __name__ == "__main__":
+    limit = int(sys.argv[1]) if len(sys.argv) > 1 else None
+    with open('kb.json', 'r', encoding='utf-8') as f:
+        knowledge_base = json.load(f)
+    texts = [
+        ("en", "hi", [item["answer_en"] for item in knowledge_base][:limit]),
+        ("hi", "en", [item["answer_hi"] for item in knowledge_base][:limit]),
+    ]
+
+    with multiprocessing.get_context("spawn").Pool(1, maxtasksperchild=1) as pool:
+        fp32 = pool.apply(measure, (False, texts))
+    with multiprocessing.get_context("spawn").Pool(1, maxtasksperchild=1) as pool:
+        int8 = pool.apply(measure, (True, texts))
+    if fp32 is None or int8 is None:
+        print("MarianMT models are not available; nothing to measure.")
+        sys.exit(1)
+
+    print(f"{'mode':<6}{'RSS (MB)':>10}{'load (s)':>10}{'ms/text':>10}")
+    for name, result in (("fp32", fp32), ("int8", int8)):
+        print(f"{name:<6}{result['rss_mb']:>10.0f}{result['load_s']:>10.1f}{result['latency_ms']:>10.1f}")
+    print(f"delta {int8['rss_mb'] - fp32['rss_mb']:>10.0f}{int8['load_s'] - fp32['load_s']:>10.1f}"
+          f"{int8['latency_ms'] - fp32['latency_ms']:>10.1f}")
+
+    print("\nint8 vs fp32 translation of KB answers")
+    for source_lang, target_lang, _ in texts:
+        pairs = list(zip(int8["outputs"][source_lang], fp32["outputs"][source_lang]))
+        exact = sum(a == b for a, b in pairs) / len(pairs)
+        score = sum(chrf(a, b) for a, b in pairs) / len(pairs)
+        print(f"{source_lang}->{target_lang}: exact match {exact:.0%}, chrF {score:.1f}")
@@ -0,0 +1,77 @@
+import sys
+
+from bench_util import run_probe
+
+# Recent feedback on the admin dashboard: the old self-join on conversation_id
+# and timestamp versus the reply_to_message_id point lookup, plus the rate of
+# the reply-link backfill, on a throwaway copy of chat_history.db grown to N
+# messages in conversations of a given length.
+# Usage: python bench_recent_feedback.py [messages] [conversation length]   (run from backend/)
+
+PROBE = r'''
+import sys, time
+import db_setup, backfill
+from migrations import migrate
+
+total, length = int(sys.argv[1]), int(sys.argv[2])
+migrate()
+
+# History from before the column existed: user/assistant pairs, no links,
+# a feedback on every tenth reply
+conn = db_setup.get_connection()
+first = conn.execute('SELECT COALESCE(MAX(id), 0) FROM messages').fetchone()[0] + 1
+rows = []
+for i in range(total):
+    seconds = i % length
+    rows.append((first + i, 100000 + i // length, 'user' if i % 2 == 0 else 'assistant', f'message {i}',
+                 f'2026-01-01 {seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}',
+                 'positive' if i % 20 == 1 else None))
+for chunk in range(0, total, 50000):
+    conn.executemany('INSERT INTO messages (id, conversation_id, sender, text_content, timestamp, feedback_type) '
+                     'VALUES (?, ?, ?, ?, ?, ?)', rows[chunk:chunk + 50000])
+    conn.commit()
+
+LEGACY = """
+    SELECT m.id, m.feedback_type, m.feedback_comment, m.timestamp, u.text_content
+    FROM messages m
+    JOIN messages u ON m.conversation_id = u.conversation_id AND u.sender = 'user' AND u.timestamp < m.timestamp
+    WHERE m.sender = 'assistant' AND m.feedback_type IS NOT NULL
+    ORDER BY m.timestamp DESC LIMIT 10
+"""
+started = time.perf_counter()
+legacy_replies = len({row[0] for row in conn.execute(LEGACY)})
+legacy_seconds = time.perf_counter() - started
+conn.close()
+
+started = time.perf_counter()
+done = backfill.backfill_replies(chunk_size=5000, progress=None)
+backfill_seconds = time.perf_counter() - started
+
+db_setup.get_recent_feedback()
+runs = 20
+started = time.perf_counter()
+for _ in range(runs):
+    recent = db_setup.get_recent_feedback()
+linked_seconds = (time.perf_counter() - started) / runs
+
+conn = db_setup.get_connection()
+wrong = conn.execute("SELECT COUNT(*) FROM messages m WHERE m.id >= ? AND m.sender = 'assistant' "
+                     "AND m.reply_to_message_id IS NOT m.id - 1", (first,)).fetchone()[0]
+conn.close()
+print(f"RESULT {legacy_seconds:.4f} {linked_seconds:.4f} {done} {done / backfill_seconds:.0f} {wrong} "
+      f"{legacy_replies} {len(recent)}")
+'''
+
+
+if __name__ == "__main__":
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    length = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    (result,) = run_probe(PROBE, total, length)
+    legacy, linked, done, rate, wrong, legacy_replies, linked_replies = result
+    print(f"{total} messages, {length} per conversation")
+    print(f"recent feedback, self-join          {float(legacy) * 1000:>10.2f} ms, "
+          f"{legacy_replies} distinct replies in 10 rows")
+    print(f"recent feedback, reply_to lookup    {float(linked) * 1000:>10.2f} ms, "
+          f"{linked_replies} distinct replies in 10 rows")
+    print(f"reply backfill                      {int(done):>10} rows at {rate} rows/s")
+    print(f"replies linked to the wrong message {int(wrong):>10}")
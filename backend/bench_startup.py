@@ -0,0 +1,133 @@
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+
+from bench_util import BACKEND, scratch_backend
+
+# Worker startup time and memory with and without the precompiled startup
+# artifact, on a synthetic KB made of kb.json repeated to the requested size.
+# Start cost is import CPU time, so workers competing for cores don't skew it.
+# Usage: python bench_startup.py [entries] [workers]   (run from backend/)
+
+PROBE = r'''
+import os, sys, time
+start = time.process_time()
+import app
+import startup_artifact
+elapsed = time.process_time() - start
+print(f"READY {elapsed:.3f}")
+sys.stdout.flush()
+sys.stdin.readline()  # measure once every worker has loaded, so shared pages count
+
+# Serve some lookups first: mapped pages are only faulted in when read
+snapshot = app.live_kb.snapshot
+for item in snapshot.entries[::20]:
+    pos = snapshot.lookup_position(item.get('condition', '').lower())
+    if pos is not None:
+        snapshot.reply(pos, 'answer')
+
+def mapping_kb(path):
+    total = {}
+    current = None
+    with open('/proc/self/smaps') as f:
+        for line in f:
+            fields = line.split()
+            if '-' in fields[0] and len(fields) >= 5:
+                current = fields[-1] if len(fields) >= 6 else None
+            elif current == path and fields[0].endswith(':') and fields[-1] == 'kB':
+                total[fields[0][:-1]] = total.get(fields[0][:-1], 0) + int(fields[1])
+    return total
+
+status = dict(line.split(':', 1) for line in open('/proc/self/status'))
+rollup = dict(line.split(':', 1) for line in open('/proc/self/smaps_rollup') if ':' in line and not line[0].isdigit())
+artifact = mapping_kb(os.path.abspath(app.app.config['STARTUP_ARTIFACT'] or '-'))
+print(f"RESULT {status['VmRSS'].split()[0]} {rollup['Pss'].split()[0]} "
+      f"{artifact.get('Rss', 0)} {artifact.get('Shared_Clean', 0)} "
+      f"{int(isinstance(app.live_kb.snapshot.replies.texts, startup_artifact.MappedStrings))}")
+sys.stdout.flush()
+sys.stdin.read()  # stay alive until every worker has been measured
+'''
+
+
+def synthetic_kb(items, size):
+    """kb.json items repeated with unique titles/keywords up to ``size`` entries"""
+    entries = []
+    for i in range(size):
+        item = dict(items[i % len(items)])
+        suffix = f" {i}"
+        item["condition"] = item.get("condition", "") + suffix
+        item["condition_hi"] = item.get("condition_hi", "") + suffix
+        item["symptoms_en"] = [word + suffix for word in item.get("symptoms_en", [])]
+        item["answer_en"] = item.get("answer_en", "") + suffix
+        entries.append(item)
+    return entries
+
+
+def run_workers(workdir, env, workers):
+    """Start ``workers`` processes importing app at once; per-worker stats"""
+    # stderr goes to files: a full pipe nobody reads would stall the worker
+    logs = [tempfile.TemporaryFile('w+') for _ in range(workers)]
+    processes = [
+        subprocess.Popen([sys.executable, '-c', PROBE], cwd=workdir, env=env,
+                         stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                         stderr=log, text=True)
+        for log in logs
+    ]
+    # app.py prints while importing; the probe's own lines are tagged
+    results = [read_tagged(process, log, 'READY') for process, log in zip(processes, logs)]
+    for process, log, result in zip(processes, logs, results):
+        process.stdin.write('\n')
+        process.stdin.flush()
+        result.extend(read_tagged(process, log, 'RESULT'))
+    for process, log in zip(processes, logs):
+        process.communicate('')
+        log.close()
+    return [[float(value) for value in result] for result in results]
+
+
+def read_tagged(process, log, tag):
+    line = process.stdout.readline()
+    while line and not line.startswith(tag + ' '):
+        line = process.stdout.readline()
+    if not line:
+        log.seek(0)
+        raise RuntimeError(f"benchmark probe failed before {tag} (exit {process.wait()}):\n{log.read()}")
+    return line.split()[1:]
+
+
+def report(label, results):
+    n = len(results)
+    seconds, rss, pss, mapped_rss, mapped_shared, loaded = [sum(column) / n for column in zip(*results)]
+    print(f"{label:<24}{seconds:>10.3f}{rss / 1024:>10.1f}{pss / 1024:>10.1f}"
+          f"{mapped_rss / 1024:>12.1f}{mapped_shared / 1024:>12.1f}{'yes' if loaded else 'no':>8}")
+
+
+if __name__ == "__main__":
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else 2
+    with scratch_backend() as workdir:
+        with open(os.path.join(BACKEND, 'kb.json'), 'r', encoding='utf-8') as f:
+            items = json.load(f)
+        with open(os.path.join(workdir, 'kb.json'), 'w', encoding='utf-8') as f:
+            json.dump(synthetic_kb(items, size), f, ensure_ascii=False)
+        # Serve the synthetic kb.json rather than the DB KB
+        conn = sqlite3.connect(os.path.join(workdir, 'chat_history.db'))
+        conn.execute('DELETE FROM health_knowledge_base')
+        conn.commit()
+        conn.close()
+
+        env = dict(os.environ, NLU_LOAD_MODELS='0',
+                   STARTUP_ARTIFACT=os.path.join(workdir, 'startup_artifact.bin'))
+        no_artifact = dict(env, STARTUP_ARTIFACT='')
+
+        print(f"{size} KB entries, {workers} workers started together (averages per worker)")
+        print(f"{'':<24}{'CPU (s)':>10}{'RSS (MB)':>10}{'PSS (MB)':>10}"
+              f"{'mapped RSS':>12}{'mapped shr':>12}{'loaded':>8}")
+        report("before (build at import)", run_workers(workdir, no_artifact, workers))
+        report("first start (writes)", run_workers(workdir, env, 1))
+        report("after (mapped artifact)", run_workers(workdir, env, workers))
+        artifact_size = os.path.getsize(env['STARTUP_ARTIFACT'])
+        print(f"artifact size: {artifact_size / 1024 / 1024:.1f} MB")
@@ -0,0 +1,105 @@
+import sys
+
+from bench_util import run_probe
+
+# Common queries: the old GROUP BY text_content over every user message (and
+# the per-user version joined through conversations) versus reading the
+# Space-Saving summaries, plus how close the summary's top 10 is to the exact
+# one, on a throwaway copy of chat_history.db grown to N user messages drawn
+# from a skewed set of 50k distinct queries asked by 2000 users.
+# Usage: python bench_top_queries.py [messages]   (run from backend/)
+
+PROBE = r'''
+import random, sys, time
+import db_setup
+import top_queries
+from collections import Counter
+from migrations import migrate
+
+total = int(sys.argv[1])
+migrate()
+
+random.seed(7)
+distinct = 50000
+weights = [1 / (rank + 1) ** 1.1 for rank in range(distinct)]
+queries = [f'query number {rank}' for rank in random.choices(range(distinct), weights, k=total)]
+users = 2000
+
+conn = db_setup.get_connection()
+first_conversation = conn.execute('SELECT COALESCE(MAX(id), 0) FROM conversations').fetchone()[0] + 1
+first_user = conn.execute('SELECT COALESCE(MAX(id), 0) FROM users').fetchone()[0] + 1
+conn.executemany('INSERT INTO conversations (id, userid, start_time) VALUES (?, ?, CURRENT_TIMESTAMP)',
+                 [(first_conversation + u, first_user + u) for u in range(users)])
+first = conn.execute('SELECT COALESCE(MAX(id), 0) FROM messages').fetchone()[0] + 1
+for chunk in range(0, total, 50000):
+    conn.executemany('INSERT INTO messages (id, conversation_id, sender, text_content) VALUES (?, ?, ?, ?)',
+                     [(first + i, first_conversation + i % users, 'user', queries[i])
+                      for i in range(chunk, min(total, chunk + 50000))])
+    conn.commit()
+
+def timed(fn, runs=3):
+    fn()
+    started = time.perf_counter()
+    for _ in range(runs):
+        fn()
+    return (time.perf_counter() - started) / runs * 1000
+
+def legacy_global():
+    return conn.execute("SELECT text_content, COUNT(*) AS count FROM messages WHERE sender = 'user' "
+                        "GROUP BY text_content ORDER BY count DESC LIMIT 10").fetchall()
+
+def legacy_user():
+    return conn.execute("SELECT text_content, COUNT(*) AS count FROM messages m "
+                        "JOIN conversations c ON m.conversation_id = c.id "
+                        "WHERE c.userid = ? AND m.sender = 'user' "
+                        "GROUP BY text_content ORDER BY count DESC LIMIT 5", (first_user,)).fetchall()
+
+results = [timed(legacy_global), timed(legacy_user)]
+
+started = time.perf_counter()
+top_queries.rebuild(1000, 50)
+results.append(time.perf_counter() - started)
+
+tracker = top_queries.QueryTracker(epsilon=0.001, user_epsilon=0.02, checkpoint_seconds=0)
+results.append(timed(lambda: tracker.top(10), runs=100))
+results.append(timed(lambda: tracker.top(5, first_user), runs=100))
+
+# Live counting: 100k more queries through add(), then one checkpoint
+extra = queries[:100000]
+started = time.perf_counter()
+for i, text in enumerate(extra):
+    tracker.add(first_user + i % users, text)
+results.append((time.perf_counter() - started) / len(extra) * 1e6)
+started = time.perf_counter()
+tracker.checkpoint()
+results.append((time.perf_counter() - started) * 1000)
+
+# Accuracy against the exact counts
+exact = Counter(queries) + Counter(extra)
+for text, count in conn.execute("SELECT text_content, COUNT(*) FROM messages WHERE sender = 'user' "
+                                "AND id < ? GROUP BY text_content", (first,)):
+    exact[top_queries.query_key(text)] += count
+estimated = tracker.top(10)
+recall = len({q for q, _ in estimated} & {q for q, _ in exact.most_common(10)}) / 10
+overestimate = max(count - exact[q] for q, count in estimated)
+bound = tracker.stats()['queries'] / tracker.capacity
+conn.close()
+print("RESULT " + " ".join(f"{value:.4f}" for value in results) + f" {recall:.2f} {overestimate} {bound:.0f}")
+'''
+
+
+if __name__ == "__main__":
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    (result,) = run_probe(PROBE, total)
+    (legacy_global, legacy_user, rebuild, top_global, top_user, add_us, checkpoint,
+     recall, overestimate, bound) = result
+    print(f"{total} user messages, 50k distinct queries, 2000 users")
+    print(f"old GROUP BY, global top 10          {float(legacy_global):>10.2f} ms")
+    print(f"old GROUP BY, one user's top 5       {float(legacy_user):>10.2f} ms")
+    print(f"tracker, global top 10               {float(top_global):>10.3f} ms")
+    print(f"tracker, one user's top 5            {float(top_user):>10.3f} ms")
+    print(f"tracker add() per query              {float(add_us):>10.1f} us")
+    print(f"checkpoint after 100k queries        {float(checkpoint):>10.1f} ms")
+    print(f"rebuild from messages                {float(rebuild):>10.1f} s")
+    print(f"top 10 recall vs exact               {float(recall):>10.2f}")
+    print(f"largest overestimate in top 10       {overestimate:>10} (bound {bound})")
@@ -0,0 +1,74 @@
+import sys
+
+from bench_util import run_probe
+
+# Health topic stats at scale: the old load-every-user-message-and-scan
+# version versus the GROUP BY over the classified topic column, plus the
+# backfill rate for history written before the column existed. Runs on a
+# throwaway copy of chat_history.db grown to N user messages.
+# Usage: python bench_topics.py [messages]   (run from backend/)
+
+PROBE = r'''
+import random, sys, time
+import db_setup, backfill
+from migrations import migrate
+
+total = int(sys.argv[1])
+migrate()
+phrases = ['I have a fever', 'what should I eat for dinner', 'how to sleep better', 'best workout for beginners',
+           'medicine for cold', 'general health checkup', 'hello there', 'मुझे बुखार है', 'knee pain after running',
+           'feeling stressed at work']
+random.seed(1)
+
+# Old history: rows written without a topic
+conn = db_setup.get_connection()
+start_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM messages').fetchone()[0] + 1
+for chunk in range(0, total, 50000):
+    conn.executemany("INSERT INTO messages (id, conversation_id, sender, text_content) VALUES (?, ?, 'user', ?)",
+                     [(start_id + i, 1 + i // 20, f'{random.choice(phrases)} #{i % 997}')
+                      for i in range(chunk, min(total, chunk + 50000))])
+    conn.commit()
+conn.close()
+
+def legacy():
+    conn = db_setup.get_connection()
+    user_messages = conn.execute("SELECT text_content FROM messages WHERE sender = 'user'").fetchall()
+    conn.close()
+    counts = {}
+    for (message,) in user_messages:
+        topic = db_setup.classify_topic(message)
+        counts[topic] = counts.get(topic, 0) + 1
+    return counts
+
+started = time.perf_counter()
+expected = legacy()
+legacy_seconds = time.perf_counter() - started
+
+started = time.perf_counter()
+done = backfill.backfill_topics(chunk_size=5000, progress=None)
+backfill_seconds = time.perf_counter() - started
+
+db_setup.get_health_topics_stats()
+runs = 5
+started = time.perf_counter()
+for _ in range(runs):
+    stats = db_setup.get_health_topics_stats()
+grouped_seconds = (time.perf_counter() - started) / runs
+
+expected_total = sum(expected.values())
+match = all(stats[topic] == {'count': expected.get(topic, 0),
+                             'percentage': round(expected.get(topic, 0) / expected_total * 100, 1)}
+            for topic, _ in db_setup.HEALTH_TOPICS)
+print(f"RESULT {legacy_seconds:.3f} {grouped_seconds:.3f} {done} {done / backfill_seconds:.0f} {int(match)}")
+'''
+
+
+if __name__ == "__main__":
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    (result,) = run_probe(PROBE, total)
+    legacy, grouped, done, rate, match = result
+    print(f"{total} user messages")
+    print(f"topic stats, load + keyword scan   {float(legacy) * 1000:>10.1f} ms")
+    print(f"topic stats, GROUP BY topic        {float(grouped) * 1000:>10.1f} ms")
+    print(f"backfill                           {int(done):>10} rows at {rate} rows/s")
+    print(f"percentages match                  {'yes' if match == '1' else 'NO':>10}")
@@ -0,0 +1,65 @@
+import statistics
+import sys
+import threading
+import time
+
+from advanced_nlu import SimpleNLU
+
+# Throughput and latency of concurrent MarianMT translation: one generate per
+# call versus the TranslationBatcher micro-batches. Needs the opus-mt models.
+# Usage: python bench_translation.py [threads] [requests_per_thread]
+
+TEXTS = [
+    "Rest, stay hydrated, and use a cool compress.",
+    "Drink plenty of water and avoid spicy food.",
+    "If symptoms last more than three days, see a doctor.",
+    "Try deep breathing and a short walk to reduce stress.",
+    "Wash your hands with soap for at least twenty seconds.",
+]
+
+
+def run(nlu, threads, per_thread):
+    latencies = []
+    lock = threading.Lock()
+
+    def worker(offset):
+        for i in range(per_thread):
+            text = TEXTS[(offset + i) % len(TEXTS)]
+            start = time.perf_counter()
+            nlu.translate_text(text, "en", "hi")
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "throughput": len(latencies) / elapsed,
+        "p50": statistics.median(latencies) * 1000,
+        "p95": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+    }
+
+
+if __name__ == "__main__":
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    per_thread = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+
+    results = {}
+    for name, batch_size in [("per-call", 1), ("batched", 16)]:
+        nlu = SimpleNLU(background=False, translation_batch_size=batch_size)
+        if not nlu.marian_available:
+            print("MarianMT models are not available; nothing to measure.")
+            sys.exit(1)
+        nlu.translate_text(TEXTS[0], "en", "hi")  # warm up
+        results[name] = run(nlu, threads, per_thread)
+
+    print(f"{threads} threads x {per_thread} requests, en->hi")
+    print(f"{'mode':<10}{'req/s':>10}{'p50 (ms)':>12}{'p95 (ms)':>12}")
+    for name, result in results.items():
+        print(f"{name:<10}{result['throughput']:>10.2f}{result['p50']:>12.1f}{result['p95']:>12.1f}")
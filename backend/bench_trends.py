@@ -0,0 +1,74 @@
+import sys
+
+from bench_util import run_probe
+
+# Query/feedback trends: the old whole-history GROUP BY with a strptime per
+# day row versus the daily_metrics rollup for windows of a week, a quarter and
+# three years, on a throwaway copy of chat_history.db grown to N messages
+# spread over three years.
+# Usage: python bench_trends.py [messages]   (run from backend/)
+
+PROBE = r'''
+import datetime, sys, time
+import db_setup
+from migrations import migrate
+
+total = int(sys.argv[1])
+migrate()
+
+conn = db_setup.get_connection()
+first = conn.execute('SELECT COALESCE(MAX(id), 0) FROM messages').fetchone()[0] + 1
+end = datetime.date(2026, 6, 30)
+days = 3 * 365
+for chunk in range(0, total, 50000):
+    rows = []
+    for i in range(chunk, min(total, chunk + 50000)):
+        day = end - datetime.timedelta(days=i * days // total)
+        rows.append((first + i, 1 + i // 50, 'user' if i % 2 == 0 else 'assistant', 'message',
+                     f'{day.isoformat()} 12:00:00', ('en', 'hi')[i % 7 == 0], ('symptom_query', 'greeting')[i % 5 == 0],
+                     ('positive', 'negative')[i % 3 == 0] if i % 10 == 1 else None))
+    conn.executemany('INSERT INTO messages (id, conversation_id, sender, text_content, timestamp, language, intent, '
+                     'feedback_type) VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows)
+    conn.commit()
+
+def legacy():
+    trends = conn.execute("SELECT date(timestamp) AS day, COUNT(*) FROM messages WHERE sender = 'user' "
+                          "GROUP BY day ORDER BY day").fetchall()
+    feedback = conn.execute("SELECT date(timestamp) AS day, feedback_type, COUNT(*) FROM messages "
+                            "WHERE sender = 'assistant' AND feedback_type IS NOT NULL "
+                            "GROUP BY day, feedback_type ORDER BY day").fetchall()
+    for day, *_ in trends + feedback:
+        datetime.datetime.strptime(day, '%Y-%m-%d').weekday()
+
+def timed(fn, runs=5):
+    fn()
+    started = time.perf_counter()
+    for _ in range(runs):
+        fn()
+    return (time.perf_counter() - started) / runs * 1000
+
+results = [timed(legacy)]
+for window, granularity in [(7, 'day'), (91, 'week'), (3 * 365, 'month')]:
+    start = end - datetime.timedelta(days=window - 1)
+    results.append(timed(lambda: db_setup.get_trends(start, end, granularity)))
+
+# Rollup totals must match the raw data
+window_start = end - datetime.timedelta(days=days)
+queries = sum(day['queries'] for day in db_setup.get_trends(window_start, end, 'month'))
+raw = conn.execute("SELECT COUNT(*) FROM messages WHERE sender = 'user' AND date(timestamp) BETWEEN ? AND ?",
+                   (window_start.isoformat(), end.isoformat())).fetchone()[0]
+conn.close()
+print("RESULT " + " ".join(f"{value:.3f}" for value in results) + f" {int(queries == raw)}")
+'''
+
+
+if __name__ == "__main__":
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    (result,) = run_probe(PROBE, total)
+    legacy, week, quarter, years, match = result
+    print(f"{total} messages over 3 years")
+    print(f"old trends, whole history            {float(legacy):>10.2f} ms")
+    print(f"rollup, last 7 days by day           {float(week):>10.2f} ms")
+    print(f"rollup, last 91 days by week         {float(quarter):>10.2f} ms")
+    print(f"rollup, last 3 years by month        {float(years):>10.2f} ms")
+    print(f"rollup totals match raw messages     {'yes' if match == '1' else 'NO':>10}")
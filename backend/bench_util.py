@@ -0,0 +1,41 @@
+import contextlib
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+# Harness shared by the bench_*.py scripts. Each benchmark is a PROBE script
+# run in a subprocess on a throwaway copy of backend/, so it never touches the
+# real chat_history.db, and reports its numbers on "RESULT ..." lines.
+
+BACKEND = os.path.dirname(os.path.abspath(__file__))
+# Caches and downloads a copy doesn't need
+COPY_IGNORE = shutil.ignore_patterns('__pycache__', 'model_cache', 'translation_cache.db', 'startup_artifact.bin')
+
+
+@contextlib.contextmanager
+def scratch_backend():
+    """A throwaway copy of backend/ (database included); yields its path"""
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = os.path.join(tmp, 'backend')
+        shutil.copytree(BACKEND, workdir, ignore=COPY_IGNORE)
+        yield workdir
+
+
+def probe_results(output, errors='', returncode=0):
+    """Fields of each RESULT line in a probe's stdout; raises with its stdout and stderr if it failed"""
+    results = [line.split()[1:] for line in output.splitlines() if line.startswith('RESULT ')]
+    if returncode or not results:
+        raise RuntimeError(f"benchmark probe failed (exit {returncode}):\n{output}\n{errors}")
+    return results
+
+
+def run_probe(probe, *args, env=None, workdir=None):
+    """Run ``probe`` with ``args`` on a scratch copy of backend/ (or in ``workdir``); its RESULT fields"""
+    if workdir is None:
+        with scratch_backend() as workdir:
+            return run_probe(probe, *args, env=env, workdir=workdir)
+    completed = subprocess.run([sys.executable, '-c', probe, *map(str, args)],
+                               cwd=workdir, env=env, capture_output=True, text=True)
+    return probe_results(completed.stdout, completed.stderr, completed.returncode)
@@ -1,146 +1,277 @@
 import sqlite3
+import contextlib
+import datetime
+import functools
 import os
+import queue
+import random
+import threading
+import time
+
+DB_PATH = os.path.join(os.path.dirname(__file__), 'chat_history.db')
+
+# ---------------- Connection pool ----------------
+# Connections are opened once and reused across requests, so each keeps its
+# page cache and its compiled statements (sqlite3 caches up to
+# STATEMENT_CACHE_SIZE per connection). DB_POOL_SIZE=0 disables pooling.
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 8))
+STATEMENT_CACHE_SIZE = 256
+
+# ---------------- SQLite tuning ----------------
+# WAL lets readers run alongside the single writer instead of queueing behind
+# it; with WAL, synchronous=NORMAL only gives up durability of the last
+# commits on power loss, never consistency.
+DB_JOURNAL_MODE = os.environ.get('DB_JOURNAL_MODE', 'WAL')
+DB_SYNCHRONOUS = os.environ.get('DB_SYNCHRONOUS', 'NORMAL')
+DB_CACHE_SIZE = int(os.environ.get('DB_CACHE_SIZE', -8000))  # negative = KiB, so 8 MB
+DB_MMAP_SIZE = int(os.environ.get('DB_MMAP_SIZE', 64 * 1024 * 1024))
+DB_TEMP_STORE = os.environ.get('DB_TEMP_STORE', 'MEMORY')
+
+# How long a statement waits on a lock, and how often a write is retried
+# (with jittered exponential backoff) when it still comes back busy
+DB_BUSY_TIMEOUT = float(os.environ.get('DB_BUSY_TIMEOUT', 5.0))
+DB_WRITE_RETRIES = int(os.environ.get('DB_WRITE_RETRIES', 5))
+DB_RETRY_BACKOFF = 0.05
+
+# Applied once to every new connection
+CONNECTION_PRAGMAS = [
+    f'PRAGMA journal_mode = {DB_JOURNAL_MODE}',
+    f'PRAGMA synchronous = {DB_SYNCHRONOUS}',
+    f'PRAGMA cache_size = {DB_CACHE_SIZE}',
+    f'PRAGMA mmap_size = {DB_MMAP_SIZE}',
+    f'PRAGMA temp_store = {DB_TEMP_STORE}',
+]
+
+write_stats = {"retries": 0, "failures": 0}
+_write_stats_lock = threading.Lock()
+
+
+def is_busy_error(error):
+    """True for sqlite3 "database is locked"/busy errors"""
+    message = str(error).lower()
+    return 'locked' in message or 'busy' in message
+
+
+def retry_on_busy(func):
+    """Re-run a write that failed with "database is locked"/busy, backing off"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        for attempt in range(DB_WRITE_RETRIES + 1):
+            try:
+                return func(*args, **kwargs)
+            except sqlite3.OperationalError as e:
+                if not is_busy_error(e) or attempt == DB_WRITE_RETRIES:
+                    if is_busy_error(e):
+                        with _write_stats_lock:
+                            write_stats["failures"] += 1
+                    raise
+            # Sleep outside the except block so the failed call's frame, and
+            # the connection it holds, is released before trying again
+            with _write_stats_lock:
+                write_stats["retries"] += 1
+            time.sleep(DB_RETRY_BACKOFF * (2 ** attempt) * random.uniform(0.5, 1.5))
+    return wrapper
+
+
+class PooledConnection(sqlite3.Connection):
+    """sqlite3 connection whose close() hands it back to its pool"""
+
+    pool = None
+
+    def close(self):
+        if self.pool is None or not self.pool.release(self):
+            super().close()
+
+
+class ConnectionPool:
+    """Keeps up to ``size`` idle connections for reuse by any thread.
+
+    ``acquire`` never blocks: when no idle connection is left a new one is
+    opened, and connections beyond ``size`` are really closed when released.
+    A forked worker drops its parent's connections and starts over.
+    """
+
+    def __init__(self, db_path, size=DB_POOL_SIZE, timeout=DB_BUSY_TIMEOUT):
+        self.db_path = db_path
+        self.size = size
+        self.timeout = timeout
+        self._pid = os.getpid()
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.reused = 0
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=self.timeout,
+                               factory=PooledConnection,
+                               check_same_thread=False,
+                               cached_statements=STATEMENT_CACHE_SIZE)
+        try:
+            for pragma in CONNECTION_PRAGMAS:
+                conn.execute(pragma)
+        except BaseException:
+            # A locked or read-only file can fail e.g. journal_mode
+            conn.close()
+            raise
+        conn.pool = self
+        with self._lock:
+            self.opened += 1
+        return conn
+
+    def acquire(self):
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._idle = queue.LifoQueue()
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            return self._connect()
+        with self._lock:
+            self.reused += 1
+        return conn
+
+    def release(self, conn):
+        """Take a connection back; False if the caller should really close it"""
+        if self._pid != os.getpid() or self._idle.qsize() >= self.size:
+            return False
+        # Never hand out a connection with a transaction still open
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+        return True
+
+    def stats(self):
+        return {
+            "size": self.size,
+            "idle": self._idle.qsize(),
+            "opened": self.opened,
+            "reused": self.reused,
+            "journal_mode": DB_JOURNAL_MODE,
+            "busy_retries": write_stats["retries"],
+            "busy_failures": write_stats["failures"],
+        }
+
+
+db_pool = ConnectionPool(DB_PATH)
+
+
+def get_connection():
+    """A connection to chat_history.db; close() returns it to the pool"""
+    return db_pool.acquire()
+
+@contextlib.contextmanager
+def write_connection():
+    """get_connection() for a write: rolled back on any error and always released"""
+    conn = get_connection()
+    try:
+        yield conn
+    except BaseException:
+        if conn.in_transaction:
+            conn.rollback()
+        raise
+    finally:
+        conn.close()
 
+@retry_on_busy
 def setup_database():
-    db_path = os.path.join(os.path.dirname(__file__), 'chat_history.db')
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-
-    # Drop old messages table if exists
-    cursor.execute('DROP TABLE IF EXISTS messages')
-
-    # Create users table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT NOT NULL UNIQUE,
-            email TEXT NOT NULL UNIQUE,
-            password TEXT NOT NULL,
-            preferred_language TEXT,
-            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-            role TEXT
-        )
-    ''')
+    # Tables and indexes come from the versioned migrations
+    from migrations import migrate
+    migrate()
 
-    # Create conversations table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS conversations (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            userid INTEGER,
-            start_time DATETIME,
-            end_time DATETIME,
-            FOREIGN KEY (userid) REFERENCES users(id)
-        )
-    ''')
+    with write_connection() as conn:
+        cursor = conn.cursor()
 
-    # Create messages table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS messages (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            conversation_id INTEGER,
-            sender TEXT NOT NULL,
-            text_content TEXT NOT NULL,
-            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-            feedback_type TEXT,
-            feedback_comment TEXT,
-            FOREIGN KEY (conversation_id) REFERENCES conversations(id)
-        )
-    ''')
+        # Insert sample data
+        # Users
+        cursor.execute('INSERT OR IGNORE INTO users (username, email, password, preferred_language, role) VALUES (?, ?, ?, ?, ?)',
+                       ('john_doe', 'john@example.com', 'ef92b778bafe771e89245b89ecbc08a44a4e166c06659911881f383d4473e94f', 'English', 'user'))
+        cursor.execute('INSERT OR IGNORE INTO users (username, email, password, preferred_language, role) VALUES (?, ?, ?, ?, ?)',
+                       ('jane_smith', 'jane@example.com', 'ef92b778bafe771e89245b89ecbc08a44a4e166c06659911881f383d4473e94f', 'Hindi', 'admin'))
 
-    # Create health_knowledge_base table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS health_knowledge_base (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            category TEXT,
-            title TEXT NOT NULL,
-            content_english TEXT,
-            content_hindi TEXT,
-            keywords TEXT,
-            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
+        # Add another admin user
+        cursor.execute('INSERT OR IGNORE INTO users (username, email, password, preferred_language, role) VALUES (?, ?, ?, ?, ?)',
+                       ('admin_user', 'admin@wellbot.com', 'ef92b778bafe771e89245b89ecbc08a44a4e166c06659911881f383d4473e94f', 'English', 'admin'))
+
+        # Sample conversations and messages only go into an empty database, so
+        # running setup again never duplicates them or touches real chat history
+        cursor.execute('SELECT COUNT(*) FROM messages')
+        if cursor.fetchone()[0] == 0:
+            # Conversations
+            cursor.execute('INSERT OR IGNORE INTO conversations (userid, start_time, end_time) VALUES (?, ?, ?)',
+                           (1, '2023-10-01 10:00:00', '2023-10-01 10:30:00'))
+            cursor.execute('INSERT OR IGNORE INTO conversations (userid, start_time, end_time) VALUES (?, ?, ?)',
+                           (2, '2023-10-02 14:00:00', '2023-10-02 14:45:00'))
+
+            # Messages
+            cursor.execute('INSERT OR IGNORE INTO messages (conversation_id, sender, text_content, feedback_type, feedback_comment, topic) VALUES (?, ?, ?, ?, ?, ?)',
+                           (1, 'user', 'Hello, I need health advice.', None, None, classify_topic('Hello, I need health advice.')))
+            cursor.execute('INSERT OR IGNORE INTO messages (conversation_id, sender, text_content, feedback_type, feedback_comment) VALUES (?, ?, ?, ?, ?)',
+                           (1, 'bot', 'Sure, what symptoms are you experiencing?', 'positive', 'Very helpful'))
+            cursor.execute('INSERT OR IGNORE INTO messages (conversation_id, sender, text_content, feedback_type, feedback_comment, topic) VALUES (?, ?, ?, ?, ?, ?)',
+                           (2, 'user', 'क्या मुझे फ्लू के लिए क्या करना चाहिए?', None, None, classify_topic('क्या मुझे फ्लू के लिए क्या करना चाहिए?')))
+
+        # Health Knowledge Base - Insert all entries from kb.json
+        import json
+        try:
+            with open('kb.json', 'r', encoding='utf-8') as f:
+                kb_data = json.load(f)
+
+            # Clear existing entries first
+            cursor.execute('DELETE FROM health_knowledge_base')
+
+            # Define category mapping based on keywords
+            def get_category(entry):
+                title = entry.get('condition', '').lower()
+                symptoms = ' '.join(entry.get('symptoms_en', [])).lower()
+
+                if any(word in symptoms for word in ['fever', 'cough', 'cold', 'headache', 'pain', 'nausea']):
+                    return 'Symptoms'
+                elif any(word in symptoms for word in ['diet', 'food', 'nutrition', 'meal']):
+                    return 'Nutrition'
+                elif any(word in symptoms for word in ['exercise', 'walk', 'fitness', 'workout']):
+                    return 'Exercise'
+                elif any(word in symptoms for word in ['stress', 'anxiety', 'depression', 'mental', 'mood']):
+                    return 'Mental Health'
+                else:
+                    return 'General Health'
+
+            for entry in kb_data:
+                category = get_category(entry)
+                title = entry.get('condition', '')
+                content_en = entry.get('answer_en', '')
+                content_hi = entry.get('answer_hi', '')
+                keywords = ', '.join(entry.get('symptoms_en', []))
+
+                cursor.execute('INSERT INTO health_knowledge_base (category, title, content_english, content_hindi, keywords) VALUES (?, ?, ?, ?, ?)',
+                               (category, title, content_en, content_hi, keywords))
+
+        except FileNotFoundError:
+            # Fallback to sample data if kb.json not found
+            cursor.execute('INSERT OR IGNORE INTO health_knowledge_base (category, title, content_english, content_hindi, keywords) VALUES (?, ?, ?, ?, ?)',
+                           ('General Health', 'Staying Hydrated', 'Drink at least 8 glasses of water daily to stay hydrated.', 'स्वास्थ्य बनाए रखने के लिए प्रतिदिन कम से कम 8 गिलास पानी पिएं।', 'hydration, water, health'))
+            cursor.execute('INSERT OR IGNORE INTO health_knowledge_base (category, title, content_english, content_hindi, keywords) VALUES (?, ?, ?, ?, ?)',
+                           ('Nutrition', 'Balanced Diet', 'Eat a variety of fruits, vegetables, proteins, and grains for a balanced diet.', 'संतुलित आहार के लिए फलों, सब्जियों, प्रोटीन और अनाज का विविधता से सेवन करें।', 'diet, nutrition, food'))
+            cursor.execute('INSERT OR IGNORE INTO health_knowledge_base (category, title, content_english, content_hindi, keywords) VALUES (?, ?, ?, ?, ?)',
+                           ('Exercise', 'Daily Walking', 'Walk for at least 30 minutes daily to maintain good health.', 'अच्छा स्वास्थ्य बनाए रखने के लिए प्रतिदिन कम से कम 30 मिनट टहलें।', 'exercise, walking, fitness'))
 
-    # Insert sample data
-    # Users
-    cursor.execute('INSERT OR IGNORE INTO users (username, email, password, preferred_language, role) VALUES (?, ?, ?, ?, ?)',
-                   ('john_doe', 'john@example.com', 'ef92b778bafe771e89245b89ecbc08a44a4e166c06659911881f383d4473e94f', 'English', 'user'))
-    cursor.execute('INSERT OR IGNORE INTO users (username, email, password, preferred_language, role) VALUES (?, ?, ?, ?, ?)',
-                   ('jane_smith', 'jane@example.com', 'ef92b778bafe771e89245b89ecbc08a44a4e166c06659911881f383d4473e94f', 'Hindi', 'admin'))
-
-    # Add another admin user
-    cursor.execute('INSERT OR IGNORE INTO users (username, email, password, preferred_language, role) VALUES (?, ?, ?, ?, ?)',
-                   ('admin_user', 'admin@wellbot.com', 'ef92b778bafe771e89245b89ecbc08a44a4e166c06659911881f383d4473e94f', 'English', 'admin'))
-
-    # Conversations
-    cursor.execute('INSERT OR IGNORE INTO conversations (userid, start_time, end_time) VALUES (?, ?, ?)',
-                   (1, '2023-10-01 10:00:00', '2023-10-01 10:30:00'))
-    cursor.execute('INSERT OR IGNORE INTO conversations (userid, start_time, end_time) VALUES (?, ?, ?)',
-                   (2, '2023-10-02 14:00:00', '2023-10-02 14:45:00'))
-
-    # Messages
-    cursor.execute('INSERT OR IGNORE INTO messages (conversation_id, sender, text_content, feedback_type, feedback_comment) VALUES (?, ?, ?, ?, ?)',
-                   (1, 'user', 'Hello, I need health advice.', None, None))
-    cursor.execute('INSERT OR IGNORE INTO messages (conversation_id, sender, text_content, feedback_type, feedback_comment) VALUES (?, ?, ?, ?, ?)',
-                   (1, 'bot', 'Sure, what symptoms are you experiencing?', 'positive', 'Very helpful'))
-    cursor.execute('INSERT OR IGNORE INTO messages (conversation_id, sender, text_content, feedback_type, feedback_comment) VALUES (?, ?, ?, ?, ?)',
-                   (2, 'user', 'क्या मुझे फ्लू के लिए क्या करना चाहिए?', None, None))
-
-    # Health Knowledge Base - Insert all entries from kb.json
-    import json
-    try:
-        with open('kb.json', 'r', encoding='utf-8') as f:
-            kb_data = json.load(f)
-
-        # Clear existing entries first
-        cursor.execute('DELETE FROM health_knowledge_base')
-
-        # Define category mapping based on keywords
-        def get_category(entry):
-            title = entry.get('condition', '').lower()
-            symptoms = ' '.join(entry.get('symptoms_en', [])).lower()
-
-            if any(word in symptoms for word in ['fever', 'cough', 'cold', 'headache', 'pain', 'nausea']):
-                return 'Symptoms'
-            elif any(word in symptoms for word in ['diet', 'food', 'nutrition', 'meal']):
-                return 'Nutrition'
-            elif any(word in symptoms for word in ['exercise', 'walk', 'fitness', 'workout']):
-                return 'Exercise'
-            elif any(word in symptoms for word in ['stress', 'anxiety', 'depression', 'mental', 'mood']):
-                return 'Mental Health'
-            else:
-                return 'General Health'
-
-        for entry in kb_data:
-            category = get_category(entry)
-            title = entry.get('condition', '')
-            content_en = entry.get('answer_en', '')
-            content_hi = entry.get('answer_hi', '')
-            keywords = ', '.join(entry.get('symptoms_en', []))
-
-            cursor.execute('INSERT INTO health_knowledge_base (category, title, content_english, content_hindi, keywords) VALUES (?, ?, ?, ?, ?)',
-                           (category, title, content_en, content_hi, keywords))
-
-    except FileNotFoundError:
-        # Fallback to sample data if kb.json not found
-        cursor.execute('INSERT OR IGNORE INTO health_knowledge_base (category, title, content_english, content_hindi, keywords) VALUES (?, ?, ?, ?, ?)',
-                       ('General Health', 'Staying Hydrated', 'Drink at least 8 glasses of water daily to stay hydrated.', 'स्वास्थ्य बनाए रखने के लिए प्रतिदिन कम से कम 8 गिलास पानी पिएं।', 'hydration, water, health'))
-        cursor.execute('INSERT OR IGNORE INTO health_knowledge_base (category, title, content_english, content_hindi, keywords) VALUES (?, ?, ?, ?, ?)',
-                       ('Nutrition', 'Balanced Diet', 'Eat a variety of fruits, vegetables, proteins, and grains for a balanced diet.', 'संतुलित आहार के लिए फलों, सब्जियों, प्रोटीन और अनाज का विविधता से सेवन करें।', 'diet, nutrition, food'))
-        cursor.execute('INSERT OR IGNORE INTO health_knowledge_base (category, title, content_english, content_hindi, keywords) VALUES (?, ?, ?, ?, ?)',
-                       ('Exercise', 'Daily Walking', 'Walk for at least 30 minutes daily to maintain good health.', 'अच्छा स्वास्थ्य बनाए रखने के लिए प्रतिदिन कम से कम 30 मिनट टहलें।', 'exercise, walking, fitness'))
-
-    conn.commit()
-    conn.close()
+        conn.commit()
 
 def insert_user(username, email, password, preferred_language='en', role='user'):
-    db_path = os.path.join(os.path.dirname(__file__), 'chat_history.db')
-    conn = sqlite3.connect(db_path, timeout=10.0)  # Add timeout to avoid locks
-    cursor = conn.cursor()
     try:
+        return _insert_user(username, email, password, preferred_language, role)
+    except sqlite3.OperationalError as e:
+        print(f"Database error: {e}")
+        return None
+
+@retry_on_busy
+def _insert_user(username, email, password, preferred_language, role):
+    with write_connection() as conn:
+        cursor = conn.cursor()
         cursor.execute('INSERT OR IGNORE INTO users (username, email, password, preferred_language, role) VALUES (?, ?, ?, ?, ?)',
                        (username, email, password, preferred_language, role))
         user_id = cursor.lastrowid
-        if user_id == 0:  # User already exists, get existing ID
+        # lastrowid isn't reset by an ignored insert on a reused connection
+        if cursor.rowcount == 0:  # User already exists, get existing ID
             cursor.execute('SELECT id FROM users WHERE email = ?', (email,))
             result = cursor.fetchone()
             if result:
@@ -149,269 +280,337 @@ def insert_user(username, email, password, preferred_language='en', role='user')
                 # This shouldn't happen, but handle it gracefully
                 user_id = None
         conn.commit()
-    except sqlite3.OperationalError as e:
-        print(f"Database error: {e}")
-        user_id = None
-    finally:
-        conn.close()
     return user_id
 
+@retry_on_busy
 def insert_conversation(userid, start_time=None):
-    db_path = os.path.join(os.path.dirname(__file__), 'chat_history.db')
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    if start_time is None:
-        start_time = 'CURRENT_TIMESTAMP'
-    else:
-        start_time = f"'{start_time}'"
-    cursor.execute(f'INSERT INTO conversations (userid, start_time) VALUES (?, {start_time})', (userid,))
-    conversation_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
+    with write_connection() as conn:
+        cursor = conn.cursor()
+        if start_time is None:
+            start_time = 'CURRENT_TIMESTAMP'
+        else:
+            start_time = f"'{start_time}'"
+        cursor.execute(f'INSERT INTO conversations (userid, start_time) VALUES (?, {start_time})', (userid,))
+        conversation_id = cursor.lastrowid
+        conn.commit()
     return conversation_id
 
-def insert_message(conversation_id, sender, text_content, feedback_type=None, feedback_comment=None):
-    db_path = os.path.join(os.path.dirname(__file__), 'chat_history.db')
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
+@retry_on_busy
+def insert_message(conversation_id, sender, text_content, feedback_type=None, feedback_comment=None,
+                   reply_to_message_id=None, language=None, intent=None):
+    with write_connection() as conn:
+        cursor = conn.cursor()
 
-    cursor.execute('''
-        INSERT INTO messages (conversation_id, sender, text_content, feedback_type, feedback_comment)
-        VALUES (?, ?, ?, ?, ?)
-    ''', (conversation_id, sender, text_content, feedback_type, feedback_comment))
+        cursor.execute('''
+            INSERT INTO messages (conversation_id, sender, text_content, feedback_type, feedback_comment, topic,
+                                  reply_to_message_id, language, intent)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (conversation_id, sender, text_content, feedback_type, feedback_comment,
+              message_topic(sender, text_content), reply_to_message_id, language, intent))
 
-    message_id = cursor.lastrowid  # ✅ Get the auto-generated ID
-    conn.commit()
-    conn.close()
+        message_id = cursor.lastrowid  # ✅ Get the auto-generated ID
+        conn.commit()
     return message_id  # ✅ Return message_id to app.py
 
+@retry_on_busy
+def reserve_message_ids(count):
+    """Reserve ``count`` message ids; returns the first of the consecutive block.
+
+    Bumping the AUTOINCREMENT counter means no other insert, in this process
+    or another, can be handed one of these ids.
+    """
+    with write_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = 'messages'")
+        row = cursor.fetchone()
+        if row is None:
+            cursor.execute('SELECT COALESCE(MAX(id), 0) FROM messages')
+            last_id = cursor.fetchone()[0]
+            cursor.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('messages', ?)", (last_id + count,))
+        else:
+            last_id = row[0]
+            cursor.execute("UPDATE sqlite_sequence SET seq = ? WHERE name = 'messages'", (last_id + count,))
+        conn.commit()
+    return last_id + 1
+
+@retry_on_busy
+def insert_messages(rows):
+    """Insert (id, conversation_id, sender, text_content, timestamp, reply_to_message_id,
+    language, intent) rows in one transaction"""
+    with write_connection() as conn:
+        cursor = conn.cursor()
+        cursor.executemany('''
+            INSERT INTO messages (id, conversation_id, sender, text_content, timestamp, reply_to_message_id,
+                                  language, intent, topic)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', [row + (message_topic(row[2], row[3]),) for row in rows])
+        conn.commit()
+
+@retry_on_busy
 def update_conversation_end_time(conversation_id):
-    db_path = os.path.join(os.path.dirname(__file__), 'chat_history.db')
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    cursor.execute('UPDATE conversations SET end_time = CURRENT_TIMESTAMP WHERE id = ?', (conversation_id,))
-    conn.commit()
-    conn.close()
+    with write_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('UPDATE conversations SET end_time = CURRENT_TIMESTAMP WHERE id = ?', (conversation_id,))
+        conn.commit()
 
 def get_user_by_email(email):
-    db_path = os.path.join(os.path.dirname(__file__), 'chat_history.db')
-    conn = sqlite3.connect(db_path)
+    conn = get_connection()
     cursor = conn.cursor()
     cursor.execute('SELECT * FROM users WHERE email = ?', (email,))
     user = cursor.fetchone()
     conn.close()
     return user
 
+@retry_on_busy
 def get_or_create_conversation(user_id):
-    db_path = os.path.join(os.path.dirname(__file__), 'chat_history.db')
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    # Get the latest conversation for this user that hasn't ended
-    cursor.execute('SELECT id FROM conversations WHERE userid = ? AND end_time IS NULL ORDER BY start_time DESC LIMIT 1', (user_id,))
-    conversation = cursor.fetchone()
-    if conversation:
-        conversation_id = conversation[0]
-    else:
-        # Create new conversation
-        cursor.execute('INSERT INTO conversations (userid, start_time) VALUES (?, CURRENT_TIMESTAMP)', (user_id,))
-        conversation_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
+    with write_connection() as conn:
+        cursor = conn.cursor()
+        # Get the latest conversation for this user that hasn't ended
+        cursor.execute('SELECT id FROM conversations WHERE userid = ? AND end_time IS NULL ORDER BY start_time DESC LIMIT 1', (user_id,))
+        conversation = cursor.fetchone()
+        if conversation:
+            conversation_id = conversation[0]
+        else:
+            # Create new conversation
+            cursor.execute('INSERT INTO conversations (userid, start_time) VALUES (?, CURRENT_TIMESTAMP)', (user_id,))
+            conversation_id = cursor.lastrowid
+        conn.commit()
     return conversation_id
 
+@retry_on_busy
 def update_message_feedback(message_id, feedback_type, feedback_comment=None):
-    db_path = os.path.join(os.path.dirname(__file__), 'chat_history.db')
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    cursor.execute('UPDATE messages SET feedback_type = ?, feedback_comment = ? WHERE id = ?', (feedback_type, feedback_comment, message_id))
-    conn.commit()
-    conn.close()
+    with write_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('UPDATE messages SET feedback_type = ?, feedback_comment = ? WHERE id = ?', (feedback_type, feedback_comment, message_id))
+        conn.commit()
+
+def get_feedback_stats(metrics=None):
+    metrics = get_metrics() if metrics is None else metrics
+    prefix = 'assistant_feedback:'
+    return {name[len(prefix):]: value for name, value in metrics.items()
+            if name.startswith(prefix) and value}
 
-def get_feedback_stats():
-    db_path = os.path.join(os.path.dirname(__file__), 'chat_history.db')
-    conn = sqlite3.connect(db_path)
+def get_kb_entries():
+    conn = get_connection()
     cursor = conn.cursor()
-    cursor.execute('''
-        SELECT feedback_type, COUNT(*) as count
-        FROM messages
-        WHERE sender = 'assistant' AND feedback_type IS NOT NULL
-        GROUP BY feedback_type
-    ''')
-    stats = cursor.fetchall()
+    cursor.execute('SELECT * FROM health_knowledge_base')
+    entries = cursor.fetchall()
     conn.close()
-    return dict(stats)
+    return entries
+
+# Columns /admin/kb can project, in table order
+KB_FIELDS = ('id', 'category', 'title', 'content_english', 'content_hindi', 'keywords', 'updated_at')
 
-def get_common_queries():
-    db_path = os.path.join(os.path.dirname(__file__), 'chat_history.db')
-    conn = sqlite3.connect(db_path)
+def get_kb_version():
+    """Counter bumped by triggers on every KB insert, update and delete"""
+    conn = get_connection()
     cursor = conn.cursor()
-    cursor.execute('''
-        SELECT text_content, COUNT(*) as count
-        FROM messages
-        WHERE sender = 'user'
-        GROUP BY text_content
-        ORDER BY count DESC
-        LIMIT 10
-    ''')
-    queries = cursor.fetchall()
+    cursor.execute('SELECT version FROM kb_version')
+    row = cursor.fetchone()
     conn.close()
-    return queries
-
-def get_kb_entries():
-    db_path = os.path.join(os.path.dirname(__file__), 'chat_history.db')
-    conn = sqlite3.connect(db_path)
+    return row[0] if row else 0
+
+def list_kb_entries(after=0, limit=100, fields=KB_FIELDS, category=None, keyword=None):
+    """One page of KB rows with id > after, ordered by id; fields must come from KB_FIELDS"""
+    sql = f"SELECT {', '.join(fields)} FROM health_knowledge_base WHERE id > ?"
+    params = [after]
+    if category is not None:
+        sql += ' AND category = ?'
+        params.append(category)
+    if keyword is not None:
+        pattern = '%' + keyword.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        sql += " AND (title LIKE ? ESCAPE '\\' OR keywords LIKE ? ESCAPE '\\')"
+        params += [pattern, pattern]
+    sql += ' ORDER BY id LIMIT ?'
+    params.append(limit)
+
+    conn = get_connection()
     cursor = conn.cursor()
-    cursor.execute('SELECT * FROM health_knowledge_base')
+    cursor.execute(sql, params)
     entries = cursor.fetchall()
     conn.close()
     return entries
 
-def add_kb_entry(category, title, content_english, content_hindi, keywords):
-    db_path = os.path.join(os.path.dirname(__file__), 'chat_history.db')
-    conn = sqlite3.connect(db_path)
+def get_kb_entry(entry_id):
+    conn = get_connection()
     cursor = conn.cursor()
-    cursor.execute('INSERT INTO health_knowledge_base (category, title, content_english, content_hindi, keywords) VALUES (?, ?, ?, ?, ?)',
-                   (category, title, content_english, content_hindi, keywords))
-    entry_id = cursor.lastrowid
-    conn.commit()
+    cursor.execute('SELECT * FROM health_knowledge_base WHERE id = ?', (entry_id,))
+    entry = cursor.fetchone()
     conn.close()
+    return entry
+
+@retry_on_busy
+def add_kb_entry(category, title, content_english, content_hindi, keywords):
+    with write_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('INSERT INTO health_knowledge_base (category, title, content_english, content_hindi, keywords) VALUES (?, ?, ?, ?, ?)',
+                       (category, title, content_english, content_hindi, keywords))
+        entry_id = cursor.lastrowid
+        conn.commit()
     return entry_id
 
+@retry_on_busy
 def update_kb_entry(entry_id, category, title, content_english, content_hindi, keywords):
-    db_path = os.path.join(os.path.dirname(__file__), 'chat_history.db')
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    cursor.execute('UPDATE health_knowledge_base SET category = ?, title = ?, content_english = ?, content_hindi = ?, keywords = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?',
-                   (category, title, content_english, content_hindi, keywords, entry_id))
-    conn.commit()
-    conn.close()
+    with write_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('UPDATE health_knowledge_base SET category = ?, title = ?, content_english = ?, content_hindi = ?, keywords = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?',
+                       (category, title, content_english, content_hindi, keywords, entry_id))
+        conn.commit()
 
+@retry_on_busy
 def delete_kb_entry(entry_id):
-    db_path = os.path.join(os.path.dirname(__file__), 'chat_history.db')
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    cursor.execute('DELETE FROM health_knowledge_base WHERE id = ?', (entry_id,))
-    conn.commit()
-    conn.close()
+    with write_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('DELETE FROM health_knowledge_base WHERE id = ?', (entry_id,))
+        conn.commit()
 
-def count_total_users():
-    db_path = os.path.join(os.path.dirname(__file__), 'chat_history.db')
-    conn = sqlite3.connect(db_path)
+# ---------------- Aggregate counters ----------------
+# Kept up to date by the triggers in metrics.py; each read is one small table
+# instead of a scan of messages. Pass one get_metrics() result to several of
+# these to read a consistent set with a single query.
+def get_metrics():
+    conn = get_connection()
     cursor = conn.cursor()
-    cursor.execute('SELECT COUNT(*) FROM users')
-    total = cursor.fetchone()[0]
+    cursor.execute('SELECT name, value FROM metrics')
+    metrics = dict(cursor.fetchall())
     conn.close()
-    return total
+    return metrics
 
-def count_total_conversations():
-    db_path = os.path.join(os.path.dirname(__file__), 'chat_history.db')
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    cursor.execute('SELECT COUNT(DISTINCT conversation_id) FROM messages')
-    total = cursor.fetchone()[0]
-    conn.close()
-    return total
+def count_total_users(metrics=None):
+    return (get_metrics() if metrics is None else metrics).get('users', 0)
 
-def count_total_messages():
-    db_path = os.path.join(os.path.dirname(__file__), 'chat_history.db')
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    cursor.execute('SELECT COUNT(*) FROM messages')
-    total = cursor.fetchone()[0]
-    conn.close()
-    return total
+def count_total_conversations(metrics=None):
+    return (get_metrics() if metrics is None else metrics).get('conversations', 0)
 
-def get_positive_feedback_ratio():
-    db_path = os.path.join(os.path.dirname(__file__), 'chat_history.db')
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    cursor.execute('SELECT COUNT(*) FROM messages WHERE feedback_type = "positive"')
-    positive = cursor.fetchone()[0]
-    cursor.execute('SELECT COUNT(*) FROM messages WHERE feedback_type IS NOT NULL')
-    total_feedback = cursor.fetchone()[0]
-    conn.close()
+def count_total_messages(metrics=None):
+    return (get_metrics() if metrics is None else metrics).get('messages', 0)
+
+def get_positive_feedback_ratio(metrics=None):
+    metrics = get_metrics() if metrics is None else metrics
+    positive = metrics.get('feedback:positive', 0)
+    total_feedback = sum(value for name, value in metrics.items() if name.startswith('feedback:'))
     if total_feedback == 0:
         return 0
     return round((positive / total_feedback) * 100, 2)
 
-def get_query_trends():
-    """Get query trends over the last 7 days (weekly)"""
-    db_path = os.path.join(os.path.dirname(__file__), 'chat_history.db')
-    conn = sqlite3.connect(db_path)
+# ---------------- Trends ----------------
+# Answered from the daily_metrics rollup (see metrics.py), so the cost follows
+# the length of the window, not of the history. Week buckets start on Monday,
+# month buckets on the 1st; a bucket cut by the window only counts its days
+# inside it.
+TREND_GRANULARITIES = {
+    'day': "day",
+    'week': "date(day, 'weekday 0', '-6 days')",
+    'month': "date(day, 'start of month')",
+}
+
+def _trend_periods(start, end, granularity):
+    """Every bucket start from start to end, so empty periods show up as zeros"""
+    if granularity == 'week':
+        period = start - datetime.timedelta(days=start.weekday())
+    elif granularity == 'month':
+        period = start.replace(day=1)
+    else:
+        period = start
+    while period <= end:
+        yield period
+        if granularity == 'week':
+            period += datetime.timedelta(days=7)
+        elif granularity == 'month':
+            period = (period + datetime.timedelta(days=32)).replace(day=1)
+        else:
+            period += datetime.timedelta(days=1)
+
+def get_trends(start, end, granularity='day', language=None, intent=None):
+    """Queries and positive/negative feedback per period between two dates (inclusive)"""
+    bucket = TREND_GRANULARITIES[granularity]
+    sql = f'''
+        SELECT {bucket} AS period, SUM(queries), SUM(positive), SUM(negative)
+        FROM daily_metrics
+        WHERE day BETWEEN ? AND ?
+    '''
+    params = [start.isoformat(), end.isoformat()]
+    if language is not None:
+        sql += ' AND language = ?'
+        params.append(language)
+    if intent is not None:
+        sql += ' AND intent = ?'
+        params.append(intent)
+    sql += ' GROUP BY period'
+
+    conn = get_connection()
     cursor = conn.cursor()
-
-    # Get daily query counts for the last 7 days
-    cursor.execute('''
-        SELECT date(timestamp) as day,
-                COUNT(*) as count
-        FROM messages
-        WHERE sender = 'user'
-        GROUP BY day
-        ORDER BY day
-    ''')
-    trends = cursor.fetchall()
+    cursor.execute(sql, params)
+    rows = {period: (queries, positive, negative) for period, queries, positive, negative in cursor.fetchall()}
     conn.close()
 
-    # Convert to dict with day names
-    day_names = ['Sun', 'Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat']
-    result = {}
-    for day, count in trends:
-        # Convert date to day name
-        from datetime import datetime
-        day_name = day_names[datetime.strptime(day, '%Y-%m-%d').weekday()]
-        result[day_name] = count
+    trends = []
+    for period in _trend_periods(start, end, granularity):
+        queries, positive, negative = rows.get(period.isoformat(), (0, 0, 0))
+        trends.append({'period': period.isoformat(), 'queries': queries,
+                       'positive': positive, 'negative': negative})
+    return trends
+
+def _last_seven_days():
+    today = datetime.datetime.utcnow().date()  # message timestamps are UTC
+    return get_trends(today - datetime.timedelta(days=6), today)
 
-    return result
+def get_query_trends():
+    """Get query counts for each of the last 7 days, keyed by weekday name"""
+    return {datetime.date.fromisoformat(day['period']).strftime('%a'): day['queries']
+            for day in _last_seven_days()}
+
+def get_feedback_trends():
+    """Get positive and negative feedback counts for each of the last 7 days, keyed by weekday name"""
+    return {datetime.date.fromisoformat(day['period']).strftime('%a'):
+                {'positive': day['positive'], 'negative': day['negative']}
+            for day in _last_seven_days()}
+
+# ---------------- Health topics ----------------
+# User messages are classified once, on insert, into the messages.topic column
+# (first matching topic wins; OTHER_TOPIC when none match). Assistant
+# messages have no topic; NULL on a user message means not classified yet
+# (see backfill.py).
+HEALTH_TOPICS = [
+    ('Symptoms', ['symptom', 'pain', 'fever', 'cough', 'headache', 'nausea', 'tired', 'sick']),
+    ('Self-care', ['care', 'treatment', 'medicine', 'remedy', 'heal', 'recovery']),
+    ('Nutrition', ['diet', 'food', 'eat', 'nutrition', 'meal', 'drink', 'water']),
+    ('Exercise', ['exercise', 'walk', 'run', 'gym', 'fitness', 'workout', 'sport']),
+    ('Mental Health', ['stress', 'anxiety', 'depression', 'mood', 'mental', 'mind', 'sleep']),
+    ('General Health', ['health', 'wellness', 'body', 'medical', 'doctor']),
+]
+OTHER_TOPIC = 'Other'
+
+def classify_topic(text):
+    msg_lower = text.lower()
+    for topic, keywords in HEALTH_TOPICS:
+        if any(word in msg_lower for word in keywords):
+            return topic
+    return OTHER_TOPIC
+
+def message_topic(sender, text_content):
+    return classify_topic(text_content) if sender == 'user' else None
 
 def get_health_topics_stats():
     """Get statistics on health topics covered"""
-    db_path = os.path.join(os.path.dirname(__file__), 'chat_history.db')
-    conn = sqlite3.connect(db_path)
+    conn = get_connection()
     cursor = conn.cursor()
 
-    # Analyze user messages for health topics
+    # One pass over idx_messages_sender_topic; no message text is read
     cursor.execute('''
-        SELECT text_content
+        SELECT topic, COUNT(*)
         FROM messages
         WHERE sender = 'user'
+        GROUP BY topic
     ''')
-    user_messages = cursor.fetchall()
+    counts = dict(cursor.fetchall())
     conn.close()
 
-    # Categorize messages by health topics
-    topics = {
-        'Symptoms': 0,
-        'Self-care': 0,
-        'Nutrition': 0,
-        'Exercise': 0,
-        'Mental Health': 0,
-        'General Health': 0
-    }
-
-    symptom_keywords = ['symptom', 'pain', 'fever', 'cough', 'headache', 'nausea', 'tired', 'sick']
-    selfcare_keywords = ['care', 'treatment', 'medicine', 'remedy', 'heal', 'recovery']
-    nutrition_keywords = ['diet', 'food', 'eat', 'nutrition', 'meal', 'drink', 'water']
-    exercise_keywords = ['exercise', 'walk', 'run', 'gym', 'fitness', 'workout', 'sport']
-    mental_keywords = ['stress', 'anxiety', 'depression', 'mood', 'mental', 'mind', 'sleep']
-    general_keywords = ['health', 'wellness', 'body', 'medical', 'doctor']
-
-    total_messages = len(user_messages)
-
-    for (message,) in user_messages:
-        msg_lower = message.lower()
-
-        if any(word in msg_lower for word in symptom_keywords):
-            topics['Symptoms'] += 1
-        elif any(word in msg_lower for word in selfcare_keywords):
-            topics['Self-care'] += 1
-        elif any(word in msg_lower for word in nutrition_keywords):
-            topics['Nutrition'] += 1
-        elif any(word in msg_lower for word in exercise_keywords):
-            topics['Exercise'] += 1
-        elif any(word in msg_lower for word in mental_keywords):
-            topics['Mental Health'] += 1
-        elif any(word in msg_lower for word in general_keywords):
-            topics['General Health'] += 1
+    topics = {topic: counts.get(topic, 0) for topic, _ in HEALTH_TOPICS}
+    # Percentages of the classified messages, as the keyword scan over all of
+    # them gave; rows the backfill hasn't reached yet (NULL) don't count
+    total_messages = sum(count for topic, count in counts.items() if topic is not None)
 
     # Convert to percentages
     if total_messages > 0:
@@ -423,53 +622,16 @@ def get_health_topics_stats():
 
     return topics
 
-def get_feedback_trends():
-    """Get feedback trends over the last 7 days (positive and negative counts per day)"""
-    db_path = os.path.join(os.path.dirname(__file__), 'chat_history.db')
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-
-    # Get daily feedback counts for the last 7 days
-    cursor.execute('''
-        SELECT date(timestamp) as day, feedback_type, COUNT(*) as count
-        FROM messages
-        WHERE sender = 'assistant' AND feedback_type IS NOT NULL
-        GROUP BY day, feedback_type
-        ORDER BY day
-    ''')
-    trends = cursor.fetchall()
-    conn.close()
-
-    # Convert to dict with day names
-    day_names = ['Sun', 'Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat']
-    result = {}
-    for day, feedback_type, count in trends:
-        from datetime import datetime
-        day_name = day_names[datetime.strptime(day, '%Y-%m-%d').weekday()]
-        if day_name not in result:
-            result[day_name] = {'positive': 0, 'negative': 0}
-        result[day_name][feedback_type] = count
-
-    # Ensure all days are present
-    for day in day_names:
-        if day not in result:
-            result[day] = {'positive': 0, 'negative': 0}
-
-    return result
-
 def get_recent_feedback():
     """Get recent feedback entries"""
-    db_path = os.path.join(os.path.dirname(__file__), 'chat_history.db')
-    conn = sqlite3.connect(db_path)
+    conn = get_connection()
     cursor = conn.cursor()
 
     cursor.execute('''
         SELECT m.feedback_type, m.feedback_comment, m.timestamp,
                u.text_content as user_message
         FROM messages m
-        JOIN messages u ON m.conversation_id = u.conversation_id
-            AND u.sender = 'user'
-            AND u.timestamp < m.timestamp
+        JOIN messages u ON u.id = m.reply_to_message_id
         WHERE m.sender = 'assistant' AND m.feedback_type IS NOT NULL
         ORDER BY m.timestamp DESC
         LIMIT 10
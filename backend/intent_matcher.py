@@ -0,0 +1,80 @@
+import re
+
+# Word characters for boundary checks: \w plus Devanagari vowel signs and
+# viramas (which \w leaves out), minus the danda punctuation marks.
+WORD = re.compile(r"[\w\u0900-\u0963\u0966-\u097F]+")
+
+# Inflections allowed after a Latin keyword of at least MIN_STEM_LEN letters,
+# so "cough" still matches "coughing" while "hi" never matches "his"
+SUFFIXES = ("s", "es", "ed", "ing", "ish", "y")
+MIN_STEM_LEN = 4
+
+
+def _is_word_char(char):
+    return char.isalnum() or char == "_" or ("\u0900" <= char <= "\u097F" and char not in "\u0964\u0965")
+
+
+class IntentMatcher:
+    """Scores every intent from one pass over the message.
+
+    Keywords from ``intent_keywords`` go into a single trie that is walked from
+    each word start, so a keyword only counts as a whole word (Latin or
+    Devanagari). Each distinct keyword hit adds its word count to its intent's
+    score, and scores are turned into confidences with ``fallback_weight`` of
+    probability mass reserved for "none of the above".
+    """
+
+    def __init__(self, intent_keywords, fallback_weight=0.5):
+        self.intents = list(intent_keywords)
+        self.fallback_weight = fallback_weight
+        self.trie = {}
+        for intent, keywords in intent_keywords.items():
+            for keyword in keywords:
+                keyword = keyword.lower()
+                node = self.trie
+                for char in keyword:
+                    node = node.setdefault(char, {})
+                node.setdefault(None, []).append((intent, keyword))
+
+    def _ends_word(self, text, end, keyword):
+        """Whether a keyword ending at ``end`` ends on a word boundary (allowing suffixes)"""
+        if end == len(text) or not _is_word_char(text[end]):
+            return True
+        if len(keyword) < MIN_STEM_LEN or not keyword[-1].isascii():
+            return False
+        for suffix in SUFFIXES:
+            stop = end + len(suffix)
+            if text.startswith(suffix, end) and (stop == len(text) or not _is_word_char(text[stop])):
+                return True
+        return False
+
+    def hits(self, text):
+        """Distinct keywords found in ``text`` (already lowercased), per intent"""
+        found = {}
+        length = len(text)
+        for word in WORD.finditer(text):
+            start = word.start()
+            node = self.trie.get(text[start])
+            end = start + 1
+            while node is not None:
+                for intent, keyword in node.get(None, ()):
+                    if self._ends_word(text, end, keyword):
+                        found.setdefault(intent, set()).add(keyword)
+                if end == length:
+                    break
+                node = node.get(text[end])
+                end += 1
+        return found
+
+    def rank(self, text):
+        """[(intent, confidence), ...] best first, ending with fallback"""
+        scores = {
+            intent: sum(len(keyword.split()) for keyword in keywords)
+            for intent, keywords in self.hits(text).items()
+        }
+        total = sum(scores.values()) + self.fallback_weight
+        # Higher score first; ties keep the order intents were declared in
+        ranked = sorted(scores, key=lambda intent: (-scores[intent], self.intents.index(intent)))
+        distribution = [(intent, round(scores[intent] / total, 3)) for intent in ranked]
+        distribution.append(("fallback", round(self.fallback_weight / total, 3)))
+        return distribution
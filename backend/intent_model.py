@@ -0,0 +1,213 @@
+import json
+import os
+import sys
+import time
+import zlib
+
+import numpy as np
+
+# Small CPU-only intent classifier: hashed character n-grams (the same char_wb
+# 1-4 grams the Rasa config uses) feeding a NumPy softmax regression.
+#
+#   python intent_model.py train      # fit on all examples, write intent_model.npz
+#   python intent_model.py evaluate   # leave-one-out accuracy/latency vs keywords
+#
+# SimpleNLU only consults the model when INTENT_MODEL is set, and then only for
+# the intents it was trained on. Leave it unset until `evaluate` shows the
+# combined answer beating the keywords alone.
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+EXAMPLES_JSON = os.path.join(BASE_DIR, 'intents_examples.json')
+EXAMPLES_YML = os.path.join(BASE_DIR, 'data', 'nlu.yml')
+MODEL_PATH = os.path.join(BASE_DIR, 'intent_model.npz')
+
+N_FEATURES = 2 ** 12
+MIN_NGRAM = 1
+MAX_NGRAM = 4
+
+
+# ---------------- Training data ----------------
+def _read_nlu_yml(path):
+    """Intent examples from a Rasa nlu.yml ("- intent:" blocks of "- text" lines)"""
+    examples = {}
+    intent = None
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            stripped = line.strip()
+            if stripped.startswith('- intent:'):
+                intent = stripped[len('- intent:'):].strip()
+                examples.setdefault(intent, [])
+            elif intent and line.startswith('    - '):
+                examples[intent].append(stripped[2:].strip())
+            elif stripped and not line.startswith(' '):
+                intent = None
+    return examples
+
+
+def load_examples(json_path=EXAMPLES_JSON, yml_path=EXAMPLES_YML):
+    """Deduplicated (text, intent) pairs from intents_examples.json and data/nlu.yml"""
+    merged = {}
+    if os.path.exists(json_path):
+        with open(json_path, 'r', encoding='utf-8') as f:
+            for intent, block in json.load(f).items():
+                merged.setdefault(intent, []).extend(block.get('examples', []))
+    if os.path.exists(yml_path):
+        for intent, texts in _read_nlu_yml(yml_path).items():
+            merged.setdefault(intent, []).extend(texts)
+
+    pairs = []
+    seen = set()
+    for intent, texts in merged.items():
+        for text in texts:
+            if (text, intent) not in seen:
+                seen.add((text, intent))
+                pairs.append((text, intent))
+    return pairs
+
+
+# ---------------- Features ----------------
+def featurize(text, n_features=N_FEATURES):
+    """(indices, values) of the L2-normalized hashed char n-gram vector"""
+    counts = {}
+    for word in text.lower().split():
+        padded = f" {word} "
+        for n in range(MIN_NGRAM, MAX_NGRAM + 1):
+            for i in range(len(padded) - n + 1):
+                index = zlib.crc32(padded[i:i + n].encode('utf-8')) % n_features
+                counts[index] = counts.get(index, 0) + 1
+    if not counts:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+    indices = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+    values = np.log1p(np.fromiter(counts.values(), dtype=np.float32, count=len(counts)))
+    return indices, values / np.linalg.norm(values)
+
+
+def _feature_matrix(texts, n_features):
+    X = np.zeros((len(texts), n_features), dtype=np.float32)
+    for row, text in enumerate(texts):
+        indices, values = featurize(text, n_features)
+        np.add.at(X[row], indices, values)
+    return X
+
+
+# ---------------- Model ----------------
+class IntentModel:
+    """Softmax regression over hashed char n-grams"""
+
+    def __init__(self, labels, weights, bias, n_features=N_FEATURES):
+        self.labels = list(labels)
+        self.weights = np.asarray(weights, dtype=np.float32)
+        self.bias = np.asarray(bias, dtype=np.float32)
+        self.n_features = n_features
+
+    @classmethod
+    def train(cls, pairs, n_features=N_FEATURES, epochs=300, learning_rate=2.0, l2=1e-4):
+        labels = sorted({intent for _, intent in pairs})
+        X = _feature_matrix([text for text, _ in pairs], n_features)
+        y = np.array([labels.index(intent) for _, intent in pairs])
+        Y = np.eye(len(labels), dtype=np.float32)[y]
+
+        weights = np.zeros((n_features, len(labels)), dtype=np.float32)
+        bias = np.zeros(len(labels), dtype=np.float32)
+        for _ in range(epochs):
+            probs = _softmax(X @ weights + bias)
+            error = (probs - Y) / len(pairs)
+            weights -= learning_rate * (X.T @ error + l2 * weights)
+            bias -= learning_rate * error.sum(axis=0)
+        return cls(labels, weights, bias, n_features)
+
+    def predict(self, text):
+        """[(intent, probability), ...] best first"""
+        indices, values = featurize(text, self.n_features)
+        logits = values @ self.weights[indices] + self.bias
+        probs = _softmax(logits)
+        order = np.argsort(-probs)
+        return [(self.labels[i], round(float(probs[i]), 3)) for i in order]
+
+    def override(self, keyword_ranking, text, threshold):
+        """The model's ranking if it should replace ``keyword_ranking``, else None.
+
+        Only a keyword intent the model was trained on is overridden; on the
+        others it has never seen an example and would just be guessing.
+        """
+        if keyword_ranking[0][0] not in self.labels:
+            return None
+        ranking = self.predict(text)
+        return ranking if ranking[0][1] >= threshold else None
+
+    def save(self, path=MODEL_PATH):
+        np.savez_compressed(
+            path,
+            labels=np.array(self.labels),
+            weights=self.weights.astype(np.float16),
+            bias=self.bias,
+            n_features=np.array(self.n_features),
+        )
+
+    @classmethod
+    def load(cls, path=MODEL_PATH):
+        with np.load(path) as data:
+            return cls(
+                [str(label) for label in data['labels']],
+                data['weights'].astype(np.float32),
+                data['bias'],
+                int(data['n_features']),
+            )
+
+
+def _softmax(logits):
+    shifted = np.exp(logits - logits.max(axis=-1, keepdims=True))
+    return shifted / shifted.sum(axis=-1, keepdims=True)
+
+
+# ---------------- CLI ----------------
+def evaluate(pairs, threshold=0.5):
+    """Leave-one-out accuracy and per-call latency of the model vs the keywords production uses"""
+    from advanced_nlu import SimpleNLU
+
+    # Keyword path only: no transformer models, no translation cache on disk
+    nlu = SimpleNLU(load_models=False, background=False, translation_cache_path='')
+    lowered = [nlu.analyze(text).lowered for text, _ in pairs]
+    keyword_rankings = [nlu.intent_matcher.rank(text) for text in lowered]
+
+    model_correct = combined_correct = overridden = 0
+    for held_out, (_, intent) in enumerate(pairs):
+        model = IntentModel.train(pairs[:held_out] + pairs[held_out + 1:])
+        model_correct += model.predict(lowered[held_out])[0][0] == intent
+        # What SimpleNLU.parse answers with the model loaded
+        ranking = model.override(keyword_rankings[held_out], lowered[held_out], threshold)
+        overridden += ranking is not None
+        combined_correct += (ranking or keyword_rankings[held_out])[0][0] == intent
+    keyword_correct = sum(ranking[0][0] == intent for ranking, (_, intent) in zip(keyword_rankings, pairs))
+
+    model = IntentModel.train(pairs)
+    texts = lowered * 20
+    start = time.perf_counter()
+    for text in texts:
+        model.predict(text)
+    model_ms = (time.perf_counter() - start) * 1000 / len(texts)
+    start = time.perf_counter()
+    for text in texts:
+        nlu.intent_matcher.rank(text)
+    keyword_ms = (time.perf_counter() - start) * 1000 / len(texts)
+
+    print(f"{len(pairs)} examples, {len(model.labels)} intents: {', '.join(model.labels)}")
+    print(f"{'backend':<10}{'accuracy':>10}{'latency (ms)':>15}")
+    print(f"{'model':<10}{model_correct / len(pairs):>10.1%}{model_ms:>15.3f}   (leave-one-out)")
+    print(f"{'keyword':<10}{keyword_correct / len(pairs):>10.1%}{keyword_ms:>15.3f}   "
+          f"(in-sample: keywords were written from these examples)")
+    print(f"{'combined':<10}{combined_correct / len(pairs):>10.1%}{'':>15}   "
+          f"(leave-one-out, threshold {threshold}: model overrode {overridden} keyword answers)")
+    if combined_correct <= keyword_correct:
+        print("The model does not beat the keywords; leave INTENT_MODEL unset.")
+
+
+if __name__ == '__main__':
+    command = sys.argv[1] if len(sys.argv) > 1 else 'train'
+    examples = load_examples()
+    if command == 'evaluate':
+        evaluate(examples)
+    else:
+        IntentModel.train(examples).save()
+        print(f"Trained on {len(examples)} examples, saved to {MODEL_PATH} "
+              f"({os.path.getsize(MODEL_PATH) // 1024} KB)")
@@ -0,0 +1,471 @@
+import threading
+from array import array
+from bisect import bisect_left
+from collections import deque
+
+from text_analysis import TextAnalysis, lowered_text, tokenize
+
+
+# ---------------- Keyword extraction ----------------
+def kb_keywords(item, language):
+    """Keywords the chat route matches a KB item on for the given language"""
+    if language == "hi":
+        keywords = item.get("symptoms_hi", []) + [item.get("condition_hi", "").lower()]
+    elif language == "en":
+        keywords = item.get("symptoms_en", []) + [item.get("condition", "").lower()]
+    else:
+        return []
+    # An entry without e.g. a Hindi title must not match every Hindi message
+    return [word for word in keywords if word]
+
+
+# ---------------- Aho-Corasick automaton ----------------
+class KeywordAutomaton:
+    """Aho-Corasick automaton mapping keyword hits to KB entry positions.
+
+    The trie is grown in dicts by add(); build() then flattens it into the
+    integer arrays named in ARRAYS, which are all search() reads:
+
+      edge_start[s]:edge_start[s + 1]  state s's edges in edge_chars/edge_next,
+                                       sorted by code point
+      fail[s]                          failure link of state s
+      out_start[s]:out_start[s + 1]    entry positions in out_pos that end at s
+
+    Flat arrays take a fraction of the memory of per-state dicts and can be
+    mapped straight out of a startup artifact (from_arrays), so all workers
+    share one copy of the pages.
+    """
+
+    ARRAYS = ("edge_start", "edge_chars", "edge_next", "fail", "out_start", "out_pos")
+
+    def __init__(self):
+        self._goto = [{}]
+        self._output = [set()]
+        # Empty keywords are contained in every message
+        self.always = set()
+        self.arrays = None
+
+    @classmethod
+    def from_arrays(cls, arrays, always=()):
+        """Automaton over already flattened ``arrays`` (array('I') or memoryview.cast('I'))"""
+        automaton = cls()
+        automaton._goto = automaton._output = None
+        automaton.always = set(always)
+        automaton._use(arrays)
+        return automaton
+
+    def add(self, keyword, entry_pos):
+        if not keyword:
+            self.always.add(entry_pos)
+            return
+        state = 0
+        for char in keyword:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto.append({})
+                self._output.append(set())
+                self._goto[state][char] = next_state
+            state = next_state
+        self._output[state].add(entry_pos)
+
+    def build(self):
+        """Compute failure links, fold outputs along them (BFS order) and flatten"""
+        goto, output = self._goto, self._output
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in goto[state].items():
+                queue.append(next_state)
+                fallback = fail[state]
+                while fallback and char not in goto[fallback]:
+                    fallback = fail[fallback]
+                target = goto[fallback].get(char, 0)
+                fail[next_state] = target if target != next_state else 0
+                output[next_state] |= output[fail[next_state]]
+
+        arrays = {name: array('I') for name in self.ARRAYS}
+        arrays["edge_start"].append(0)
+        arrays["out_start"].append(0)
+        for edges, out in zip(goto, output):
+            for char in sorted(edges):
+                arrays["edge_chars"].append(ord(char))
+                arrays["edge_next"].append(edges[char])
+            arrays["edge_start"].append(len(arrays["edge_chars"]))
+            arrays["out_pos"].extend(sorted(out))
+            arrays["out_start"].append(len(arrays["out_pos"]))
+        arrays["fail"] = array('I', fail)
+        self._goto = self._output = None
+        self._use(arrays)
+
+    def _use(self, arrays):
+        self.arrays = arrays
+        edge_start, edge_chars, edge_next = arrays["edge_start"], arrays["edge_chars"], arrays["edge_next"]
+        # Most characters are read in the root state; keep its edges in a dict
+        self._root = {
+            chr(edge_chars[i]): edge_next[i] for i in range(edge_start[0], edge_start[1])
+        }
+
+    def search(self, text):
+        """Return the set of entry positions whose keywords occur in text"""
+        found = set(self.always)
+        arrays, root = self.arrays, self._root
+        edge_start, edge_chars, edge_next = arrays["edge_start"], arrays["edge_chars"], arrays["edge_next"]
+        fail, out_start, out_pos = arrays["fail"], arrays["out_start"], arrays["out_pos"]
+        state = 0
+        for char in text:
+            if state:
+                code = ord(char)
+                while True:
+                    lo, hi = edge_start[state], edge_start[state + 1]
+                    i = bisect_left(edge_chars, code, lo, hi)
+                    if i < hi and edge_chars[i] == code:
+                        state = edge_next[i]
+                        break
+                    state = fail[state]
+                    if not state:
+                        state = root.get(char, 0)
+                        break
+            else:
+                state = root.get(char, 0)
+            lo, hi = out_start[state], out_start[state + 1]
+            if lo != hi:
+                found.update(out_pos[lo:hi])
+        return found
+
+
+# ---------------- KB matcher ----------------
+class KBMatcher:
+    """Matches chat messages against the knowledge base in a single pass.
+
+    One automaton is built per language at load time; a lookup walks the
+    lowercased message once and returns hits in KB order, so the first hit is
+    the entry the old per-item keyword loop in /chat would have picked.
+    """
+
+    LANGUAGES = ("en", "hi")
+
+    def __init__(self, knowledge_base, automata=None):
+        self.entries = list(knowledge_base)
+        if automata is not None:
+            self.automata = automata
+            return
+        self.automata = {}
+        for language in self.LANGUAGES:
+            automaton = KeywordAutomaton()
+            for pos, item in enumerate(self.entries):
+                for keyword in kb_keywords(item, language):
+                    automaton.add(keyword, pos)
+            automaton.build()
+            self.automata[language] = automaton
+
+    def match_all(self, message, language="en"):
+        """All KB items whose keywords appear in the message, in KB order"""
+        automaton = self.automata.get(language)
+        if automaton is None:
+            return []
+        positions = automaton.search(lowered_text(message))
+        return [self.entries[pos] for pos in sorted(positions)]
+
+    def match_position(self, message, language="en"):
+        """KB position of the first item whose keywords appear in the message, or None"""
+        automaton = self.automata.get(language)
+        if automaton is None:
+            return None
+        positions = automaton.search(lowered_text(message))
+        return min(positions) if positions else None
+
+    def match(self, message, language="en"):
+        """First KB item whose keywords appear in the message, or None"""
+        pos = self.match_position(message, language)
+        return None if pos is None else self.entries[pos]
+
+
+# ---------------- Ranked retrieval ----------------
+try:
+    import numpy as np
+    from scipy import sparse
+    RANKED_RETRIEVAL_AVAILABLE = True
+except ImportError:
+    np = None
+    sparse = None
+    RANKED_RETRIEVAL_AVAILABLE = False
+
+# Per-language fields indexed for ranked retrieval, with a term-frequency boost
+RETRIEVAL_FIELDS = {
+    "en": {"condition": 3, "symptoms_en": 2, "answer_en": 1},
+    "hi": {"condition_hi": 3, "symptoms_hi": 2, "answer_hi": 1},
+}
+
+
+def _field_tokens(item, field_weights):
+    tokens = []
+    for field, boost in field_weights.items():
+        value = item.get(field, "")
+        if isinstance(value, list):
+            value = " ".join(value)
+        tokens.extend(tokenize(value) * boost)
+    return tokens
+
+
+class KBRetriever:
+    """Ranks KB entries against a message with BM25 over a sparse matrix.
+
+    Term weights for every (entry, term) pair are precomputed at load time,
+    so scoring a query is a single sparse product over the query's columns.
+    ``indexes`` maps each language to a prebuilt (vocab, matrix) pair, e.g.
+    a matrix over CSC arrays mapped from a startup artifact.
+    """
+
+    def __init__(self, knowledge_base, k1=1.5, b=0.75, indexes=None):
+        if not RANKED_RETRIEVAL_AVAILABLE:
+            raise RuntimeError("Ranked KB retrieval requires numpy and scipy")
+        self.entries = list(knowledge_base)
+        self.vocab = {}
+        self.matrix = {}
+        if indexes is not None:
+            for language, (vocab, matrix) in indexes.items():
+                self.vocab[language] = vocab
+                self.matrix[language] = matrix
+            return
+        for language, field_weights in RETRIEVAL_FIELDS.items():
+            self.vocab[language], self.matrix[language] = self._build(field_weights, k1, b)
+
+    def _build(self, field_weights, k1, b):
+        vocab = {}
+        rows, cols, counts = [], [], []
+        doc_lengths = np.zeros(len(self.entries), dtype=np.float64)
+        for pos, item in enumerate(self.entries):
+            tokens = _field_tokens(item, field_weights)
+            doc_lengths[pos] = len(tokens)
+            term_counts = {}
+            for token in tokens:
+                term_id = vocab.setdefault(token, len(vocab))
+                term_counts[term_id] = term_counts.get(term_id, 0) + 1
+            rows.extend([pos] * len(term_counts))
+            cols.extend(term_counts.keys())
+            counts.extend(term_counts.values())
+
+        rows = np.asarray(rows, dtype=np.int64)
+        cols = np.asarray(cols, dtype=np.int64)
+        tf = np.asarray(counts, dtype=np.float64)
+
+        n_docs = max(len(self.entries), 1)
+        doc_freq = np.bincount(cols, minlength=len(vocab))
+        idf = np.log(1.0 + (n_docs - doc_freq + 0.5) / (doc_freq + 0.5))
+        avg_length = doc_lengths.mean() if len(self.entries) else 1.0
+        norm = k1 * (1.0 - b + b * doc_lengths[rows] / max(avg_length, 1.0))
+        weights = idf[cols] * tf * (k1 + 1.0) / (tf + norm)
+
+        matrix = sparse.csc_matrix(
+            (weights, (rows, cols)), shape=(len(self.entries), len(vocab))
+        )
+        return vocab, matrix
+
+    def rank(self, message, language="en", top_k=3, min_score=0.0):
+        """Top-k (KB position, score) pairs scoring at least min_score, best first"""
+        vocab = self.vocab.get(language)
+        if vocab is None or not self.entries:
+            return []
+        terms = message.terms if isinstance(message, TextAnalysis) else tokenize(message)
+        query_counts = {}
+        for token in terms:
+            term_id = vocab.get(token)
+            if term_id is not None:
+                query_counts[term_id] = query_counts.get(term_id, 0) + 1
+        if not query_counts:
+            return []
+
+        term_ids = list(query_counts.keys())
+        query = np.fromiter(query_counts.values(), dtype=np.float64, count=len(term_ids))
+        scores = self.matrix[language][:, term_ids] @ query
+
+        top_k = min(top_k, len(scores))
+        candidates = np.argpartition(-scores, top_k - 1)[:top_k]
+        # Highest score first; ties go to the earlier KB entry
+        candidates = candidates[np.lexsort((candidates, -scores[candidates]))]
+        return [
+            (int(pos), float(scores[pos]))
+            for pos in candidates
+            if scores[pos] > 0 and scores[pos] >= min_score
+        ]
+
+    def search(self, message, language="en", top_k=3, min_score=0.0):
+        """Top-k (item, score) pairs scoring at least min_score, best first"""
+        return [(self.entries[pos], score) for pos, score in self.rank(message, language, top_k, min_score)]
+
+
+# ---------------- Live KB index ----------------
+def kb_item_from_row(row, base=None):
+    """Convert a health_knowledge_base row into the item shape /chat uses.
+
+    Fields the table has no column for (Hindi symptoms, self-care lists, ...)
+    are carried over from ``base``, the previous version of the same entry.
+    """
+    entry_id, category, title, content_english, content_hindi, keywords = row[:6]
+    item = dict(base or {})
+    item.update({
+        "id": entry_id,
+        "category": category,
+        "condition": title,
+        "answer_en": content_english or "",
+        "answer_hi": content_hindi or "",
+        "symptoms_en": [word.strip() for word in (keywords or "").split(",") if word.strip()],
+    })
+    return item
+
+
+# ---------------- Reply strings ----------------
+# Replies are precomputed for these languages and item fields
+REPLY_LANGUAGES = ("en", "hi")
+REPLY_FIELDS = ("answer", "symptoms", "self_care", "when_to_seek_doctor")
+
+
+def kb_field_text(item, field, language="en"):
+    """Reply text for one field of a KB item (list fields are comma-joined)"""
+    if field == "answer":
+        return item.get(f"answer_{language}", "")
+    return ", ".join(item.get(f"{field}_{language}", []))
+
+
+class ReplyTable:
+    """Reply text for every (KB position, language, field) in one flat sequence.
+
+    ``texts`` is a list when built in-process, or a read-only view over the
+    strings section of a mapped startup artifact.
+    """
+
+    def __init__(self, texts):
+        self.texts = texts
+
+    @classmethod
+    def build(cls, entries):
+        return cls([
+            kb_field_text(item, field, language)
+            for item in entries
+            for language in REPLY_LANGUAGES
+            for field in REPLY_FIELDS
+        ])
+
+    @staticmethod
+    def slot(pos, field, language):
+        lang_idx = REPLY_LANGUAGES.index(language)
+        return (pos * len(REPLY_LANGUAGES) + lang_idx) * len(REPLY_FIELDS) + REPLY_FIELDS.index(field)
+
+    def get(self, pos, field, language):
+        return self.texts[self.slot(pos, field, language)]
+
+
+class KBSnapshot:
+    """Immutable view of the KB together with the indexes built over it.
+
+    Indexes that are passed in (from a startup artifact) are used as is;
+    the rest are built from ``entries``.
+    """
+
+    def __init__(self, version, entries, ranked=False, matcher=None, retriever=None, replies=None):
+        self.version = version
+        self.entries = tuple(entries)
+        self.matcher = matcher if matcher is not None else KBMatcher(self.entries)
+        if retriever is None and ranked:
+            retriever = KBRetriever(self.entries)
+        self.retriever = retriever
+        self.replies = replies if replies is not None else ReplyTable.build(self.entries)
+
+    def lookup_position(self, message, language="en", top_k=3, min_score=0.0):
+        """KB position of the best item for the message, or None"""
+        if self.retriever is not None:
+            hits = self.retriever.rank(message, language, top_k=top_k, min_score=min_score)
+            return hits[0][0] if hits else None
+        return self.matcher.match_position(message, language)
+
+    def lookup(self, message, language="en", top_k=3, min_score=0.0):
+        """Best KB item for the message, or None"""
+        pos = self.lookup_position(message, language, top_k, min_score)
+        return None if pos is None else self.entries[pos]
+
+    def reply(self, pos, field, language="en"):
+        """Reply text of one field of the item at ``pos``"""
+        if field in REPLY_FIELDS and language in REPLY_LANGUAGES:
+            return self.replies.get(pos, field, language)
+        return kb_field_text(self.entries[pos], field, language)
+
+
+class LiveKB:
+    """KB index kept in sync with admin CRUD on the health_knowledge_base table.
+
+    Writers apply a change to their private record map, build a complete new
+    KBSnapshot off to the side and then publish it with a single attribute
+    assignment. Readers just grab ``live_kb.snapshot`` once per request, so they
+    never take a lock and never observe a partially built index.
+
+    ``prebuilt(entries)`` may supply the indexes of a reloaded snapshot
+    instead of building them: the matcher/retriever/replies keyword arguments
+    of KBSnapshot, taken from a startup artifact built from the same rows, or
+    None when it has none that fit.
+    """
+
+    def __init__(self, rows, reference=(), ranked=False, prebuilt=None):
+        self.ranked = ranked
+        # kb.json items, so DB rows keep the fields the table has no column for
+        self._reference_items = list(reference)
+        self._reference = {item.get("condition"): item for item in self._reference_items}
+        self._records = {}
+        self._rows = {}
+        self._version = 0
+        self._write_lock = threading.Lock()
+        self._listeners = []
+        self.snapshot = None
+        self.reload(rows, prebuilt)
+
+    def subscribe(self, callback):
+        """Call ``callback(snapshot)`` every time a new snapshot is published"""
+        self._listeners.append(callback)
+
+    def rows(self):
+        """Table rows behind the current snapshot, by id (empty when serving kb.json)"""
+        return [self._rows[key] for key in sorted(self._rows)]
+
+    def _set_rows(self, rows):
+        self._rows = {row[0]: tuple(row) for row in rows}
+        # Only table rows, keyed by id; kb.json stands in for an empty table
+        # in _publish, so its list positions never collide with row ids
+        self._records = {
+            row[0]: kb_item_from_row(row, self._reference.get(row[2]))
+            for row in rows
+        }
+
+    def reload(self, rows, prebuilt=None):
+        """Rebuild from a full set of table rows (kb.json if the table is empty)"""
+        with self._write_lock:
+            self._set_rows(rows)
+            self._publish(prebuilt)
+
+    def upsert(self, row):
+        """Apply an added or updated table row (the first one replaces the kb.json fallback)"""
+        if row is None:
+            return
+        with self._write_lock:
+            base = self._records.get(row[0]) or self._reference.get(row[2])
+            self._records[row[0]] = kb_item_from_row(row, base)
+            self._rows[row[0]] = tuple(row)
+            self._publish()
+
+    def remove(self, entry_id):
+        """Drop a deleted table row"""
+        with self._write_lock:
+            self._rows.pop(entry_id, None)
+            if self._records.pop(entry_id, None) is not None:
+                self._publish()
+
+    def _publish(self, prebuilt=None):
+        self._version += 1
+        if self._records:
+            entries = [self._records[key] for key in sorted(self._records)]
+        else:
+            entries = self._reference_items
+        indexes = prebuilt(entries) if prebuilt else None
+        self.snapshot = KBSnapshot(self._version, entries, self.ranked, **(indexes or {}))
+        for callback in self._listeners:
+            callback(self.snapshot)
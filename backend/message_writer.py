@@ -0,0 +1,203 @@
+import datetime
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+from db_setup import insert_messages, is_busy_error, reserve_message_ids
+
+# Group commit for chat logging: request threads hand message rows to one
+# writer thread, which inserts everything queued in a single transaction (one
+# fsync for the whole batch). Rows that arrive while a commit is running make
+# up the next batch; max_wait_ms can additionally hold a batch open to fill.
+#
+# Message ids are reserved from the AUTOINCREMENT counter in blocks, so a
+# request knows its message_id (needed for /feedback) before the row exists.
+#
+# Durability: with wait=True (the default) a request only returns after the
+# transaction holding its rows has committed, so nothing acknowledged to a
+# client is lost in a crash; concurrent requests share the commit. With
+# wait=False rows are written behind the response; a crash can lose what is
+# still queued (at most one batch window), and a clean shutdown flushes it.
+#
+# insert_messages already retries busy errors; a batch that is still busy
+# after that gets one more try. Any other error (e.g. a constraint) makes the
+# writer insert the batch row by row, so only the bad row's request fails.
+
+
+class MessageWriter:
+    """Batches message inserts from request threads into grouped commits"""
+
+    def __init__(self, max_batch_size=64, max_wait_ms=0, id_block_size=100, busy_retry_wait=0.5):
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.id_block_size = id_block_size
+        self.busy_retry_wait = busy_retry_wait
+        self._id_lock = threading.Lock()
+        self._pending_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._closed = False
+        self.batches = 0
+        self.rows = 0
+        self.failed_rows = 0
+        self._pid = None
+        self._thread = None
+
+    def _ensure_started(self):
+        """Start the writer thread in this process (again after a fork)"""
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            # A forked child must not reuse its parent's queue or id block
+            self._queue = queue.Queue()
+            self._pending = {}
+            self._next_id = 0
+            self._block_end = 0
+            self._thread = threading.Thread(target=self._run, name="message-writer", daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def _reserve_id(self):
+        with self._id_lock:
+            if self._next_id >= self._block_end:
+                self._next_id = reserve_message_ids(self.id_block_size)
+                self._block_end = self._next_id + self.id_block_size
+            message_id = self._next_id
+            self._next_id += 1
+            return message_id
+
+    def submit(self, conversation_id, sender, text_content, reply_to_message_id=None, language=None, intent=None):
+        """Queue a message; returns (message_id, Future set once it is committed)"""
+        if self._closed:
+            raise RuntimeError("message writer is closed")
+        self._ensure_started()
+        message_id = self._reserve_id()
+        timestamp = datetime.datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+        future = Future()
+        with self._pending_lock:
+            self._pending[message_id] = future
+        self._queue.put(((message_id, conversation_id, sender, text_content, timestamp, reply_to_message_id,
+                          language, intent), future))
+        return message_id, future
+
+    def wait_for(self, message_id, timeout=10):
+        """Block until a queued message is committed (no-op if it isn't queued here)"""
+        if self._pid != os.getpid():
+            return
+        with self._pending_lock:
+            future = self._pending.get(message_id)
+        if future is not None:
+            future.result(timeout)
+
+    def flush(self, timeout=10):
+        """Wait until everything queued so far is committed"""
+        if self._pid != os.getpid():
+            return
+        marker = Future()
+        self._queue.put((None, marker))
+        marker.result(timeout)
+
+    def close(self, timeout=10):
+        """Flush and stop the writer thread; called on shutdown"""
+        if self._closed:
+            return
+        self._closed = True
+        if self._pid != os.getpid():
+            return
+        self._queue.put((None, None))
+        self._thread.join(timeout)
+
+    def stats(self):
+        return {
+            "queued": self._queue.qsize() if self._thread else 0,
+            "batches": self.batches,
+            "rows": self.rows,
+            "failed_rows": self.failed_rows,
+            "avg_batch": round(self.rows / self.batches, 2) if self.batches else 0,
+        }
+
+    def _run(self):
+        while True:
+            batch, markers, stop = self._collect()
+            if batch:
+                self._commit(batch)
+            for marker in markers:
+                marker.set_result(True)
+            if stop:
+                return
+
+    def _collect(self):
+        """Rows that arrived within max_wait of the first one (up to max_batch_size)"""
+        batch, markers = [], []
+        row, future = self._queue.get()
+        deadline = time.monotonic() + self.max_wait
+        while True:
+            if row is None:
+                if future is None:
+                    return batch, markers, True
+                markers.append(future)
+            else:
+                batch.append((row, future))
+                if len(batch) >= self.max_batch_size:
+                    return batch, markers, False
+            remaining = deadline - time.monotonic()
+            try:
+                row, future = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                return batch, markers, False
+
+    def _commit(self, batch):
+        rows = [row for row, _ in batch]
+        try:
+            self._insert(rows)
+        except Exception as e:
+            if isinstance(e, sqlite3.OperationalError) and is_busy_error(e):
+                logging.error(f"Dropping {len(rows)} chat messages, database still busy: {e}")
+                self.failed_rows += len(rows)
+                self._finish(batch, error=e)
+            else:
+                self._commit_each(batch, e)
+            return
+        self.batches += 1
+        self.rows += len(rows)
+        self._finish(batch)
+
+    def _insert(self, rows):
+        """insert_messages, tried once more if it is still busy after its own retries"""
+        try:
+            insert_messages(rows)
+        except sqlite3.OperationalError as e:
+            if not is_busy_error(e):
+                raise
+            time.sleep(self.busy_retry_wait)
+            insert_messages(rows)
+
+    def _commit_each(self, batch, error):
+        """Insert a failed batch one row at a time so a bad row fails only its own request"""
+        logging.warning(f"Batch of {len(batch)} chat messages failed ({error}), inserting one by one")
+        self.batches += 1
+        for row, future in batch:
+            try:
+                insert_messages([row])
+            except Exception as e:
+                logging.error(f"Dropping chat message {row[0]}: {e}")
+                self.failed_rows += 1
+                self._finish([(row, future)], error=e)
+            else:
+                self.rows += 1
+                self._finish([(row, future)])
+
+    def _finish(self, batch, error=None):
+        with self._pending_lock:
+            for row, _ in batch:
+                self._pending.pop(row[0], None)
+        for _, future in batch:
+            if error is None:
+                future.set_result(True)
+            else:
+                future.set_exception(error)
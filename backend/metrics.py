@@ -0,0 +1,219 @@
+import sys
+
+from db_setup import get_connection, retry_on_busy
+
+# Aggregate counters for /admin/stats, kept in the metrics table by triggers
+# on users and messages, so every writer (db_setup, the message writer, sample
+# data, manual SQL) updates them in the same transaction as the row itself.
+# Reading them is a primary-key lookup, however large messages grows.
+#
+#   users                        rows in users
+#   messages                     rows in messages
+#   conversations                distinct conversation_id values in messages
+#   feedback:<type>              messages with that feedback_type
+#   assistant_feedback:<type>    the same, assistant messages only
+#
+# daily_metrics rolls messages up per (day, language, intent) for the trend
+# charts: user messages as queries, and positive/negative feedback on
+# assistant replies, dated by the reply. Messages from before language/intent
+# were recorded fall under ''. Reading a date range touches one row per day
+# and language/intent pair in it, however long the history is.
+#
+# The triggers don't follow a message moving to another conversation (nothing
+# does that); reconcile() recomputes every counter from the raw tables.
+#
+#   python metrics.py              # show the counters
+#   python metrics.py reconcile    # rebuild them and report any drift
+
+METRICS_TABLE = '''
+    CREATE TABLE IF NOT EXISTS metrics (
+        name TEXT PRIMARY KEY,
+        value INTEGER NOT NULL DEFAULT 0
+    ) WITHOUT ROWID
+'''
+
+# Upserts need a WHERE on the SELECT so ON CONFLICT isn't parsed as a join
+# constraint; the WHERE also makes each step conditional
+_BUMP = '''
+    INSERT INTO metrics (name, value) SELECT {name}, {delta} WHERE {when}
+    ON CONFLICT(name) DO UPDATE SET value = value + excluded.value;
+'''
+
+
+def _bump(name, delta, when='1'):
+    return _BUMP.format(name=name, delta=delta, when=when)
+
+
+def _feedback(row, delta):
+    return (_bump(f"'feedback:' || {row}.feedback_type", delta, f"{row}.feedback_type IS NOT NULL")
+            + _bump(f"'assistant_feedback:' || {row}.feedback_type", delta,
+                    f"{row}.sender = 'assistant' AND {row}.feedback_type IS NOT NULL"))
+
+
+TRIGGERS = [
+    'CREATE TRIGGER IF NOT EXISTS metrics_users_insert AFTER INSERT ON users BEGIN '
+    + _bump("'users'", 1) + ' END',
+    'CREATE TRIGGER IF NOT EXISTS metrics_users_delete AFTER DELETE ON users BEGIN '
+    + _bump("'users'", -1) + ' END',
+    'CREATE TRIGGER IF NOT EXISTS metrics_messages_insert AFTER INSERT ON messages BEGIN '
+    + _bump("'messages'", 1)
+    # First message of a conversation (idx_messages_conversation lookup)
+    + _bump("'conversations'", 1,
+            'NEW.conversation_id IS NOT NULL AND NOT EXISTS (SELECT 1 FROM messages '
+            'WHERE conversation_id = NEW.conversation_id AND id != NEW.id)')
+    + _feedback('NEW', 1) + ' END',
+    'CREATE TRIGGER IF NOT EXISTS metrics_messages_delete AFTER DELETE ON messages BEGIN '
+    + _bump("'messages'", -1)
+    + _bump("'conversations'", -1,
+            'OLD.conversation_id IS NOT NULL AND NOT EXISTS (SELECT 1 FROM messages '
+            'WHERE conversation_id = OLD.conversation_id)')
+    + _feedback('OLD', -1) + ' END',
+    'CREATE TRIGGER IF NOT EXISTS metrics_messages_feedback AFTER UPDATE OF feedback_type, sender ON messages '
+    'WHEN OLD.feedback_type IS NOT NEW.feedback_type OR OLD.sender IS NOT NEW.sender BEGIN '
+    + _feedback('OLD', -1) + _feedback('NEW', 1) + ' END',
+]
+
+# Every counter, computed from scratch
+REBUILD = '''
+    SELECT 'users', COUNT(*) FROM users
+    UNION ALL SELECT 'messages', COUNT(*) FROM messages
+    UNION ALL SELECT 'conversations', COUNT(DISTINCT conversation_id) FROM messages
+    UNION ALL SELECT 'feedback:' || feedback_type, COUNT(*) FROM messages
+        WHERE feedback_type IS NOT NULL GROUP BY feedback_type
+    UNION ALL SELECT 'assistant_feedback:' || feedback_type, COUNT(*) FROM messages
+        WHERE sender = 'assistant' AND feedback_type IS NOT NULL GROUP BY feedback_type
+'''
+
+
+def rebuild_metrics(conn):
+    """Replace the counters with values computed from the raw tables; returns the drift"""
+    current = dict(conn.execute('SELECT name, value FROM metrics'))
+    rebuilt = dict(conn.execute(REBUILD))
+    conn.execute('DELETE FROM metrics')
+    conn.executemany('INSERT INTO metrics (name, value) VALUES (?, ?)', rebuilt.items())
+    return {name: (current.get(name, 0), rebuilt.get(name, 0))
+            for name in current.keys() | rebuilt.keys()
+            if current.get(name, 0) != rebuilt.get(name, 0)}
+
+
+# ---------------- Daily rollup ----------------
+DAILY_TABLE = '''
+    CREATE TABLE IF NOT EXISTS daily_metrics (
+        day TEXT NOT NULL,
+        language TEXT NOT NULL DEFAULT '',
+        intent TEXT NOT NULL DEFAULT '',
+        queries INTEGER NOT NULL DEFAULT 0,
+        positive INTEGER NOT NULL DEFAULT 0,
+        negative INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, language, intent)
+    ) WITHOUT ROWID
+'''
+
+# Messages that count towards the rollup (a timestamp date() can't read would
+# otherwise fail the insert on the NOT NULL day)
+_DAILY_ROW = ("date({row}.timestamp) IS NOT NULL AND ({row}.sender = 'user' OR "
+              "({row}.sender = 'assistant' AND {row}.feedback_type IN ('positive', 'negative')))")
+
+_DAILY_BUMP = '''
+    INSERT INTO daily_metrics (day, language, intent, queries, positive, negative)
+    SELECT date({row}.timestamp), COALESCE({row}.language, ''), COALESCE({row}.intent, ''),
+           ({row}.sender = 'user') * {delta},
+           ({row}.sender = 'assistant' AND {row}.feedback_type = 'positive') * {delta},
+           ({row}.sender = 'assistant' AND {row}.feedback_type = 'negative') * {delta}
+    WHERE {when}
+    ON CONFLICT(day, language, intent) DO UPDATE SET
+        queries = queries + excluded.queries,
+        positive = positive + excluded.positive,
+        negative = negative + excluded.negative;
+'''
+
+
+def _daily(row, delta):
+    return _DAILY_BUMP.format(row=row, delta=delta, when=_DAILY_ROW.format(row=row))
+
+
+DAILY_TRIGGERS = [
+    'CREATE TRIGGER IF NOT EXISTS daily_metrics_insert AFTER INSERT ON messages BEGIN '
+    + _daily('NEW', 1) + ' END',
+    'CREATE TRIGGER IF NOT EXISTS daily_metrics_delete AFTER DELETE ON messages BEGIN '
+    + _daily('OLD', -1) + ' END',
+    'CREATE TRIGGER IF NOT EXISTS daily_metrics_update '
+    'AFTER UPDATE OF sender, feedback_type, timestamp, language, intent ON messages BEGIN '
+    + _daily('OLD', -1) + _daily('NEW', 1) + ' END',
+]
+
+DAILY_REBUILD = f'''
+    SELECT date(timestamp), COALESCE(language, ''), COALESCE(intent, ''),
+           SUM(sender = 'user'),
+           SUM(sender = 'assistant' AND feedback_type = 'positive'),
+           SUM(sender = 'assistant' AND feedback_type = 'negative')
+    FROM messages AS m WHERE {_DAILY_ROW.format(row='m')}
+    GROUP BY 1, 2, 3
+'''
+
+
+def rebuild_daily_metrics(conn):
+    """Recompute daily_metrics from messages; returns the drift per day/language/intent"""
+    current = {row[:3]: row[3:] for row in conn.execute(
+        'SELECT day, language, intent, queries, positive, negative FROM daily_metrics')}
+    rebuilt = {row[:3]: row[3:] for row in conn.execute(DAILY_REBUILD)}
+    conn.execute('DELETE FROM daily_metrics')
+    conn.executemany('INSERT INTO daily_metrics (day, language, intent, queries, positive, negative) '
+                     'VALUES (?, ?, ?, ?, ?, ?)', [key + counts for key, counts in rebuilt.items()])
+    zero = (0, 0, 0)
+    return {'daily:' + '/'.join(key): (current.get(key, zero), rebuilt.get(key, zero))
+            for key in current.keys() | rebuilt.keys()
+            if current.get(key, zero) != rebuilt.get(key, zero)}
+
+
+def install_daily(conn):
+    """Migration step: daily rollup table, triggers and history so far"""
+    conn.execute(DAILY_TABLE)
+    for trigger in DAILY_TRIGGERS:
+        conn.execute(trigger)
+    rebuild_daily_metrics(conn)
+
+
+def install(conn):
+    """Migration step: counters table, triggers and initial values"""
+    conn.execute(METRICS_TABLE)
+    for trigger in TRIGGERS:
+        conn.execute(trigger)
+    rebuild_metrics(conn)
+
+
+@retry_on_busy
+def reconcile():
+    conn = get_connection()
+    try:
+        # Hold the write lock so no insert lands between the count and the swap
+        conn.execute('BEGIN IMMEDIATE')
+        drift = rebuild_metrics(conn)
+        drift.update(rebuild_daily_metrics(conn))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return drift
+
+
+if __name__ == '__main__':
+    command = sys.argv[1] if len(sys.argv) > 1 else 'show'
+    if command == 'reconcile':
+        drift = reconcile()
+        for name, (was, now) in sorted(drift.items()):
+            print(f"{name}: {was} -> {now}")
+        print(f"Rebuilt metrics, {len(drift)} counter(s) corrected")
+    elif command == 'show':
+        conn = get_connection()
+        for name, value in conn.execute('SELECT name, value FROM metrics ORDER BY name'):
+            print(f"{name:<32}{value}")
+        print(f"{'day':<12}{'language':<10}{'intent':<20}{'queries':>8}{'positive':>9}{'negative':>9}")
+        for row in conn.execute('SELECT * FROM daily_metrics ORDER BY day DESC, language, intent LIMIT 30'):
+            print(f"{row[0]:<12}{row[1] or '-':<10}{row[2] or '-':<20}{row[3]:>8}{row[4]:>9}{row[5]:>9}")
+        conn.close()
+    else:
+        print("Usage: python metrics.py [show|reconcile]")
+        sys.exit(2)
@@ -0,0 +1,282 @@
+import re
+import sqlite3
+import sys
+
+import backfill
+import metrics
+import top_queries
+from db_setup import DB_PATH, DB_BUSY_TIMEOUT
+
+# Versioned schema migrations for chat_history.db. Each migration runs once,
+# inside its own write transaction, and is recorded in schema_migrations, so
+# running migrate() again (or from several workers at once) is a no-op.
+# Migrations only ever add to the schema; nothing is dropped or rebuilt.
+#
+#   python migrations.py            # apply pending migrations
+#   python migrations.py status     # applied versions
+#   python migrations.py explain    # check the hot queries use their indexes
+
+MIGRATIONS = [
+    (1, "base schema", [
+        '''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT NOT NULL UNIQUE,
+            email TEXT NOT NULL UNIQUE,
+            password TEXT NOT NULL,
+            preferred_language TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            role TEXT
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS conversations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            userid INTEGER,
+            start_time DATETIME,
+            end_time DATETIME,
+            FOREIGN KEY (userid) REFERENCES users(id)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            conversation_id INTEGER,
+            sender TEXT NOT NULL,
+            text_content TEXT NOT NULL,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            feedback_type TEXT,
+            feedback_comment TEXT,
+            FOREIGN KEY (conversation_id) REFERENCES conversations(id)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS health_knowledge_base (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            category TEXT,
+            title TEXT NOT NULL,
+            content_english TEXT,
+            content_hindi TEXT,
+            keywords TEXT,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+    ]),
+    (2, "indexes for the chat, stats and admin queries", [
+        # get_or_create_conversation: open conversation of a user, newest first;
+        # also covers the per-user count in /user/stats
+        'CREATE INDEX IF NOT EXISTS idx_conversations_user_open '
+        'ON conversations(userid, end_time, start_time)',
+        # /user/stats joins and the user-message self-join in get_recent_feedback
+        'CREATE INDEX IF NOT EXISTS idx_messages_conversation '
+        'ON messages(conversation_id, sender, timestamp)',
+        # Feedback stats/trends/recent feedback: assistant messages with feedback
+        'CREATE INDEX IF NOT EXISTS idx_messages_sender_feedback '
+        'ON messages(sender, feedback_type, timestamp)',
+        # Query trends and topic stats: user messages by day
+        'CREATE INDEX IF NOT EXISTS idx_messages_sender_timestamp '
+        'ON messages(sender, timestamp)',
+        # get_positive_feedback_ratio
+        'CREATE INDEX IF NOT EXISTS idx_messages_feedback '
+        'ON messages(feedback_type)',
+    ]),
+    (3, "trigger-maintained counters for /admin/stats", [metrics.install]),
+    (4, "health topic of user messages, classified on insert", [
+        'ALTER TABLE messages ADD COLUMN topic TEXT',
+        # get_health_topics_stats GROUP BY, and the backfill's scan for NULLs
+        'CREATE INDEX IF NOT EXISTS idx_messages_sender_topic ON messages(sender, topic)',
+        backfill.classify_topics_inline,
+    ]),
+    (5, "link assistant replies to the user message they answer", [
+        'ALTER TABLE messages ADD COLUMN reply_to_message_id INTEGER REFERENCES messages(id)',
+        # get_recent_feedback: newest rated replies, read straight off the index;
+        # only rated messages are in it
+        "CREATE INDEX IF NOT EXISTS idx_messages_recent_feedback ON messages(sender, timestamp) "
+        "WHERE feedback_type IS NOT NULL",
+        backfill.link_replies_inline,
+    ]),
+    (6, "language/intent of messages and the daily_metrics rollup", [
+        'ALTER TABLE messages ADD COLUMN language TEXT',
+        'ALTER TABLE messages ADD COLUMN intent TEXT',
+        metrics.install_daily,
+    ]),
+    (7, "top query summaries, checkpointed by the query tracker", [top_queries.install]),
+    (8, "KB version counter for conditional GET /admin/kb", [
+        'CREATE TABLE IF NOT EXISTS kb_version (version INTEGER NOT NULL)',
+        'INSERT INTO kb_version (version) SELECT 1 WHERE NOT EXISTS (SELECT 1 FROM kb_version)',
+        'CREATE TRIGGER IF NOT EXISTS kb_version_insert AFTER INSERT ON health_knowledge_base '
+        'BEGIN UPDATE kb_version SET version = version + 1; END',
+        'CREATE TRIGGER IF NOT EXISTS kb_version_update AFTER UPDATE ON health_knowledge_base '
+        'BEGIN UPDATE kb_version SET version = version + 1; END',
+        'CREATE TRIGGER IF NOT EXISTS kb_version_delete AFTER DELETE ON health_knowledge_base '
+        'BEGIN UPDATE kb_version SET version = version + 1; END',
+        # /admin/kb?category=...: keyset pages of one category
+        'CREATE INDEX IF NOT EXISTS idx_kb_category ON health_knowledge_base(category, id)',
+    ]),
+    (9, "whether the top query summaries are built from history", [top_queries.install_state]),
+    (10, "per-user feedback stats index", [
+        # /user/stats feedback counts: a user's conversations, then only their
+        # rated replies; only rated messages are in it
+        "CREATE INDEX IF NOT EXISTS idx_messages_conversation_feedback "
+        "ON messages(conversation_id, sender, feedback_type) WHERE feedback_type IS NOT NULL",
+    ]),
+]
+
+# Queries on the request/admin paths and the indexes each plan must search
+# with ("PRIMARY KEY" / "INTEGER PRIMARY KEY" for the table's own key);
+# test_migrations.py asserts them
+HOT_QUERIES = {
+    "get_or_create_conversation": (
+        ("idx_conversations_user_open",),
+        "SELECT id FROM conversations WHERE userid = 1 AND end_time IS NULL ORDER BY start_time DESC LIMIT 1"),
+    "user_stats_conversations": (
+        ("idx_conversations_user_open",),
+        "SELECT COUNT(*) FROM conversations WHERE userid = 1"),
+    "user_stats_messages": (
+        ("idx_conversations_user_open", "idx_messages_conversation"),
+        "SELECT COUNT(*) FROM messages m JOIN conversations c ON m.conversation_id = c.id WHERE c.userid = 1"),
+    "user_stats_feedback": (
+        ("idx_conversations_user_open", "idx_messages_conversation_feedback"),
+        "SELECT feedback_type, COUNT(*) FROM conversations c CROSS JOIN messages m ON m.conversation_id = c.id "
+        "WHERE c.userid = 1 AND m.sender = 'assistant' AND m.feedback_type IS NOT NULL GROUP BY feedback_type"),
+    "metrics_first_message": (
+        ("idx_messages_conversation",),
+        "SELECT 1 FROM messages WHERE conversation_id = 1 AND id != 2"),
+    "top_queries_load": (
+        ("PRIMARY KEY",),
+        "SELECT query, count, error FROM query_counts WHERE scope = 'user:1' ORDER BY count DESC LIMIT 50"),
+    "get_health_topics_stats": (
+        ("idx_messages_sender_topic",),
+        "SELECT topic, COUNT(*) FROM messages WHERE sender = 'user' GROUP BY topic"),
+    "backfill_topics": (
+        ("idx_messages_sender_topic",),
+        "SELECT id, text_content FROM messages WHERE sender = 'user' AND topic IS NULL AND id > 0 "
+        "ORDER BY id LIMIT 5000"),
+    "get_trends": (
+        ("PRIMARY KEY",),
+        "SELECT day, SUM(queries), SUM(positive), SUM(negative) FROM daily_metrics "
+        "WHERE day BETWEEN '2026-01-01' AND '2026-01-31' GROUP BY day"),
+    "get_recent_feedback": (
+        ("idx_messages_recent_feedback", "INTEGER PRIMARY KEY"),
+        "SELECT m.feedback_type, m.feedback_comment, m.timestamp, u.text_content FROM messages m "
+        "JOIN messages u ON u.id = m.reply_to_message_id "
+        "WHERE m.sender = 'assistant' AND m.feedback_type IS NOT NULL ORDER BY m.timestamp DESC LIMIT 10"),
+    "list_kb_entries_category": (
+        ("idx_kb_category",),
+        "SELECT id, category, title FROM health_knowledge_base WHERE id > 0 AND category = 'Symptoms' "
+        "ORDER BY id LIMIT 100"),
+    "backfill_replies": (
+        ("INTEGER PRIMARY KEY", "idx_messages_conversation"),
+        "UPDATE messages SET reply_to_message_id = (" + backfill.REPLY_TO + ") "
+        "WHERE id > 0 AND id <= 5000 AND +sender = 'assistant' AND reply_to_message_id IS NULL"),
+}
+
+
+def _connect(db_path):
+    # Autocommit, so each migration controls its own transaction
+    return sqlite3.connect(db_path, timeout=DB_BUSY_TIMEOUT, isolation_level=None)
+
+
+def applied_versions(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    return {row[0] for row in conn.execute('SELECT version FROM schema_migrations')}
+
+
+def migrate(db_path=DB_PATH):
+    """Apply every pending migration; returns the versions applied by this call"""
+    conn = _connect(db_path)
+    newly_applied = []
+    try:
+        applied = applied_versions(conn)
+        for version, name, steps in MIGRATIONS:
+            if version in applied:
+                continue
+            # BEGIN IMMEDIATE takes the write lock up front, so of several
+            # workers starting together exactly one applies each migration
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                if conn.execute('SELECT 1 FROM schema_migrations WHERE version = ?', (version,)).fetchone():
+                    conn.execute('ROLLBACK')
+                    continue
+                for step in steps:
+                    if callable(step):
+                        step(conn)
+                    else:
+                        conn.execute(step)
+                conn.execute('INSERT INTO schema_migrations (version, name) VALUES (?, ?)', (version, name))
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+            newly_applied.append(version)
+            print(f"Applied migration {version}: {name}")
+    finally:
+        conn.close()
+    return newly_applied
+
+
+def schema_version(db_path=DB_PATH):
+    conn = _connect(db_path)
+    try:
+        return max(applied_versions(conn), default=0)
+    finally:
+        conn.close()
+
+
+def query_plan(conn, sql):
+    return [row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql)]
+
+
+def uses_index(plan, index):
+    """Whether a plan step searches with ``index``"""
+    pattern = re.compile(rf"USING (COVERING )?(INDEX )?{re.escape(index)}\b")
+    return any(pattern.search(step) for step in plan)
+
+
+def plan_problems(plan, indexes):
+    """Full scans in a plan and expected indexes it doesn't use; empty when it is as intended"""
+    # "SCAN messages" is a full scan; "SCAN m USING INDEX ..." is not
+    problems = [step for step in plan if step.startswith('SCAN') and 'INDEX' not in step]
+    problems += [f"not using {index}" for index in indexes if not uses_index(plan, index)]
+    return problems
+
+
+def check_query_plans(db_path=DB_PATH):
+    """Print each hot query's plan; False if any of them misses its indexes"""
+    conn = _connect(db_path)
+    ok = True
+    try:
+        for name, (indexes, sql) in HOT_QUERIES.items():
+            plan = query_plan(conn, sql)
+            problems = plan_problems(plan, indexes)
+            ok = ok and not problems
+            print(f"{'ok' if not problems else 'BAD PLAN':<10}{name} ({', '.join(indexes)})")
+            for step in plan + problems:
+                print(f"          {step}")
+    finally:
+        conn.close()
+    return ok
+
+
+if __name__ == '__main__':
+    command = sys.argv[1] if len(sys.argv) > 1 else 'migrate'
+    if command == 'migrate':
+        migrate()
+        print(f"Schema version {schema_version()}")
+    elif command == 'status':
+        conn = _connect(DB_PATH)
+        applied_versions(conn)
+        for row in conn.execute('SELECT version, name, applied_at FROM schema_migrations ORDER BY version'):
+            print(*row, sep='  ')
+        conn.close()
+    elif command == 'explain':
+        sys.exit(0 if check_query_plans() else 1)
+    else:
+        print("Usage: python migrations.py [migrate|status|explain]")
+        sys.exit(2)
@@ -1,5 +1,7 @@
 import re
 
+from intent_matcher import IntentMatcher
+
 class SimpleNLU:
     def __init__(self):
         self.intent_keywords = {
@@ -15,6 +17,7 @@ class SimpleNLU:
             "mindfulness_practice": ["meditation", "mindful", "mindfulness", "breathe", "breathing", "ध्यान", "सचेतन"],
             "greeting": ["hi", "hello", "hey", "namaste", "good morning", "how are you", "नमस्ते", "हैलो", "गुड मॉर्निंग", "कैसे हैं"],
         }
+        self.intent_matcher = IntentMatcher(self.intent_keywords)
 
     def detect_language(self, text):
         # Check for Devanagari characters
@@ -23,17 +26,11 @@ class SimpleNLU:
         return "en"
 
     def parse(self, message):
-        message_lower = message.lower()
-        for intent, keywords in self.intent_keywords.items():
-            for keyword in keywords:
-                if keyword in message_lower:
-                    return {
-                        "intent": intent,
-                        "entities": {},
-                        "confidence": 0.9
-                    }
+        ranking = self.intent_matcher.rank(message.lower())
+        intent, confidence = ranking[0]
         return {
-            "intent": "fallback",
+            "intent": intent,
             "entities": {},
-            "confidence": 0.5
+            "confidence": confidence,
+            "intents": [{"intent": name, "confidence": score} for name, score in ranking]
         }
\ No newline at end of file
@@ -0,0 +1,258 @@
+import argparse
+import logging
+import os
+import secrets
+import stat
+import tempfile
+import threading
+import time
+from multiprocessing import Process
+from multiprocessing.connection import AuthenticationError, Client, Listener
+
+# Out-of-process NLU: one process per host owns SimpleNLU and the transformer
+# models, and every Flask worker talks to it over a Unix socket through
+# RemoteNLU, which has the same interface as SimpleNLU.
+#
+#   python nlu_worker.py [--socket PATH] [--workers 2]
+#
+# Messages are pickles, so both ends only talk inside a directory private to
+# the user running them (0700, checked before binding and before connecting)
+# and authenticate each other with a shared key: NLU_WORKER_AUTHKEY if set,
+# otherwise a random key the worker writes to <socket dir>/authkey (0600).
+
+
+def runtime_dir():
+    """Default socket directory: $XDG_RUNTIME_DIR/wellbot, else a per-user one in the temp dir"""
+    base = os.environ.get('XDG_RUNTIME_DIR')
+    if base:
+        return os.path.join(base, 'wellbot')
+    return os.path.join(tempfile.gettempdir(), f'wellbot-{os.getuid()}')
+
+
+DEFAULT_SOCKET = os.path.join(runtime_dir(), 'nlu.sock')
+
+
+def private_dir(address, create=False):
+    """Directory of a socket path, refused unless only this user can reach it"""
+    directory = os.path.dirname(os.path.abspath(address))
+    if create:
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+    # lstat, so a symlink planted in a shared directory is refused too
+    info = os.lstat(directory)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & 0o077:
+        raise PermissionError(f"NLU worker socket directory {directory} must be owned by "
+                              f"this user and private (mode 0700)")
+    return directory
+
+
+def load_authkey(directory, create=False):
+    """NLU_WORKER_AUTHKEY, or the key file in the (private) socket directory"""
+    key = os.environ.get('NLU_WORKER_AUTHKEY')
+    if key:
+        return key.encode()
+    path = os.path.join(directory, 'authkey')
+    if create:
+        try:
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        except FileExistsError:
+            pass  # another worker of the pool (or an earlier run) made it
+        else:
+            with os.fdopen(fd, 'w') as f:
+                f.write(secrets.token_hex(32))
+    with open(path, 'r') as f:
+        key = f.read().strip()
+    if not key:
+        raise PermissionError(f"NLU worker key file {path} is empty")
+    return key.encode()
+
+
+# SimpleNLU methods a client may call remotely
+REMOTE_METHODS = {
+    "analyze", "parse", "analyze_and_parse", "extract_entities", "detect_language",
+    "translate_text", "translate_batch", "readiness", "translation_stats",
+}
+
+
+# ---------------- Server ----------------
+def _handle(conn, nlu):
+    with conn:
+        while True:
+            try:
+                method, args, kwargs = conn.recv()
+            except (EOFError, OSError):
+                return
+            try:
+                if method not in REMOTE_METHODS:
+                    raise AttributeError(f"NLU method not allowed: {method}")
+                conn.send(("ok", getattr(nlu, method)(*args, **kwargs)))
+            except Exception as e:
+                conn.send(("error", f"{type(e).__name__}: {e}"))
+
+
+def serve(address=DEFAULT_SOCKET, authkey=None, **nlu_kwargs):
+    """Build SimpleNLU once and answer requests on a Unix socket, one thread per client"""
+    from advanced_nlu import SimpleNLU
+
+    directory = private_dir(address, create=True)
+    if authkey is None:
+        authkey = load_authkey(directory, create=True)
+    if os.path.lexists(address):
+        # Only a stale socket of an earlier run is replaced, never another file
+        if not stat.S_ISSOCK(os.lstat(address).st_mode):
+            raise FileExistsError(f"{address} exists and is not a socket")
+        os.unlink(address)
+    nlu = SimpleNLU(**nlu_kwargs)
+    with Listener(address, family='AF_UNIX', authkey=authkey) as listener:
+        os.chmod(address, 0o600)
+        print(f"NLU worker listening on {address}")
+        while True:
+            try:
+                conn = listener.accept()
+            except Exception as e:
+                logging.error(f"NLU worker accept error: {e}")
+                continue
+            threading.Thread(target=_handle, args=(conn, nlu), daemon=True).start()
+
+
+def pool_addresses(address, workers):
+    """Socket paths of a pool: the address itself, or address.0 .. address.N-1"""
+    if workers <= 1:
+        return [address]
+    return [f"{address}.{i}" for i in range(workers)]
+
+
+# ---------------- Client ----------------
+class RemoteNLU:
+    """SimpleNLU proxy that calls an NLU worker, falling back to a local NLU.
+
+    Each client thread keeps its own connection (a Connection is not thread
+    safe) and threads are spread over the pool's sockets. If the worker can't
+    be reached or doesn't answer within ``timeout`` seconds, the call is
+    answered by ``fallback_factory()`` in-process and the worker is retried
+    after ``retry_seconds``.
+    """
+
+    def __init__(self, addresses, fallback_factory, authkey=None, retry_seconds=5.0, timeout=10.0):
+        self.addresses = list(addresses)
+        self.authkey = authkey
+        self.retry_seconds = retry_seconds
+        self.timeout = timeout
+        self._fallback_factory = fallback_factory
+        self._fallback = None
+        self._fallback_lock = threading.Lock()
+        self._local = threading.local()
+        self._next_address = 0
+        self._down_until = 0.0
+        self.remote_calls = 0
+        self.fallback_calls = 0
+
+    @property
+    def fallback(self):
+        if self._fallback is None:
+            with self._fallback_lock:
+                if self._fallback is None:
+                    self._fallback = self._fallback_factory()
+        return self._fallback
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            address = self.addresses[self._next_address % len(self.addresses)]
+            self._next_address += 1
+            # Never send pickles to a socket another user could have bound
+            directory = private_dir(address)
+            authkey = self.authkey if self.authkey is not None else load_authkey(directory)
+            conn = Client(address, family='AF_UNIX', authkey=authkey)
+            self._local.conn = conn
+        return conn
+
+    def _drop_connection(self):
+        conn = getattr(self._local, "conn", None)
+        self._local.conn = None
+        if conn is not None:
+            try:
+                conn.close()
+            except OSError:
+                pass
+
+    def _call(self, method, *args, **kwargs):
+        if time.monotonic() >= self._down_until:
+            try:
+                conn = self._connection()
+                conn.send((method, args, kwargs))
+                # A wedged worker must not hold the request thread; its late
+                # reply is discarded with the connection
+                if not conn.poll(self.timeout):
+                    raise TimeoutError(f"no reply to {method} within {self.timeout}s")
+                status, result = conn.recv()
+            except (OSError, EOFError, AuthenticationError) as e:
+                logging.error(f"NLU worker unavailable, using in-process NLU: {e}")
+                self._drop_connection()
+                self._down_until = time.monotonic() + self.retry_seconds
+            else:
+                if status == "error":
+                    raise RuntimeError(f"NLU worker error in {method}: {result}")
+                self.remote_calls += 1
+                return result
+        self.fallback_calls += 1
+        return getattr(self.fallback, method)(*args, **kwargs)
+
+    def analyze(self, message):
+        return self._call("analyze", message)
+
+    def parse(self, message):
+        return self._call("parse", message)
+
+    def analyze_and_parse(self, message):
+        return self._call("analyze_and_parse", message)
+
+    def extract_entities(self, message):
+        return self._call("extract_entities", message)
+
+    def detect_language(self, message):
+        return self._call("detect_language", message)
+
+    def translate_text(self, text, source_lang, target_lang):
+        return self._call("translate_text", text, source_lang, target_lang)
+
+    def translate_batch(self, texts, source_lang, target_lang):
+        return self._call("translate_batch", texts, source_lang, target_lang)
+
+    def translation_stats(self):
+        return self._call("translation_stats")
+
+    def readiness(self):
+        status = self._call("readiness")
+        status["worker"] = {
+            "addresses": self.addresses,
+            "remote_calls": self.remote_calls,
+            "fallback_calls": self.fallback_calls,
+            "available": time.monotonic() >= self._down_until,
+        }
+        return status
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run the shared WellBot NLU worker")
+    parser.add_argument('--socket', default=DEFAULT_SOCKET, help="Unix socket path")
+    parser.add_argument('--workers', type=int, default=1, help="number of worker processes")
+    parser.add_argument('--no-models', action='store_true', help="skip Indic-BERT/MarianMT")
+    parser.add_argument('--quantize', action='store_true', help="dynamic int8 models")
+    args = parser.parse_args()
+
+    nlu_kwargs = {
+        "load_models": not args.no_models,
+        "quantize": args.quantize,
+        "intent_model_path": os.environ.get('INTENT_MODEL') or None,
+    }
+    addresses = pool_addresses(args.socket, args.workers)
+    # One key for the whole pool, made before any worker starts
+    nlu_kwargs["authkey"] = load_authkey(private_dir(args.socket, create=True), create=True)
+    if len(addresses) == 1:
+        serve(addresses[0], **nlu_kwargs)
+    else:
+        processes = [Process(target=serve, args=(address,), kwargs=nlu_kwargs) for address in addresses]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
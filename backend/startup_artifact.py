@@ -0,0 +1,285 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+from array import array
+
+from kb_index import KBMatcher, KBRetriever, KeywordAutomaton, ReplyTable, np, sparse
+
+# Precompiled startup state: the KB keyword automata, BM25 matrices and every
+# KB reply string, written once to a versioned file as flat arrays. Workers
+# map the file read-only and search those arrays in place, so the pages are
+# shared between all workers instead of rebuilt and held by each of them.
+#
+#   python startup_artifact.py build   # rebuild from kb.json + the DB KB
+#   python startup_artifact.py info    # header of the current artifact
+#
+# app.py rebuilds the file on its own whenever kb.json, the DB KB or the code
+# that defines the index layout changes (see fingerprint()).
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ARTIFACT_PATH = os.path.join(BASE_DIR, 'startup_artifact.bin')
+
+MAGIC = b'WELLBOT\x00'
+FORMAT_VERSION = 2
+PREFIX = struct.Struct('<8sI')  # magic, header length
+# Sections start on page boundaries so each can be mapped/released on its own
+ALIGN = mmap.PAGESIZE
+
+# Modules that define the indexes and the tokenization they were built with
+INDEX_SOURCES = ['kb_index.py', 'text_analysis.py']
+
+
+# ---------------- Fingerprint ----------------
+def _file_digest(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def source_digest(kb_path='kb.json'):
+    """Digest of everything but the DB rows: kb.json, index code, format and Python"""
+    digest = hashlib.sha256()
+    digest.update(f"{FORMAT_VERSION}|{sys.version_info[:2]}|{sys.byteorder}".encode())
+    digest.update(_file_digest(kb_path).encode())
+    for name in INDEX_SOURCES:
+        digest.update(_file_digest(os.path.join(BASE_DIR, name)).encode())
+    return digest.hexdigest()
+
+
+def fingerprint(sources, kb_rows, ranked):
+    """Identity of an artifact: source digest + DB KB rows + retrieval mode"""
+    digest = hashlib.sha256(sources.encode())
+    digest.update(repr(sorted(tuple(row) for row in kb_rows)).encode('utf-8'))
+    digest.update(b'ranked' if ranked else b'keyword')
+    return digest.hexdigest()
+
+
+# ---------------- Mapped strings ----------------
+class MappedStrings:
+    """Read-only sequence of strings stored as UTF-8 in a mapped file.
+
+    ``bounds`` holds n + 1 byte offsets into ``data``; nothing is decoded
+    until an item is read.
+    """
+
+    def __init__(self, data, bounds):
+        self.data = data
+        self.bounds = bounds
+
+    def __len__(self):
+        return len(self.bounds) - 1
+
+    def __getitem__(self, index):
+        return self.data[self.bounds[index]:self.bounds[index + 1]].tobytes().decode('utf-8')
+
+
+# ---------------- Writing ----------------
+def _pad(size):
+    return b'\x00' * (-size % ALIGN)
+
+
+def _sections(snapshot):
+    """(name, bytes) sections holding the snapshot's indexes, and their header metadata"""
+    encoded = [text.encode('utf-8') for text in snapshot.replies.texts]
+    bounds = array('Q', [0])
+    for blob in encoded:
+        bounds.append(bounds[-1] + len(blob))
+    sections = [("bounds", bounds.tobytes()), ("strings", b''.join(encoded))]
+    meta = {"strings": len(encoded), "automata": {}, "retriever": None}
+
+    for language, automaton in snapshot.matcher.automata.items():
+        for name in KeywordAutomaton.ARRAYS:
+            sections.append((f"automaton.{language}.{name}", automaton.arrays[name].tobytes()))
+        meta["automata"][language] = {"always": sorted(automaton.always)}
+
+    retriever = snapshot.retriever
+    if retriever is not None:
+        meta["retriever"] = {}
+        for language, matrix in retriever.matrix.items():
+            vocab = retriever.vocab[language]
+            terms = sorted(vocab, key=vocab.get)
+            sections.append((f"bm25.{language}.vocab", json.dumps(terms).encode('utf-8')))
+            for name in ("data", "indices", "indptr"):
+                sections.append((f"bm25.{language}.{name}", getattr(matrix, name).tobytes()))
+            meta["retriever"][language] = {
+                "shape": list(matrix.shape),
+                "dtypes": {name: getattr(matrix, name).dtype.str for name in ("data", "indices", "indptr")},
+            }
+    return sections, meta
+
+
+def write(path, fingerprint_value, snapshot):
+    """Write the indexes of ``snapshot`` as an artifact, atomically"""
+    sections, meta = _sections(snapshot)
+    header = {
+        "format": FORMAT_VERSION,
+        "fingerprint": fingerprint_value,
+        "built_at": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        "kb_version": snapshot.version,
+        "entries": len(snapshot.entries),
+        **meta,
+        "sections": {},
+    }
+    # The header size depends on the offsets in it, so reserve a fixed width
+    header_size = ALIGN - PREFIX.size
+    offset = PREFIX.size + header_size
+    for name, blob in sections:
+        header["sections"][name] = [offset, len(blob)]
+        offset += len(blob) + len(_pad(len(blob)))
+    header_bytes = json.dumps(header).encode('utf-8')
+    if len(header_bytes) > header_size:
+        raise ValueError("startup artifact header too large")
+
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(PREFIX.pack(MAGIC, header_size))
+        f.write(header_bytes.ljust(header_size, b' '))
+        for _, blob in sections:
+            f.write(blob)
+            f.write(_pad(len(blob)))
+        # On disk before it is renamed into place; clean pages also map shared
+        f.flush()
+        os.fsync(f.fileno())
+    # Workers that already mapped the old file keep their pages
+    os.replace(tmp_path, path)
+    return header
+
+
+# ---------------- Loading ----------------
+class StartupArtifact:
+    """A mapped artifact whose indexes are read in place from the shared pages"""
+
+    def __init__(self, path, mapped, header):
+        self.path = path
+        self.header = header
+        self._mapped = mapped
+        self._view = memoryview(mapped)
+
+        self.replies = ReplyTable(MappedStrings(self._section("strings"), self._section("bounds").cast('Q')))
+        self.automata = {
+            language: KeywordAutomaton.from_arrays(
+                {name: self._section(f"automaton.{language}.{name}").cast('I')
+                 for name in KeywordAutomaton.ARRAYS},
+                meta["always"])
+            for language, meta in header["automata"].items()
+        }
+        self.retriever_indexes = None
+        if header["retriever"] is not None:
+            self.retriever_indexes = {
+                language: self._matrix(language, meta) for language, meta in header["retriever"].items()
+            }
+
+    def _section(self, name):
+        start, length = self.header["sections"][name]
+        return self._view[start:start + length]
+
+    def _matrix(self, language, meta):
+        # Only the term -> column map is rebuilt; the CSC arrays stay mapped
+        terms = json.loads(self._section(f"bm25.{language}.vocab").tobytes())
+        data, indices, indptr = (
+            np.frombuffer(self._section(f"bm25.{language}.{name}"), dtype=meta["dtypes"][name])
+            for name in ("data", "indices", "indptr")
+        )
+        matrix = sparse.csc_matrix((data, indices, indptr), shape=tuple(meta["shape"]), copy=False)
+        return {term: term_id for term_id, term in enumerate(terms)}, matrix
+
+    def indexes(self, entries):
+        """KBSnapshot index arguments over ``entries``, the KB the artifact was built from"""
+        if len(entries) != self.header["entries"]:
+            return None
+        indexes = {"matcher": KBMatcher(entries, automata=self.automata), "replies": self.replies}
+        if self.retriever_indexes is not None:
+            indexes["retriever"] = KBRetriever(entries, indexes=self.retriever_indexes)
+        return indexes
+
+
+def read_header(path):
+    with open(path, 'rb') as f:
+        magic, header_size = PREFIX.unpack(f.read(PREFIX.size))
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a startup artifact")
+        return json.loads(f.read(header_size))
+
+
+def load(path, expected_fingerprint):
+    """Map the artifact at ``path``, or None if it is missing, stale or unreadable"""
+    try:
+        header = read_header(path)
+        if header.get("format") != FORMAT_VERSION or header.get("fingerprint") != expected_fingerprint:
+            return None
+        with open(path, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return StartupArtifact(path, mapped, header)
+    except (OSError, ValueError, KeyError, TypeError, struct.error) as e:
+        print(f"Startup artifact not usable, rebuilding: {e}")
+        return None
+
+
+class ArtifactWriter:
+    """Rewrites the artifact off the request path whenever the live KB changes.
+
+    Writes are serialized and a snapshot older than the last one written is
+    skipped, so a slow write can't replace a newer artifact. A file that
+    already holds these rows (written by another worker) is left alone.
+    """
+
+    def __init__(self, path, sources, ranked):
+        self.path = path
+        self.sources = sources
+        self.ranked = ranked
+        self._lock = threading.Lock()
+        self._written_version = -1
+
+    def fingerprint(self, kb_rows):
+        return fingerprint(self.sources, kb_rows, self.ranked)
+
+    def write(self, snapshot, kb_rows):
+        value = self.fingerprint(kb_rows)
+        with self._lock:
+            if snapshot.version < self._written_version:
+                return
+            try:
+                if read_header(self.path).get("fingerprint") == value:
+                    self._written_version = snapshot.version
+                    return
+            except (OSError, ValueError, struct.error):
+                pass
+            try:
+                write(self.path, value, snapshot)
+                self._written_version = snapshot.version
+            except OSError as e:
+                print(f"Could not write startup artifact: {e}")
+
+    def write_async(self, snapshot, kb_rows):
+        threading.Thread(target=self.write, args=(snapshot, kb_rows), daemon=True).start()
+
+
+# ---------------- CLI ----------------
+def build(path=ARTIFACT_PATH, kb_path='kb.json', ranked=None):
+    """Build the artifact the app would build for the current kb.json and DB KB"""
+    from db_setup import get_kb_entries
+    from kb_index import LiveKB
+
+    if ranked is None:
+        ranked = os.environ.get('KB_RETRIEVAL', 'keyword') == 'ranked'
+    with open(kb_path, 'r', encoding='utf-8') as f:
+        knowledge_base = json.load(f)
+    kb_rows = get_kb_entries()
+    live_kb = LiveKB(kb_rows, reference=knowledge_base, ranked=ranked)
+    header = write(path, fingerprint(source_digest(kb_path), kb_rows, ranked), live_kb.snapshot)
+    print(f"Wrote {path} ({os.path.getsize(path) // 1024} KB): {json.dumps(header)}")
+
+
+if __name__ == '__main__':
+    command = sys.argv[1] if len(sys.argv) > 1 else 'build'
+    if command == 'build':
+        build()
+    elif command == 'info':
+        print(json.dumps(read_header(ARTIFACT_PATH), indent=2))
+    else:
+        print("Usage: python startup_artifact.py [build|info]")
+        sys.exit(2)
@@ -0,0 +1,59 @@
+import os
+import tempfile
+import unittest
+
+import migrations
+
+# The hot queries in migrations.HOT_QUERIES, planned against a freshly
+# migrated database: each must search with the indexes it names.
+#
+#   python -m pytest test_migrations.py   (or: python -m unittest test_migrations)
+
+
+class HotQueryPlanTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        db_path = os.path.join(cls.tmp.name, 'chat_history.db')
+        migrations.migrate(db_path)
+        cls.conn = migrations._connect(db_path)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.conn.close()
+        cls.tmp.cleanup()
+
+    def plan(self, name):
+        return migrations.query_plan(self.conn, migrations.HOT_QUERIES[name][1])
+
+    def test_every_hot_query_uses_its_indexes(self):
+        for name, (indexes, sql) in migrations.HOT_QUERIES.items():
+            with self.subTest(name):
+                plan = migrations.query_plan(self.conn, sql)
+                for index in indexes:
+                    self.assertTrue(migrations.uses_index(plan, index), f"{name} not using {index}: {plan}")
+                self.assertEqual(migrations.plan_problems(plan, indexes), [])
+
+    def test_user_feedback_stats_start_from_the_users_conversations(self):
+        plan = self.plan("user_stats_feedback")
+        self.assertIn("idx_conversations_user_open", plan[0])
+        # The global index walks every rated message of every user
+        self.assertFalse(migrations.uses_index(plan, "idx_messages_sender_feedback"))
+
+    def test_index_names_match_whole_names(self):
+        plan = ["SEARCH m USING COVERING INDEX idx_messages_conversation_feedback (conversation_id=?)"]
+        self.assertTrue(migrations.uses_index(plan, "idx_messages_conversation_feedback"))
+        self.assertFalse(migrations.uses_index(plan, "idx_messages_conversation"))
+        self.assertFalse(migrations.uses_index(["SCAN messages"], "INTEGER PRIMARY KEY"))
+
+    def test_full_scan_is_a_problem(self):
+        self.assertEqual(migrations.plan_problems(["SCAN messages"], ()), ["SCAN messages"])
+        self.assertEqual(migrations.plan_problems(["SCAN m USING INDEX idx_messages_conversation"],
+                                                  ("idx_messages_conversation",)), [])
+
+    def test_migrate_again_is_a_no_op(self):
+        self.assertEqual(migrations.migrate(os.path.join(self.tmp.name, 'chat_history.db')), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
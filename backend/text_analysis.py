@@ -0,0 +1,66 @@
+import re
+
+# Single-pass analysis of a chat message, shared by NLU parsing, KB lookup and
+# reply-field selection so the message is lowercased and scanned only once.
+
+TOKEN_PATTERN = re.compile(r"[\w\u0900-\u097F]+")
+
+# Function words that carry no signal about which KB entry is meant
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "can", "do", "does", "for", "from",
+    "give", "have", "how", "i", "if", "in", "is", "it", "me", "my", "of", "on",
+    "or", "should", "the", "to", "what", "with", "you", "your",
+    "और", "का", "की", "के", "को", "क्या", "है", "हैं", "में", "मुझे", "से", "हो",
+}
+
+HINDI_CHARS = frozenset('अआइईउऊएऐओऔकखगघङचछजझञटठडढणतथदधनपफबभमयरलवशषसहक्षत्रज्ञ')
+ENGLISH_CHARS = frozenset('abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ')
+
+
+def normalize_text(text):
+    """Lowercase and collapse whitespace"""
+    return " ".join(text.lower().split())
+
+
+def query_key(text):
+    """Lowercase words only, so "Fever??" and "fever" count as the same query"""
+    return " ".join(TOKEN_PATTERN.findall(text.lower()))
+
+
+def tokenize(text):
+    """Lowercased word tokens without stopwords, keeping Devanagari vowel signs inside words"""
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+
+def detect_script(text):
+    """'hi' if the text has more Devanagari letters than Latin ones, else 'en'"""
+    hindi_count = 0
+    english_count = 0
+    for char in text:
+        if char in HINDI_CHARS:
+            hindi_count += 1
+        elif char in ENGLISH_CHARS:
+            english_count += 1
+    return "hi" if hindi_count > english_count else "en"
+
+
+class TextAnalysis:
+    """Everything the chat pipeline needs to know about one message"""
+
+    __slots__ = ("text", "lowered", "tokens", "terms", "language", "entities")
+
+    def __init__(self, text):
+        self.text = text
+        self.lowered = text.lower()
+        self.tokens = TOKEN_PATTERN.findall(self.lowered)
+        self.terms = [token for token in self.tokens if token not in STOPWORDS]
+        self.language = detect_script(text)
+        # Filled in by SimpleNLU.analyze, which owns the entity patterns
+        self.entities = None
+
+
+def lowered_text(message):
+    """Lowercased text of a plain string or a TextAnalysis"""
+    if isinstance(message, TextAnalysis):
+        return message.lowered
+    return message.lower()
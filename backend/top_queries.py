@@ -0,0 +1,444 @@
+import heapq
+import logging
+import math
+import os
+import sys
+import threading
+import time
+
+from db_setup import get_connection, retry_on_busy
+from text_analysis import query_key
+
+# Most common user queries, globally and per user, without grouping over the
+# messages table. Each scope keeps a Space-Saving summary (Metwally et al.):
+# a fixed number of counters, 1/epsilon of them, where every reported count
+# is an upper bound on the true one and overestimates it by at most
+# epsilon * (queries seen in that scope). Any query asked more often than
+# that is guaranteed to be in the summary.
+#
+# Each worker counts its own /chat queries into an in-memory delta and a
+# checkpoint thread periodically merges the delta into the summaries stored
+# in SQLite (Space-Saving summaries merge with the same error bound), then
+# reloads the merged global summary, so every worker serves the counts of all
+# of them, at most one checkpoint interval old.
+#
+# The summaries only hold history once they are built from the messages
+# table: inline by migration 9 for small databases, by `rebuild` otherwise.
+# Until then top() answers with the exact GROUP BY over messages. A rebuild
+# stamps the time it ran; worker counts from before it are already in the
+# rebuilt summaries, so checkpoints drop them instead of counting them twice.
+#
+#   python top_queries.py            # show the stored global top 10
+#   python top_queries.py rebuild    # recompute every summary from messages
+
+GLOBAL_SCOPE = 'global'
+
+
+def user_scope(user_id):
+    return f'user:{user_id}'
+
+
+class SpaceSaving:
+    """Top-k counts of a stream in ``capacity`` counters"""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.counts = {}  # key -> [count, error]
+        self.total = 0
+        self._heap = []  # (count, key), possibly stale; finds the smallest counter
+
+    def add(self, key, weight=1):
+        self.total += weight
+        entry = self.counts.get(key)
+        if entry is None:
+            if len(self.counts) < self.capacity:
+                entry = self.counts[key] = [weight, 0]
+            else:
+                # Replace the smallest counter; the new key inherits its count
+                # as possible overestimate
+                smallest = self._pop_min()
+                floor = self.counts.pop(smallest)[0]
+                entry = self.counts[key] = [floor + weight, floor]
+        else:
+            entry[0] += weight
+        heapq.heappush(self._heap, (entry[0], key))
+        if len(self._heap) > 2 * self.capacity + 64:
+            self._reheap()
+
+    def _pop_min(self):
+        while True:
+            count, key = heapq.heappop(self._heap)
+            entry = self.counts.get(key)
+            if entry is not None and entry[0] == count:
+                return key
+
+    def _reheap(self):
+        self._heap = [(count, key) for key, (count, _) in self.counts.items()]
+        heapq.heapify(self._heap)
+
+    def min_count(self):
+        """Upper bound on the count of any key not in the summary"""
+        if len(self.counts) < self.capacity:
+            return 0
+        return min(count for count, _ in self.counts.values())
+
+    def merge(self, other):
+        """Fold another summary into this one (mergeable Space-Saving)"""
+        floor, other_floor = self.min_count(), other.min_count()
+        merged = {}
+        for key in self.counts.keys() | other.counts.keys():
+            count, error = self.counts.get(key, (floor, floor))
+            other_count, other_error = other.counts.get(key, (other_floor, other_floor))
+            merged[key] = [count + other_count, error + other_error]
+        if len(merged) > self.capacity:
+            merged = dict(heapq.nlargest(self.capacity, merged.items(), key=lambda item: item[1][0]))
+        self.counts = merged
+        self.total += other.total
+        self._reheap()
+
+    def top(self, n):
+        """[(key, estimated count)] for the n largest counters, largest first"""
+        return [(key, entry[0]) for key, entry in
+                heapq.nlargest(n, self.counts.items(), key=lambda item: (item[1][0], -item[1][1]))]
+
+
+def load_summary(conn, scope, capacity):
+    summary = SpaceSaving(capacity)
+    row = conn.execute('SELECT total FROM query_summaries WHERE scope = ?', (scope,)).fetchone()
+    if row is None:
+        return summary
+    summary.total = row[0]
+    # Largest first, so a lowered capacity keeps the right counters
+    for query, count, error in conn.execute(
+            'SELECT query, count, error FROM query_counts WHERE scope = ? ORDER BY count DESC LIMIT ?',
+            (scope, capacity)):
+        summary.counts[query] = [count, error]
+    summary._reheap()
+    return summary
+
+
+def summarize(records, capacity, user_capacity):
+    """{scope: SpaceSaving} of (added_at, user_id, key) records"""
+    summaries = {}
+    for _, user_id, key in records:
+        for scope, size in ((GLOBAL_SCOPE, capacity), (user_scope(user_id), user_capacity)):
+            if scope not in summaries:
+                summaries[scope] = SpaceSaving(size)
+            summaries[scope].add(key)
+    return summaries
+
+
+def save_summary(conn, scope, summary):
+    conn.execute('DELETE FROM query_counts WHERE scope = ?', (scope,))
+    conn.executemany('INSERT INTO query_counts (scope, query, count, error) VALUES (?, ?, ?, ?)',
+                     [(scope, query, count, error) for query, (count, error) in summary.counts.items()])
+    conn.execute('INSERT INTO query_summaries (scope, total) VALUES (?, ?) '
+                 'ON CONFLICT(scope) DO UPDATE SET total = excluded.total', (scope, summary.total))
+
+
+def rebuilt_at(conn):
+    """When the summaries were last built from messages, or None if they never were"""
+    row = conn.execute('SELECT rebuilt_at FROM query_summary_state').fetchone()
+    return row[0] if row else None
+
+
+def exact_top(conn, n, user_id=None):
+    """[(query, count)] grouped over every user message; used until the summaries are built"""
+    if user_id is None:
+        rows = conn.execute('''
+            SELECT text_content, COUNT(*) as count
+            FROM messages
+            WHERE sender = 'user'
+            GROUP BY text_content
+            ORDER BY count DESC
+            LIMIT ?
+        ''', (n,))
+    else:
+        rows = conn.execute('''
+            SELECT text_content, COUNT(*) as count
+            FROM messages m
+            JOIN conversations c ON m.conversation_id = c.id
+            WHERE c.userid = ? AND m.sender = 'user'
+            GROUP BY text_content
+            ORDER BY count DESC
+            LIMIT ?
+        ''', (user_id, n))
+    return [tuple(row) for row in rows]
+
+
+class QueryTracker:
+    """Global and per-user top queries, checkpointed to SQLite"""
+
+    def __init__(self, epsilon=0.001, user_epsilon=0.02, checkpoint_seconds=30):
+        self.capacity = math.ceil(1 / epsilon)
+        self.user_capacity = math.ceil(1 / user_epsilon)
+        self.checkpoint_seconds = checkpoint_seconds
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._pid = None
+        self._built = False
+        self.checkpoints = 0
+        self.failed_checkpoints = 0
+        self.dropped = 0
+
+    def _ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            # A forked child starts from the stored summaries, not its parent's counts
+            self._views = {}  # scope -> summary served (stored + pending)
+            self._pending = []  # (added_at, user_id, key) not checkpointed yet
+            self._stop = threading.Event()
+            if self.checkpoint_seconds > 0:
+                threading.Thread(target=self._run, name="top-queries-checkpoint", daemon=True).start()
+            self._pid = os.getpid()
+
+    def _capacity(self, scope):
+        return self.capacity if scope == GLOBAL_SCOPE else self.user_capacity
+
+    def add(self, user_id, text):
+        """Count one user query"""
+        key = query_key(text)
+        if not key:
+            return
+        self._ensure_started()
+        with self._lock:
+            # The time fences this query against a rebuild (see checkpoint)
+            self._pending.append((time.time(), user_id, key))
+            for scope in (GLOBAL_SCOPE, user_scope(user_id)):
+                view = self._views.get(scope)
+                if view is not None:
+                    view.add(key)
+
+    def _view(self, scope):
+        self._ensure_started()
+        with self._lock:
+            view = self._views.get(scope)
+        if view is not None:
+            return view
+        conn = get_connection()
+        try:
+            stored = load_summary(conn, scope, self._capacity(scope))
+        finally:
+            conn.close()
+        with self._lock:
+            if scope not in self._views:
+                # Queries added while loading are still pending
+                pending = summarize(self._pending, self.capacity, self.user_capacity).get(scope)
+                if pending is not None:
+                    stored.merge(pending)
+                self._views[scope] = stored
+            return self._views[scope]
+
+    def is_built(self):
+        """Whether the stored summaries hold the history; once built they stay built"""
+        if not self._built:
+            conn = get_connection()
+            try:
+                self._built = rebuilt_at(conn) is not None
+            finally:
+                conn.close()
+        return self._built
+
+    def top(self, n=10, user_id=None):
+        """[(query, estimated count)], largest first; global unless user_id is given"""
+        if not self.is_built():
+            conn = get_connection()
+            try:
+                return exact_top(conn, n, user_id)
+            finally:
+                conn.close()
+        view = self._view(GLOBAL_SCOPE if user_id is None else user_scope(user_id))
+        with self._lock:
+            return view.top(n)
+
+    @retry_on_busy
+    def _merge_into_store(self, records):
+        conn = get_connection()
+        try:
+            # One writer at a time, so concurrent workers' merges don't overwrite
+            # each other, and no rebuild can slip in between the fence and the merge
+            conn.execute('BEGIN IMMEDIATE')
+            fence = rebuilt_at(conn)
+            # Not built yet: the rebuild will count these from messages. Built:
+            # queries from before it are already in the summaries
+            fresh = [] if fence is None else [record for record in records if record[0] >= fence]
+            for scope, delta in summarize(fresh, self.capacity, self.user_capacity).items():
+                stored = load_summary(conn, scope, self._capacity(scope))
+                stored.merge(delta)
+                save_summary(conn, scope, stored)
+            merged_global = load_summary(conn, GLOBAL_SCOPE, self.capacity)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+        return merged_global, fence is not None, len(records) - len(fresh)
+
+    def checkpoint(self):
+        """Merge this worker's uncheckpointed queries into the stored summaries"""
+        if self._pid != os.getpid():
+            return
+        with self._lock:
+            records, self._pending = self._pending, []
+        try:
+            merged_global, built, dropped = self._merge_into_store(records)
+        except Exception as e:
+            logging.error(f"Top queries checkpoint failed, keeping {len(records)} queries for the next one: {e}")
+            self.failed_checkpoints += 1
+            with self._lock:
+                self._pending = records + self._pending
+            return
+        with self._lock:
+            # Pick up other workers' counts (and a rebuild); per-user views are
+            # reloaded on their next read, which keeps memory to the recently
+            # active users
+            pending = summarize(self._pending, self.capacity, self.user_capacity).get(GLOBAL_SCOPE)
+            if pending is not None:
+                merged_global.merge(pending)
+            self._views = {GLOBAL_SCOPE: merged_global}
+        self._built = self._built or built
+        self.dropped += dropped
+        self.checkpoints += 1
+
+    def close(self):
+        if self._pid == os.getpid():
+            self._stop.set()
+            self.checkpoint()
+
+    def _run(self):
+        while not self._stop.wait(self.checkpoint_seconds):
+            self.checkpoint()
+
+    def stats(self):
+        view = self._view(GLOBAL_SCOPE)
+        with self._lock:
+            total, max_error, pending = view.total, view.min_count(), len(self._pending)
+        return {
+            "capacity": self.capacity,
+            "user_capacity": self.user_capacity,
+            # False until the summaries are built; top() groups over messages till then
+            "built": self.is_built(),
+            "queries": total,
+            # Largest possible overestimate of any global count right now
+            # (never more than queries / capacity)
+            "max_error": max_error,
+            "pending_queries": pending,
+            # Queries a checkpoint left to a rebuild that counts them from messages
+            "dropped_queries": self.dropped,
+            "checkpoints": self.checkpoints,
+            "failed_checkpoints": self.failed_checkpoints,
+        }
+
+
+# ---------------- Rebuild ----------------
+def rebuild_summaries(conn, capacity, user_capacity):
+    """Recompute every summary from the user messages in the database.
+
+    Runs inside a write transaction, so no message commits between the scan
+    and the time stamped as the checkpoint fence.
+    """
+    summaries = {GLOBAL_SCOPE: SpaceSaving(capacity)}
+    for user_id, text in conn.execute('''
+            SELECT c.userid, m.text_content FROM messages m
+            JOIN conversations c ON c.id = m.conversation_id
+            WHERE m.sender = 'user' ORDER BY m.id'''):
+        key = query_key(text)
+        if not key:
+            continue
+        summaries[GLOBAL_SCOPE].add(key)
+        scope = user_scope(user_id)
+        if scope not in summaries:
+            summaries[scope] = SpaceSaving(user_capacity)
+        summaries[scope].add(key)
+    conn.execute('DELETE FROM query_counts')
+    conn.execute('DELETE FROM query_summaries')
+    for scope, summary in summaries.items():
+        save_summary(conn, scope, summary)
+    conn.execute('DELETE FROM query_summary_state')
+    conn.execute('INSERT INTO query_summary_state (rebuilt_at) VALUES (?)', (time.time(),))
+    return len(summaries)
+
+
+@retry_on_busy
+def rebuild(capacity, user_capacity):
+    conn = get_connection()
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        scopes = rebuild_summaries(conn, capacity, user_capacity)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return scopes
+
+
+def _configured_capacities():
+    return (math.ceil(1 / float(os.environ.get('TOP_QUERIES_EPSILON', 0.001))),
+            math.ceil(1 / float(os.environ.get('TOP_QUERIES_USER_EPSILON', 0.02))))
+
+
+def install(conn):
+    """Migration step: the summary tables (filled by install_state)"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS query_summaries (
+            scope TEXT PRIMARY KEY,
+            total INTEGER NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS query_counts (
+            scope TEXT NOT NULL,
+            query TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            error INTEGER NOT NULL,
+            PRIMARY KEY (scope, query)
+        ) WITHOUT ROWID
+    ''')
+
+
+def install_state(conn):
+    """Migration step: record whether the summaries hold the history; fill them if it is small"""
+    conn.execute('CREATE TABLE IF NOT EXISTS query_summary_state (rebuilt_at REAL NOT NULL)')
+    if rebuilt_at(conn) is not None:
+        return
+    pending = conn.execute("SELECT COUNT(*) FROM messages WHERE sender = 'user'").fetchone()[0]
+    # Summaries migration 7 filled (or a rebuild did) count every past query;
+    # ones that only hold live counts fall short of the history
+    stored = conn.execute('SELECT total FROM query_summaries WHERE scope = ?', (GLOBAL_SCOPE,)).fetchone()
+    if stored is not None and stored[0] >= pending:
+        conn.execute('INSERT INTO query_summary_state (rebuilt_at) VALUES (?)', (time.time(),))
+        return
+    # Deferred import: backfill and this module both sit below migrations
+    from backfill import INLINE_LIMIT
+    if pending > INLINE_LIMIT:
+        print(f"{pending} past queries not in the top queries yet, which are grouped over messages "
+              f"until you run: python top_queries.py rebuild")
+        return
+    rebuild_summaries(conn, *_configured_capacities())
+
+
+if __name__ == '__main__':
+    command = sys.argv[1] if len(sys.argv) > 1 else 'show'
+    if command == 'rebuild':
+        started = time.perf_counter()
+        scopes = rebuild(*_configured_capacities())
+        print(f"Rebuilt {scopes} query summaries in {time.perf_counter() - started:.1f}s")
+    elif command == 'show':
+        conn = get_connection()
+        summary = load_summary(conn, GLOBAL_SCOPE, _configured_capacities()[0])
+        built = rebuilt_at(conn) is not None
+        conn.close()
+        if not built:
+            print("Summaries not built from the history yet; run: python top_queries.py rebuild")
+        print(f"{summary.total} queries, counts at most {math.ceil(summary.total / summary.capacity)} too high")
+        for query, count in summary.top(10):
+            print(f"{count:>8}  {query}")
+    else:
+        print("Usage: python top_queries.py [show|rebuild]")
+        sys.exit(2)
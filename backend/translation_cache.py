@@ -0,0 +1,208 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+
+from cache import TTLCache
+from db_setup import ConnectionPool
+
+# Two-level cache for MarianMT output: an in-process LRU in front of a SQLite
+# table that survives restarts and is shared by every worker on the host.
+# The disk level is best effort: it runs in WAL mode on pooled connections,
+# and a locked or failing database only costs a cache miss, never the
+# translation.
+#
+#   python translation_cache.py warm   # translate every kb.json text field
+
+DEFAULT_PATH = os.path.join(os.path.dirname(__file__), 'translation_cache.db')
+
+# kb.json fields by language; each is translated into the other language
+KB_TEXT_FIELDS = {
+    "en": ["condition", "symptoms_en", "self_care_en", "when_to_seek_doctor_en", "answer_en", "disclaimer"],
+    "hi": ["condition_hi", "symptoms_hi", "self_care_hi", "when_to_seek_doctor_hi", "answer_hi"],
+}
+
+
+def text_hash(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class TranslationCache:
+    """Translations keyed by (source language, target language, model id, text hash)"""
+
+    def __init__(self, db_path=DEFAULT_PATH, memory_size=4096):
+        self.db_path = db_path
+        self.memory = TTLCache(memory_size, ttl=float('inf'))
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.disk_errors = 0
+        # Same pooled WAL connections as chat_history.db; a cache waits on a
+        # lock for at most a second before giving up on the disk level
+        self._pool = ConnectionPool(db_path, timeout=1.0) if db_path else None
+        if self._pool is not None:
+            try:
+                self._create_table()
+            except sqlite3.Error as e:
+                logging.warning(f"Translation cache at {db_path} unusable, memory only: {e}")
+                self._pool = None
+
+    def _create_table(self):
+        conn = self._pool.acquire()
+        try:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS translation_cache (
+                    source_lang TEXT NOT NULL,
+                    target_lang TEXT NOT NULL,
+                    model_id TEXT NOT NULL,
+                    text_hash TEXT NOT NULL,
+                    source_text TEXT NOT NULL,
+                    translated_text TEXT NOT NULL,
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (source_lang, target_lang, model_id, text_hash)
+                )
+            ''')
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _disk_error(self, action, error):
+        self._count('disk_errors')
+        logging.warning(f"Translation cache {action} failed, using memory only: {error}")
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def get(self, text, source_lang, target_lang, model_id):
+        """Cached translation or None"""
+        key = (source_lang, target_lang, model_id, text_hash(text))
+        translated = self.memory.get(key)
+        if translated is not None:
+            self._count('memory_hits')
+            return translated
+
+        if self._pool is not None:
+            conn = None
+            try:
+                # Opening a connection sets WAL mode, which can fail too
+                conn = self._pool.acquire()
+                row = conn.execute(
+                    'SELECT translated_text FROM translation_cache '
+                    'WHERE source_lang = ? AND target_lang = ? AND model_id = ? AND text_hash = ?',
+                    key
+                ).fetchone()
+            except sqlite3.Error as e:
+                self._disk_error('read', e)
+                row = None
+            finally:
+                if conn is not None:
+                    conn.close()
+            if row:
+                self.memory.set(key, row[0])
+                self._count('disk_hits')
+                return row[0]
+
+        self._count('misses')
+        return None
+
+    def put(self, text, source_lang, target_lang, model_id, translated):
+        self.put_many([(text, translated)], source_lang, target_lang, model_id)
+
+    def put_many(self, pairs, source_lang, target_lang, model_id):
+        """Store (source text, translation) pairs in both levels"""
+        rows = []
+        for text, translated in pairs:
+            key = (source_lang, target_lang, model_id, text_hash(text))
+            self.memory.set(key, translated)
+            rows.append(key + (text, translated))
+        if self._pool is not None and rows:
+            conn = None
+            try:
+                conn = self._pool.acquire()
+                conn.executemany(
+                    'INSERT OR REPLACE INTO translation_cache '
+                    '(source_lang, target_lang, model_id, text_hash, source_text, translated_text) '
+                    'VALUES (?, ?, ?, ?, ?, ?)',
+                    rows
+                )
+                conn.commit()
+            except sqlite3.Error as e:
+                self._disk_error('write', e)
+            finally:
+                if conn is not None:
+                    conn.close()
+
+    def stats(self):
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        hits = self.memory_hits + self.disk_hits
+        stats = {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round(hits / lookups * 100, 2) if lookups else 0,
+            "memory_size": self.memory.stats()["size"],
+            "disk_errors": self.disk_errors,
+        }
+        if self._pool is not None:
+            conn = None
+            try:
+                conn = self._pool.acquire()
+                stats["disk_size"] = conn.execute('SELECT COUNT(*) FROM translation_cache').fetchone()[0]
+            except sqlite3.Error as e:
+                self._disk_error('count', e)
+            finally:
+                if conn is not None:
+                    conn.close()
+        return stats
+
+
+def kb_texts(kb_path):
+    """Every distinct kb.json text, grouped by its language"""
+    with open(kb_path, 'r', encoding='utf-8') as f:
+        knowledge_base = json.load(f)
+    texts = {language: [] for language in KB_TEXT_FIELDS}
+    for item in knowledge_base:
+        for language, fields in KB_TEXT_FIELDS.items():
+            for field in fields:
+                value = item.get(field)
+                values = value if isinstance(value, list) else [value]
+                texts[language].extend(v for v in values if v)
+    return {language: list(dict.fromkeys(values)) for language, values in texts.items()}
+
+
+def warm(kb_path='kb.json', batch_size=16):
+    """Translate every kb.json text field into the other language and store it"""
+    from advanced_nlu import SimpleNLU
+
+    # Warm the same cache keys the server uses (int8 output is cached separately)
+    nlu = SimpleNLU(background=False, translation_batch_size=1,
+                    quantize=os.environ.get('NLU_QUANTIZE', '0') == '1')
+    if not nlu.marian_available:
+        print("MarianMT models are not available; cannot warm the translation cache.")
+        return 1
+
+    for source_lang, texts in kb_texts(kb_path).items():
+        target_lang = "hi" if source_lang == "en" else "en"
+        model_id = nlu.translation_model_id(source_lang, target_lang)
+        missing = [text for text in texts if nlu.translation_cache.get(text, source_lang, target_lang, model_id) is None]
+        for i in range(0, len(missing), batch_size):
+            batch = missing[i:i + batch_size]
+            translated = nlu.translate_batch(batch, source_lang, target_lang)
+            nlu.translation_cache.put_many(zip(batch, translated), source_lang, target_lang, model_id)
+        print(f"{source_lang}->{target_lang}: {len(texts)} texts, {len(missing)} newly translated")
+
+    print(nlu.translation_cache.stats())
+    return 0
+
+
+if __name__ == '__main__':
+    command = sys.argv[1] if len(sys.argv) > 1 else 'warm'
+    if command == 'warm':
+        sys.exit(warm(sys.argv[2] if len(sys.argv) > 2 else 'kb.json'))
+    print("Usage: python translation_cache.py warm [kb.json]")
+    sys.exit(2)
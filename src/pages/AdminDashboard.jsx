@@ -72,13 +72,19 @@ export default function AdminDashboard() {
   const fetchKbEntries = async () => {
     const token = localStorage.getItem('token');
     try {
-      const response = await fetch('http://localhost:8000/admin/kb', {
-        headers: { 'Authorization': `Bearer ${token}` }
-      });
-      if (response.ok) {
+      // Pages are revalidated by the browser cache (ETag), so unchanged ones come back as 304s
+      const entries = [];
+      let cursor = 0;
+      while (cursor !== null) {
+        const response = await fetch(`http://localhost:8000/admin/kb?after=${cursor}`, {
+          headers: { 'Authorization': `Bearer ${token}` }
+        });
+        if (!response.ok) return;
         const data = await response.json();
-        setKbEntries(data.entries);
+        entries.push(...data.entries);
+        cursor = data.next_cursor;
       }
+      setKbEntries(entries);
     } catch (error) {
       console.error('Failed to fetch KB entries:', error);
     } finally {